@@ -6,7 +6,18 @@ __email__ = "nick@koston.org"
 # Details in CONTRIBUTING.md
 __version__ = "2.6.1"
 
+from .cache import CacheInfo, cache_info, set_cache_limit  # noqa: F401
 from .discovery import DiscoverHosts  # noqa: F401
+from .leases import DNSMASQ, ISC_DHCPD, KEA_CSV, Lease, LeaseFile  # noqa: F401
+from .network import ArpProbeProgress, ArpProber  # noqa: F401
+from .oui import OUIDatabase  # noqa: F401
+from .presence import PresenceChange  # noqa: F401
+from .providers import (  # noqa: F401
+    HostnameProvider,
+    MDNSHostnameProvider,
+    NetBIOSHostnameProvider,
+)
+from .snapshot import DiscoveryResult  # noqa: F401
 
 
 def get_module_version() -> str:
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from typing import TYPE_CHECKING, Any
+
+import ifaddr
+
+from .discovery import DiscoverHosts
+from .network import ArpProber, get_interface_ip
+from .oui import OUIDatabase
+from .replay import ScanRecorder, ScanRecording, ScanReplay, run_with_virtual_clock
+from .server import DEFAULT_SCAN_INTERVAL, DEFAULT_SOCKET_PATH, DiscoveryServer
+from .stats import ADDRESSES, HOSTS, PHASE_PTR
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+    from .stats import ScanStats
+
+
+def format_summary(all_stats: Sequence[ScanStats]) -> str:
+    """Summarize the phase timings and throughput of one or more scans."""
+    lines = [f"{len(all_stats)} scan(s)", f"{'phase':<12}{'avg':>10}{'max':>10}"]
+    phases = dict.fromkeys(phase for stats in all_stats for phase in stats.phases)
+    for name in (*phases, "total"):
+        times = [
+            stats.duration if name == "total" else stats.phases.get(name, 0.0)
+            for stats in all_stats
+        ]
+        lines.append(f"{name:<12}{sum(times) / len(times):>9.3f}s{max(times):>9.3f}s")
+    hosts = [stats.counters.get(HOSTS, 0) for stats in all_stats]
+    lines.append(f"hosts: {min(hosts)}-{max(hosts)}")
+    ptr_time = sum(stats.phases.get(PHASE_PTR, 0.0) for stats in all_stats)
+    addresses = sum(stats.counters.get(ADDRESSES, 0) for stats in all_stats)
+    if ptr_time and addresses:
+        lines.append(f"ptr sweep: {addresses / ptr_time:.0f} addresses/s")
+    max_lag = max(stats.max_loop_lag for stats in all_stats)
+    lines.append(f"max loop lag: {max_lag * 1000:.1f}ms")
+    return "\n".join(lines)
+
+
+async def _async_scan(args: argparse.Namespace) -> None:
+    """Run scans and stream the hosts as JSON lines."""
+    arp_prober = ArpProber(rate=args.arp_rate) if args.arp_rate else None
+    oui_database = OUIDatabase(args.oui_database) if args.oui_database else None
+    options: dict[str, Any] = {
+        "arp_prober": arp_prober,
+        "oui_database": oui_database,
+        "query_bucket_size": args.concurrency,
+        "dns_timeout": args.dns_timeout,
+    }
+    recorder: ScanRecorder | None = None
+    if args.replay:
+        discover_hosts = ScanReplay(
+            ScanRecording.load(args.replay)
+        ).create_discover_hosts(**options)
+    else:
+        local_ip = None
+        if args.interface and not (
+            local_ip := get_interface_ip(args.interface, list(ifaddr.get_adapters()))
+        ):
+            raise SystemExit(f"No IPv4 address on interface {args.interface}")
+        if args.record:
+            recorder = ScanRecorder()
+            discover_hosts = await recorder.async_create_discover_hosts(
+                local_ip=local_ip,
+                network=args.network,
+                nameservers=args.nameserver,
+                **options,
+            )
+        else:
+            discover_hosts = DiscoverHosts(
+                local_ip=local_ip,
+                network=args.network,
+                nameservers=args.nameserver,
+                **options,
+            )
+    all_stats: list[ScanStats] = []
+    for scan in range(args.repeat):
+        if scan:
+            await asyncio.sleep(args.interval)
+        result = await discover_hosts.async_discover(args.timeout)
+        for host in result:
+            print(json.dumps({"scan": scan, **host}), flush=True)
+        if result.partial:
+            print(f"Scan {scan} timed out, results are partial", file=sys.stderr)
+        if stats := discover_hosts.last_stats:
+            all_stats.append(stats)
+    if all_stats:
+        print(format_summary(all_stats), file=sys.stderr)
+    if recorder:
+        recorder.recording.save(args.record)
+
+
+def _add_scan_parser(
+    subparsers: argparse._SubParsersAction[argparse.ArgumentParser],
+) -> None:
+    parser = subparsers.add_parser(
+        "scan", help="scan and print hosts as JSON lines with a timing summary"
+    )
+    parser.add_argument("--network", help="network to sweep, e.g. 192.168.1.0/24")
+    parser.add_argument("--interface", help="interface to scan from")
+    parser.add_argument(
+        "--nameserver",
+        action="append",
+        help="nameserver for PTR lookups, may be repeated",
+    )
+    parser.add_argument("--concurrency", type=int, help="PTR queries in flight at once")
+    parser.add_argument(
+        "--dns-timeout", type=float, help="maximum seconds to wait for a PTR answer"
+    )
+    parser.add_argument("--arp-rate", type=float, help="ARP probes per second")
+    parser.add_argument("--timeout", type=float, help="seconds allowed per scan")
+    parser.add_argument("--repeat", type=int, default=1, help="number of scans to run")
+    parser.add_argument(
+        "--interval", type=float, default=0, help="seconds between repeated scans"
+    )
+    parser.add_argument("--oui-database", help="OUI index to add vendors from")
+    replay_group = parser.add_mutually_exclusive_group()
+    replay_group.add_argument(
+        "--record", help="save the PTR answers and neighbour tables to this file"
+    )
+    replay_group.add_argument(
+        "--replay",
+        help="scan a file saved with --record instead of the network, "
+        "on a virtual clock",
+    )
+    parser.set_defaults(func=_async_scan)
+
+
+async def _async_serve(args: argparse.Namespace) -> None:
+    """Run the discovery server until cancelled."""
+    discover_hosts = DiscoverHosts(
+        stale_while_revalidate=args.snapshot is not None,
+        snapshot_path=args.snapshot,
+        min_scan_interval=args.min_scan_interval,
+    )
+    server = DiscoveryServer(discover_hosts, args.socket, args.interval or None)
+    await server.async_start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.async_stop()
+
+
+def _add_serve_parser(
+    subparsers: argparse._SubParsersAction[argparse.ArgumentParser],
+) -> None:
+    parser = subparsers.add_parser(
+        "serve", help="share one scanner with local processes over a Unix socket"
+    )
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, help="socket path")
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=DEFAULT_SCAN_INTERVAL,
+        help="seconds between background scans, 0 to only scan on request",
+    )
+    parser.add_argument(
+        "--min-scan-interval",
+        type=float,
+        default=0,
+        help="serve results younger than this many seconds without a scan",
+    )
+    parser.add_argument(
+        "--snapshot", help="file that keeps the last result across restarts"
+    )
+    parser.set_defaults(func=_async_serve)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Run the aiodiscover command line."""
+    parser = argparse.ArgumentParser(
+        prog="python -m aiodiscover", description="Discover hosts on the network."
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="debug logging")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    _add_scan_parser(subparsers)
+    _add_serve_parser(subparsers)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    try:
+        if getattr(args, "replay", None):
+            run_with_virtual_clock(args.func(args))
+        else:
+            asyncio.run(args.func(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from collections.abc import MutableSet
+from typing import TYPE_CHECKING, Any, Generic, NamedTuple, TypeVar
+
+from cached_ipaddress import cached_ip_addresses
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+_KT = TypeVar("_KT")
+_VT = TypeVar("_VT")
+
+# The ip address cache belongs to cached_ipaddress and is shared with every
+# other user of it in the process, so it is reported but cannot be resized
+IP_ADDRESS_CACHE = "ip_addresses"
+
+_MISSING = object()
+
+
+class CacheInfo(NamedTuple):
+    """Size and counters of a cache."""
+
+    hits: int
+    misses: int
+    evictions: int | None
+    size: int
+    maxsize: int
+
+
+class BoundedCache(Generic[_KT, _VT]):
+    """
+    A mapping that evicts the least recently used entry when full.
+
+    Only get() counts hits and misses, so membership tests and iteration
+    do not skew the hit rate. Access is locked since the neighbour memos
+    are used by parsers running in the executor.
+    """
+
+    def __init__(self, name: str, maxsize: int) -> None:
+        """Init the cache."""
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.name = name
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict[_KT, _VT] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: _KT, default: Any = None) -> Any:
+        """Return the value for key, or default if it is not cached."""
+        with self._lock:
+            value = self._data.get(key, _MISSING)  # type: ignore[arg-type]
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: _KT, value: _VT) -> None:
+        """Cache value for key, evicting the oldest entries if needed."""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._evict()
+
+    def discard(self, key: _KT) -> None:
+        """Remove key if it is cached."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove every entry, keeping the counters."""
+        with self._lock:
+            self._data.clear()
+
+    def resize(self, maxsize: int) -> None:
+        """Change the size limit, evicting entries that no longer fit."""
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def info(self) -> CacheInfo:
+        """Return the size and counters."""
+        with self._lock:
+            return CacheInfo(
+                self.hits, self.misses, self.evictions, len(self._data), self.maxsize
+            )
+
+    def _evict(self) -> None:
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._data
+
+    def __iter__(self) -> Iterator[_KT]:
+        # Iterate over a copy so other threads can keep using the cache
+        with self._lock:
+            return iter(list(self._data))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class BoundedSet(MutableSet[_KT]):
+    """A set backed by a BoundedCache; membership tests count as lookups."""
+
+    def __init__(self, name: str, maxsize: int) -> None:
+        """Init the set."""
+        self._cache: BoundedCache[_KT, bool] = BoundedCache(name, maxsize)
+
+    @property
+    def name(self) -> str:
+        """The name the set is reported under."""
+        return self._cache.name
+
+    def add(self, value: _KT) -> None:
+        """Add value, evicting the oldest member if the set is full."""
+        self._cache.set(value, True)
+
+    def discard(self, value: _KT) -> None:
+        """Remove value if it is a member."""
+        self._cache.discard(value)
+
+    def update(self, values: Iterable[_KT]) -> None:
+        """Add every value."""
+        for value in values:
+            self.add(value)
+
+    def clear(self) -> None:
+        """Remove every member, keeping the counters."""
+        self._cache.clear()
+
+    def resize(self, maxsize: int) -> None:
+        """Change the size limit."""
+        self._cache.resize(maxsize)
+
+    def info(self) -> CacheInfo:
+        """Return the size and counters."""
+        return self._cache.info()
+
+    def __contains__(self, value: object) -> bool:
+        return bool(self._cache.get(value, False))  # type: ignore[arg-type]
+
+    def __iter__(self) -> Iterator[_KT]:
+        return iter(self._cache)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({set(self._cache)!r})"
+
+
+_CACHES: dict[str, BoundedCache[Any, Any]] = {}
+
+
+def register_cache(cache: BoundedCache[_KT, _VT]) -> BoundedCache[_KT, _VT]:
+    """Make a module level cache visible to cache_info and set_cache_limit."""
+    _CACHES[cache.name] = cache
+    return cache
+
+
+def cache_info() -> dict[str, CacheInfo]:
+    """Return the size and counters of the module level caches by name."""
+    info = {name: cache.info() for name, cache in _CACHES.items()}
+    ip_info = cached_ip_addresses.cache_info()
+    info[IP_ADDRESS_CACHE] = CacheInfo(
+        ip_info.hits, ip_info.misses, None, ip_info.currsize, ip_info.maxsize or 0
+    )
+    return info
+
+
+def set_cache_limit(name: str, maxsize: int) -> None:
+    """Change the size limit of a module level cache."""
+    if name not in _CACHES:
+        raise ValueError(f"Unknown or fixed size cache {name}")
+    _CACHES[name].resize(maxsize)
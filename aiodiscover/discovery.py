@@ -2,43 +2,102 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from contextlib import suppress
-from functools import lru_cache, partial
+import math
+import time
+from collections import deque
+from functools import partial
 from itertools import islice
 from typing import TYPE_CHECKING, Any, cast
 
 from aiodns import DNSResolver
-
-from .network import SystemNetworkData
+from aiodns.error import ARES_ETIMEOUT, DNSError
+from cached_ipaddress import cached_ip_addresses
+
+from .cache import BoundedCache, BoundedSet, CacheInfo, cache_info, register_cache
+from .network import SystemNetworkData, create_ip_route
+from .plan import ScanPlan
+from .presence import (
+    PRESENCE_CONSIDER_AWAY,
+    PRESENCE_POLL_INTERVAL,
+    PresenceTracker,
+)
+from .snapshot import DiscoveryResult, load_snapshot, save_snapshot
+from .stats import (
+    ADDRESSES,
+    HOSTNAMES,
+    HOSTS,
+    NEIGHBOURS,
+    PHASE_LEASES,
+    PHASE_NEIGHBOURS,
+    PHASE_PROVIDERS,
+    PHASE_PTR,
+    PHASE_SETUP,
+    LoopLagMonitor,
+    ScanStats,
+)
+from .util import LOOP_BLOCK_BUDGET, LoopBudget, asyncio_timeout
 
 if TYPE_CHECKING:
-    from collections.abc import Iterable
-    from ipaddress import IPv4Address, IPv6Address
+    from collections.abc import Callable, Iterable
+    from ipaddress import IPv4Address, IPv4Network, IPv6Address
 
-    from pyroute2.iproute import IPRoute
+    from .leases import Lease, LeaseFile
+    from .network import ArpProber
+    from .oui import OUIDatabase
+    from .presence import PresenceChange
+    from .providers import HostnameProvider
 
 HOSTNAME = "hostname"
 MAC_ADDRESS = "macaddress"
 IP_ADDRESS = "ip"
+VENDOR = "vendor"
 MAX_ADDRESSES = 2048
 QUERY_BUCKET_SIZE = 64
 
 DNS_RESPONSE_TIMEOUT = 2
+DNS_MIN_RESPONSE_TIMEOUT = 0.1
+
+# Per query timeouts are derived from the response times seen so far
+# in the sweep, DNS_RESPONSE_TIMEOUT is only the ceiling
+RTT_PERCENTILE = 0.95
+RTT_TIMEOUT_MULTIPLIER = 3
+RTT_MIN_SAMPLES = 8
+RTT_MAX_SAMPLES = 256
+# Queries that timed out are retried once with a longer timeout
+DNS_RETRY_TIMEOUT_MULTIPLIER = 2
+# but not when more than this fraction of them timed out, since the
+# nameserver is then down and a retry would only double the wait
+DNS_RETRY_MAX_TIMEOUT_FRACTION = 0.5
+
+# Time kept back from a scan deadline for reading the neighbour table,
+# capped to this fraction of the whole timeout for short timeouts
+NEIGHBOUR_READ_RESERVE = 0.5
+NEIGHBOUR_READ_RESERVE_FRACTION = 0.25
 
 # 24 hours
 CACHE_CLEAR_INTERVAL = 60 * 60 * 24
+# Failed nameservers remembered between clears
+MAX_FAILED_NAMESERVERS = 32
 
 
 _LOGGER = logging.getLogger(__name__)
 
 
-@lru_cache(maxsize=MAX_ADDRESSES)
+_IDNA_CACHE: BoundedCache[str, str] = register_cache(
+    BoundedCache("idna", MAX_ADDRESSES)
+)
+
+
 def decode_idna(name: str) -> str:
     """Decode an idna name."""
+    if (decoded := _IDNA_CACHE.get(name)) is not None:
+        return decoded
     try:
-        return name.encode().decode("idna")
+        decoded = name.encode().decode("idna")
     except UnicodeError:
-        return name
+        decoded = name
+    _IDNA_CACHE.set(name, decoded)
+    return decoded
 
 
 def dns_message_short_hostname(dns_message: Any | None) -> str | None:
@@ -51,22 +110,170 @@ def dns_message_short_hostname(dns_message: Any | None) -> str | None:
     return name.partition(".")[0]
 
 
+def _future_result(future: asyncio.Future[Any]) -> Any | None:
+    """Return the result of a future or None if it failed or is not done."""
+    if not future.done() or future.cancelled() or future.exception():
+        return None
+    return future.result()
+
+
+class RTTEstimator:
+    """
+    Derive a query timeout from the response times of a nameserver.
+
+    The timeout is a multiple of a high percentile of the recent round
+    trip times, clamped between a floor and a ceiling. Until enough
+    responses have been seen the ceiling is used.
+    """
+
+    def __init__(
+        self,
+        floor: float = DNS_MIN_RESPONSE_TIMEOUT,
+        ceiling: float = DNS_RESPONSE_TIMEOUT,
+    ) -> None:
+        """Init the estimator."""
+        self.floor = floor
+        self.ceiling = ceiling
+        self._samples: deque[float] = deque(maxlen=RTT_MAX_SAMPLES)
+
+    def __len__(self) -> int:
+        """Return the number of samples."""
+        return len(self._samples)
+
+    def add(self, rtt: float) -> None:
+        """Record the round trip time of a response."""
+        self._samples.append(rtt)
+
+    def percentile(self, percentile: float) -> float | None:
+        """Return the round trip time at percentile or None without samples."""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[max(math.ceil(percentile * len(ordered)) - 1, 0)]
+
+    def timeout(self) -> float:
+        """Return the timeout to use for the next queries."""
+        if len(self._samples) < RTT_MIN_SAMPLES:
+            return self.ceiling
+        rtt = cast("float", self.percentile(RTT_PERCENTILE))
+        return min(self.ceiling, max(self.floor, rtt * RTT_TIMEOUT_MULTIPLIER))
+
+
+def _is_timeout(future: asyncio.Future[Any]) -> bool:
+    """Return if a query future has no answer from the nameserver."""
+    if not future.done() or future.cancelled():
+        return True
+    exc = future.exception()
+    return isinstance(exc, DNSError) and bool(exc.args) and exc.args[0] == ARES_ETIMEOUT
+
+
+async def _async_wait_queries(
+    resolver: DNSResolver,
+    ips: list[IPv4Address],
+    timeout: float,
+    deadline: float | None,
+    estimator: RTTEstimator,
+) -> list[asyncio.Future[Any]]:
+    """Send PTR queries for ips and wait up to timeout for the answers."""
+    loop = asyncio.get_running_loop()
+    if deadline is not None:
+        timeout = min(timeout, deadline - loop.time())
+    start = loop.time()
+
+    def _record_rtt(future: asyncio.Future[Any]) -> None:
+        if not _is_timeout(future):
+            estimator.add(loop.time() - start)
+
+    futures: list[asyncio.Future[Any]] = []
+    for ip in ips:
+        future = resolver.query(ip.reverse_pointer, "PTR")
+        future.add_done_callback(_record_rtt)
+        futures.append(future)
+    await asyncio.wait(futures, timeout=max(timeout, 0))
+    return futures
+
+
 async def async_query_for_ptrs(
     nameserver: str,
     ips_to_lookup: list[IPv4Address],
+    deadline: float | None = None,
+    resolver_factory: Callable[..., Any] | None = None,
+    query_bucket_size: int | None = None,
+    dns_timeout: float | None = None,
 ) -> list[Any | None]:
-    """Fetch PTR records for a list of ips."""
-    resolver = DNSResolver(nameservers=[nameserver], timeout=DNS_RESPONSE_TIMEOUT)
+    """
+    Fetch PTR records for a list of ips.
+
+    Each chunk of queries waits for a timeout derived from the response
+    times seen earlier in the sweep. Queries that did not get an answer
+    in time are retried once at the end with a longer timeout, unless
+    most queries timed out so an unreachable nameserver fails fast.
+
+    If the loop time reaches deadline, the outstanding queries are
+    cancelled and None is returned for every ip without an answer.
+
+    resolver_factory is called like DNSResolver to create the resolver.
+    query_bucket_size and dns_timeout default to QUERY_BUCKET_SIZE and
+    DNS_RESPONSE_TIMEOUT.
+    """
+    loop = asyncio.get_running_loop()
+    if query_bucket_size is None:
+        query_bucket_size = QUERY_BUCKET_SIZE
+    if dns_timeout is None:
+        dns_timeout = DNS_RESPONSE_TIMEOUT
+    resolver = (resolver_factory or DNSResolver)(
+        nameservers=[nameserver], timeout=dns_timeout
+    )
+    estimator = RTTEstimator(ceiling=dns_timeout)
     results: list[Any | None] = []
-    for ip_chunk in chunked(ips_to_lookup, QUERY_BUCKET_SIZE):
+    timed_out: list[int] = []
+    for ip_chunk in chunked(ips_to_lookup, query_bucket_size):
         if TYPE_CHECKING:
             ip_chunk = cast("list[IPv4Address]", ip_chunk)
-        futures = [resolver.query(ip.reverse_pointer, "PTR") for ip in ip_chunk]
-        await asyncio.wait(futures)
-        results.extend(
-            None if future.exception() else future.result() for future in futures
+        if deadline is not None and deadline <= loop.time():
+            break
+        futures = await _async_wait_queries(
+            resolver, ip_chunk, estimator.timeout(), deadline, estimator
+        )
+        for future in futures:
+            if _is_timeout(future):
+                future.cancel()
+                timed_out.append(len(results))
+            results.append(_future_result(future))
+    if timed_out and (
+        not estimator or len(timed_out) > len(results) * DNS_RETRY_MAX_TIMEOUT_FRACTION
+    ):
+        _LOGGER.debug(
+            "Not retrying %s of %s PTR queries to %s that timed out",
+            len(timed_out),
+            len(results),
+            nameserver,
+        )
+    elif timed_out:
+        retry_timeout = min(
+            estimator.ceiling, estimator.timeout() * DNS_RETRY_TIMEOUT_MULTIPLIER
+        )
+        _LOGGER.debug(
+            "Retrying %s PTR queries to %s with a %.3fs timeout",
+            len(timed_out),
+            nameserver,
+            retry_timeout,
         )
+        for idx_chunk in chunked(timed_out, query_bucket_size):
+            if deadline is not None and deadline <= loop.time():
+                break
+            futures = await _async_wait_queries(
+                resolver,
+                [ips_to_lookup[idx] for idx in idx_chunk],
+                retry_timeout,
+                deadline,
+                estimator,
+            )
+            for pos, idx in enumerate(idx_chunk):
+                results[idx] = _future_result(futures[pos])
     resolver.cancel()
+    if missing := len(ips_to_lookup) - len(results):
+        results.extend([None] * missing)
     return results
 
 
@@ -88,24 +295,212 @@ def chunked(iterable: Iterable[Any], chunked_num: int) -> Iterable[Any]:
     return iter(partial(take, chunked_num, iter(iterable)), [])
 
 
+def order_by_likelihood(
+    network: IPv4Network,
+    router_ip: IPv4Address | None = None,
+    neighbour_ips: Iterable[str] = (),
+    previous_ips: Iterable[str] = (),
+) -> list[IPv4Address]:
+    """Order the hosts of a network by how likely they are to be in use."""
+    return ScanPlan(network).order(router_ip, neighbour_ips, previous_ips)
+
+
+async def _async_get_provider_hostnames_with_timeout(
+    provider: HostnameProvider,
+    ips: list[str],
+    timeout: float | None,
+) -> dict[str, str]:
+    """Ask a hostname provider for hostnames within timeout."""
+    if timeout is None:
+        return await provider.async_get_hostnames(ips)
+    async with asyncio_timeout(timeout):
+        return await provider.async_get_hostnames(ips)
+
+
 class DiscoverHosts:
     """Discover hosts on the network by ARP and PTR lookup."""
 
-    def __init__(self) -> None:
-        """Init the discovery hosts."""
+    def __init__(
+        self,
+        hostname_providers: Iterable[HostnameProvider] | None = None,
+        lease_files: Iterable[LeaseFile] | None = None,
+        stale_while_revalidate: bool = False,
+        snapshot_path: str | None = None,
+        min_scan_interval: float = 0,
+        arp_prober: ArpProber | None = None,
+        oui_database: OUIDatabase | None = None,
+        local_ip: str | None = None,
+        network: str | None = None,
+        nameservers: Iterable[str] | None = None,
+        loop_budget: float = LOOP_BLOCK_BUDGET,
+        resolver_factory: Callable[..., Any] | None = None,
+        sys_network_data: SystemNetworkData | None = None,
+        query_bucket_size: int | None = None,
+        dns_timeout: float | None = None,
+    ) -> None:
+        """
+        Init the discovery hosts.
+
+        hostname_providers are asked, concurrently, for the hostnames of
+        neighbours the PTR sweep did not resolve. When more than one provider
+        answers for the same ip, the first one in the list wins.
+
+        When lease_files are given, hosts are the devices in the neighbour
+        table that hold an active lease of the local DHCP server, instead of
+        sweeping the network with PTR queries and ARP.
+
+        With stale_while_revalidate, async_discover returns the last complete
+        result right away, flagged as stale, and refreshes it in the
+        background; listeners are called when the refreshed result is ready.
+        If snapshot_path is set, every complete result is also saved there
+        and loaded on first use so the previous result survives a restart.
+
+        A result younger than min_scan_interval seconds is returned as is
+        instead of starting a new scan.
+
+        arp_prober controls how fast and how often neighbours missing from
+        the arp cache are probed.
+
+        With an oui_database, a vendor key is added to every host whose
+        MAC address prefix is in the database.
+
+        local_ip, network and nameservers replace the address of the
+        interface to scan from, the network to sweep and the nameservers
+        from resolv.conf that are otherwise detected.
+
+        Processing large results yields to the event loop every
+        loop_budget seconds so a scan does not stall other tasks.
+
+        resolver_factory replaces DNSResolver for PTR queries and
+        sys_network_data, which must already be set up, replaces the
+        detected network data; see aiodiscover.replay.
+
+        query_bucket_size is how many PTR queries are sent at once and
+        dns_timeout how long to wait for an answer at most; they default
+        to QUERY_BUCKET_SIZE and DNS_RESPONSE_TIMEOUT.
+        """
         loop = asyncio.get_running_loop()
         self._loop = loop
-        self._sys_network_data: SystemNetworkData | None = None
-        self._failed_nameservers: set[IPv4Address | IPv6Address] = set()
+        self._hostname_providers = tuple(hostname_providers or ())
+        self._lease_files = tuple(lease_files or ())
+        self._arp_prober = arp_prober
+        self._oui_database = oui_database
+        self._local_ip = local_ip
+        self._network = network
+        self._nameservers = None if nameservers is None else tuple(nameservers)
+        self._loop_budget = loop_budget
+        self._resolver_factory = resolver_factory
+        self._query_bucket_size = query_bucket_size
+        self._dns_timeout = dns_timeout
+        self._sys_network_data: SystemNetworkData | None = sys_network_data
+        self._sys_network_data_future: asyncio.Future[SystemNetworkData] | None = None
+        self._failed_nameservers: BoundedSet[IPv4Address | IPv6Address] = BoundedSet(
+            "failed_nameservers", MAX_FAILED_NAMESERVERS
+        )
         self._last_cache_clear = loop.time()
+        self._stale_while_revalidate = stale_while_revalidate
+        self._snapshot_path = snapshot_path
+        self._snapshot_loaded = False
+        self._last_result: DiscoveryResult | None = None
+        self._min_scan_interval = min_scan_interval
+        self._scan_task: asyncio.Task[DiscoveryResult] | None = None
+        self._listeners: list[Callable[[DiscoveryResult], None]] = []
+        self._presence_tasks: set[asyncio.Task[None]] = set()
+        self._last_stats: ScanStats | None = None
+        self._scan_plan: ScanPlan | None = None
+
+    @property
+    def last_result(self) -> DiscoveryResult | None:
+        """The result of the last complete scan."""
+        return self._last_result
+
+    @property
+    def last_stats(self) -> ScanStats | None:
+        """Timings and counts of the last scan, complete or not."""
+        return self._last_stats
+
+    def cache_info(self) -> dict[str, CacheInfo]:
+        """Return the size and counters of the caches used by this scanner."""
+        return {
+            **cache_info(),
+            self._failed_nameservers.name: self._failed_nameservers.info(),
+        }
+
+    def async_add_listener(
+        self,
+        callback: Callable[[DiscoveryResult], None],
+    ) -> Callable[[], None]:
+        """Call callback after each complete scan; returns a remove function."""
+        self._listeners.append(callback)
+        return partial(self._listeners.remove, callback)
 
-    def _setup_sys_network_data(self) -> SystemNetworkData:
-        ip_route: IPRoute | None = None
-        with suppress(Exception):
-            from pyroute2.iproute import IPRoute
+    def async_track_presence(
+        self,
+        callback: Callable[[PresenceChange], None],
+        interval: float = PRESENCE_POLL_INTERVAL,
+        consider_away: float = PRESENCE_CONSIDER_AWAY,
+    ) -> Callable[[], None]:
+        """
+        Track the presence of discovered hosts; returns a stop function.
+
+        Every interval seconds the kernel neighbour table is read and only
+        the hosts from the last complete result whose entries are not
+        REACHABLE are probed, without a PTR sweep. callback is called with
+        a PresenceChange when a host has not been confirmed for
+        consider_away seconds and again when it comes back. Hosts found by
+        later scans are tracked as well; a scan is run first if there is
+        no result yet, and retried every interval until it succeeds.
+        """
+        task = self._loop.create_task(
+            self._async_track_presence(callback, interval, consider_away)
+        )
+        self._presence_tasks.add(task)
+        task.add_done_callback(self._presence_tasks.discard)
 
-            ip_route = IPRoute()
-        sys_network_data = SystemNetworkData(ip_route)
+        def _stop() -> None:
+            task.cancel()
+
+        return _stop
+
+    async def _async_track_presence(
+        self,
+        callback: Callable[[PresenceChange], None],
+        interval: float,
+        consider_away: float,
+    ) -> None:
+        """Poll the presence of the hosts until cancelled."""
+        while True:
+            try:
+                if self._last_result is None:
+                    await self.async_discover()
+                sys_network_data = await self._async_get_sys_network_data()
+            except Exception:
+                _LOGGER.exception("Error discovering hosts to track presence of")
+            else:
+                break
+            await asyncio.sleep(interval)
+        tracker = PresenceTracker(sys_network_data, callback, consider_away)
+        tracked_result: DiscoveryResult | None = None
+        while True:
+            if (last_result := self._last_result) is not tracked_result:
+                tracked_result = last_result
+                tracker.update_hosts(
+                    {host[MAC_ADDRESS]: host[IP_ADDRESS] for host in last_result or ()}
+                )
+            try:
+                await tracker.async_poll()
+            except Exception:
+                _LOGGER.exception("Error polling presence")
+            await asyncio.sleep(interval)
+
+    def _setup_sys_network_data(self) -> SystemNetworkData:
+        sys_network_data = SystemNetworkData(
+            create_ip_route(),
+            self._local_ip,
+            self._arp_prober,
+            self._network,
+            self._nameservers,
+        )
         sys_network_data.setup()
         return sys_network_data
 
@@ -123,14 +518,237 @@ class DiscoverHosts:
             self._failed_nameservers.clear()
             self._last_cache_clear = now
 
-    async def async_discover(self) -> list[dict[str, str]]:
-        """Discover hosts on the network by ARP and PTR lookup."""
-        if not self._sys_network_data:
-            self._sys_network_data = await self._loop.run_in_executor(
-                None,
-                self._setup_sys_network_data,
+    async def async_discover(self, timeout: float | None = None) -> DiscoveryResult:
+        """
+        Discover hosts on the network by ARP and PTR lookup.
+
+        Concurrent callers share a single scan, and each gets its own
+        copy of the result.
+
+        With a timeout, the scan budgets the time across its phases and
+        returns the hosts that were fully resolved when it ran out, with
+        partial set on the result. When another scan is already running,
+        it is waited on for at most timeout seconds, after which the last
+        complete result (flagged stale and partial) or an empty partial
+        result is returned. Callers without a timeout that join a scan
+        which runs out of time wait for a complete scan instead.
+        """
+        if self._stale_while_revalidate and not self._snapshot_loaded:
+            self._snapshot_loaded = True
+            if self._snapshot_path and self._last_result is None:
+                self._last_result = await self._loop.run_in_executor(
+                    None, load_snapshot, self._snapshot_path
+                )
+        if (last_result := self._last_result) is not None:
+            if last_result.age < self._min_scan_interval:
+                return last_result.copy()
+            if self._stale_while_revalidate:
+                self._async_start_scan()
+                return last_result.as_stale()
+        if timeout is None:
+            # The scan is shielded so a cancelled caller does not
+            # cancel it for the other callers waiting on it
+            result = await asyncio.shield(self._async_start_scan())
+            while result.partial:
+                # Joined a scan started with a deadline that it reached
+                result = await asyncio.shield(self._async_start_scan())
+            return result.copy()
+        if not self._scan_task:
+            deadline = self._loop.time() + timeout
+            # The scan honors the deadline itself
+            return (await asyncio.shield(self._async_start_scan(deadline))).copy()
+        try:
+            async with asyncio_timeout(timeout):
+                return (await asyncio.shield(self._scan_task)).copy()
+        except asyncio.TimeoutError:
+            pass
+        if last_result is None:
+            return DiscoveryResult(partial=True)
+        result = last_result.as_stale()
+        result.partial = True
+        return result
+
+    async def async_resolve(
+        self, ips: Iterable[str], timeout: float | None = None
+    ) -> list[dict[str, str]]:
+        """
+        Look up the hostname and MAC address of a few ips without a sweep.
+
+        The PTR queries go to the same nameservers as a full scan, sharing
+        its record of failed nameservers, while only the given ips are
+        probed in the neighbour table; ips outside the local network are
+        skipped since they can never be neighbours. Hosts are returned in the same
+        format as async_discover for the ips that resolved to both; the
+        last result is left untouched. With lease files, the ips are
+        looked up in the active leases instead.
+        """
+        deadline = None if timeout is None else self._loop.time() + timeout
+        ip_addrs = [
+            ip_addr
+            for ip in dict.fromkeys(ips)
+            if (ip_addr := cached_ip_addresses(ip)) is not None
+        ]
+        if not ip_addrs:
+            return []
+        wanted = [str(ip_addr) for ip_addr in ip_addrs]
+        sys_network_data = await self._async_get_sys_network_data()
+        if self._lease_files:
+            hosts = [
+                host
+                for host in await self._async_discover_from_leases(
+                    sys_network_data, deadline
+                )
+                if host[IP_ADDRESS] in wanted
+            ]
+        else:
+            hosts = await self._async_resolve(
+                sys_network_data,
+                cast("list[IPv4Address]", ip_addrs),
+                deadline,
+            )
+        if self._oui_database:
+            self._add_vendors(self._oui_database, hosts)
+        return hosts
+
+    async def _async_resolve(
+        self,
+        sys_network_data: SystemNetworkData,
+        ip_addrs: list[IPv4Address],
+        deadline: float | None,
+    ) -> list[dict[str, str]]:
+        """Resolve the PTR records and neighbour entries of ip_addrs."""
+        # Off-link ips are never in the neighbour table
+        network = sys_network_data.network
+        ip_addrs = [ip_addr for ip_addr in ip_addrs if ip_addr in network]
+        if not ip_addrs:
+            return []
+        wanted = [str(ip_addr) for ip_addr in ip_addrs]
+
+        async def _async_get_hostnames() -> dict[str, str]:
+            nameservers = await self._async_get_nameservers(sys_network_data, deadline)
+            return await self._async_query_nameservers(nameservers, ip_addrs, deadline)
+
+        hostnames, neighbours = await asyncio.gather(
+            _async_get_hostnames(),
+            sys_network_data.async_get_neighbours(wanted, deadline),
+        )
+        if self._hostname_providers and (
+            unresolved := [
+                ip for ip in wanted if ip in neighbours and ip not in hostnames
+            ]
+        ):
+            hostnames.update(
+                await self._async_get_provider_hostnames(unresolved, deadline)
             )
-        sys_network_data = self._sys_network_data
+        return [
+            {
+                HOSTNAME: hostnames[ip],
+                MAC_ADDRESS: neighbours[ip],
+                IP_ADDRESS: ip,
+            }
+            for ip in wanted
+            if ip in hostnames and ip in neighbours
+        ]
+
+    def _async_start_scan(
+        self, deadline: float | None = None
+    ) -> asyncio.Task[DiscoveryResult]:
+        """Start a scan unless one is already in flight."""
+        if not (scan_task := self._scan_task):
+            scan_task = self._loop.create_task(self._async_refresh(deadline))
+            scan_task.add_done_callback(self._async_scan_done)
+            self._scan_task = scan_task
+        return scan_task
+
+    def _async_scan_done(self, task: asyncio.Task[DiscoveryResult]) -> None:
+        """Clear the in-flight scan once it is done."""
+        self._scan_task = None
+        if not task.cancelled() and (exc := task.exception()):
+            _LOGGER.debug("Discovery failed: %s", exc)
+
+    async def _async_get_sys_network_data(self) -> SystemNetworkData:
+        """Get the system network data, sharing a single setup job."""
+        if self._sys_network_data:
+            return self._sys_network_data
+        if not (future := self._sys_network_data_future):
+            future = self._loop.run_in_executor(None, self._setup_sys_network_data)
+            self._sys_network_data_future = future
+        try:
+            sys_network_data = await asyncio.shield(future)
+        except Exception:
+            # Allow the next caller to retry the setup
+            if self._sys_network_data_future is future:
+                self._sys_network_data_future = None
+            raise
+        self._sys_network_data = sys_network_data
+        self._sys_network_data_future = None
+        return sys_network_data
+
+    def _deadline_reached(self, deadline: float | None) -> bool:
+        """Return if the loop time has reached the deadline."""
+        return deadline is not None and self._loop.time() >= deadline
+
+    async def _async_refresh(self, deadline: float | None = None) -> DiscoveryResult:
+        """Run a scan and publish the result if it is complete."""
+        self._last_stats = stats = ScanStats(self._loop.time)
+        monitor = LoopLagMonitor()
+        monitor.start()
+        try:
+            hosts, partial = await self._async_scan(stats, deadline)
+        finally:
+            stats.max_loop_lag = monitor.stop()
+        if self._oui_database:
+            self._add_vendors(self._oui_database, hosts)
+        stats.count(HOSTS, len(hosts))
+        stats.finish()
+        result = DiscoveryResult(hosts, partial=partial)
+        if partial:
+            _LOGGER.debug("Scan deadline reached, returning %s hosts", len(hosts))
+            return result
+        self._last_result = result
+        if self._snapshot_path:
+            try:
+                await self._loop.run_in_executor(
+                    None, save_snapshot, self._snapshot_path, result
+                )
+            except OSError as ex:
+                _LOGGER.warning(
+                    "Failed to save snapshot to %s: %s", self._snapshot_path, ex
+                )
+        for callback in list(self._listeners):
+            try:
+                callback(result)
+            except Exception:
+                _LOGGER.exception("Error calling discovery listener %s", callback)
+        return result
+
+    def _add_vendors(
+        self, oui_database: OUIDatabase, hosts: list[dict[str, str]]
+    ) -> None:
+        """Add the vendor of the MAC address to each host."""
+        for host in hosts:
+            if vendor := oui_database.lookup(host[MAC_ADDRESS]):
+                host[VENDOR] = vendor
+
+    async def _async_scan(
+        self, stats: ScanStats, deadline: float | None = None
+    ) -> tuple[list[dict[str, str]], bool]:
+        """Scan the network and return the hosts and if the scan is partial."""
+        with stats.phase(PHASE_SETUP):
+            if deadline is None:
+                sys_network_data = await self._async_get_sys_network_data()
+            else:
+                try:
+                    async with asyncio_timeout(max(deadline - self._loop.time(), 0)):
+                        sys_network_data = await self._async_get_sys_network_data()
+                except asyncio.TimeoutError:
+                    return [], True
+        if self._lease_files:
+            with stats.phase(PHASE_LEASES):
+                hosts = await self._async_discover_from_leases(
+                    sys_network_data, deadline
+                )
+            return hosts, self._deadline_reached(deadline)
         network = sys_network_data.network
         if network.num_addresses > MAX_ADDRESSES:
             _LOGGER.debug(
@@ -138,23 +756,117 @@ class DiscoverHosts:
                 network,
                 MAX_ADDRESSES,
             )
-            return []
+            return [], False
         self._cleanup_cache()
-        hostnames = await self.async_get_hostnames(sys_network_data)
-        neighbours = await sys_network_data.async_get_neighbours(hostnames.keys())
+        ptr_deadline: float | None = None
+        neighbour_deadline: float | None = None
+        if deadline is not None:
+            reserve = min(
+                NEIGHBOUR_READ_RESERVE,
+                (deadline - self._loop.time()) * NEIGHBOUR_READ_RESERVE_FRACTION,
+            )
+            ptr_deadline = neighbour_deadline = deadline - reserve
+        with stats.phase(PHASE_PTR):
+            hostnames = await self.async_get_hostnames(sys_network_data, ptr_deadline)
+        stats.count(ADDRESSES, network.num_addresses)
+        stats.count(HOSTNAMES, len(hostnames))
+        partial = self._deadline_reached(ptr_deadline)
+        with stats.phase(PHASE_NEIGHBOURS):
+            neighbours = await sys_network_data.async_get_neighbours(
+                hostnames.keys(), neighbour_deadline
+            )
+        stats.count(NEIGHBOURS, len(neighbours))
+        partial = partial or self._deadline_reached(neighbour_deadline)
+        if self._hostname_providers and (
+            unresolved := [
+                ip
+                for ip in neighbours
+                if ip not in hostnames and cached_ip_addresses(ip) in network
+            ]
+        ):
+            with stats.phase(PHASE_PROVIDERS):
+                hostnames.update(
+                    await self._async_get_provider_hostnames(unresolved, deadline)
+                )
+            partial = partial or self._deadline_reached(deadline)
+        found: list[dict[str, str]] = []
+        budget = LoopBudget(self._loop_budget)
+        for ip, hostname in hostnames.items():
+            if ip in neighbours:
+                found.append(
+                    {
+                        HOSTNAME: hostname,
+                        MAC_ADDRESS: neighbours[ip],
+                        IP_ADDRESS: ip,
+                    }
+                )
+            if budget.expired():
+                await budget.async_yield()
+        return found, partial
+
+    def _read_leases(self) -> dict[str, Lease]:
+        """Read the active leases from all lease files."""
+        now = time.time()
+        leases: dict[str, Lease] = {}
+        for lease_file in self._lease_files:
+            leases.update(lease_file.active_leases(now))
+        return leases
+
+    async def _async_discover_from_leases(
+        self,
+        sys_network_data: SystemNetworkData,
+        deadline: float | None = None,
+    ) -> list[dict[str, str]]:
+        """
+        Discover hosts from the DHCP server leases and the neighbour table.
+
+        Only leases whose ip is in the neighbour table are reported, so a
+        device that left keeps no host for the rest of its lease.
+        """
+        leases = await self._loop.run_in_executor(None, self._read_leases)
+        # No ips are passed so the neighbour table is only read, never populated
+        neighbours = await sys_network_data.async_get_neighbours((), deadline)
+        network = sys_network_data.network
         return [
             {
-                HOSTNAME: hostname,
+                HOSTNAME: lease.hostname,
+                # The neighbour table is more current than the lease
                 MAC_ADDRESS: neighbours[ip],
                 IP_ADDRESS: ip,
             }
-            for ip, hostname in hostnames.items()
-            if ip in neighbours
+            for ip, lease in leases.items()
+            if lease.hostname
+            and ip in neighbours
+            and cached_ip_addresses(ip) in network
         ]
 
+    async def _async_get_provider_hostnames(
+        self, ips: list[str], deadline: float | None = None
+    ) -> dict[str, str]:
+        """Ask the hostname providers about ips that have no PTR record."""
+        _LOGGER.debug("Querying hostname providers for %s", ips)
+        timeout = None if deadline is None else max(deadline - self._loop.time(), 0)
+        results = await asyncio.gather(
+            *(
+                _async_get_provider_hostnames_with_timeout(provider, ips, timeout)
+                for provider in self._hostname_providers
+            ),
+            return_exceptions=True,
+        )
+        hostnames: dict[str, str] = {}
+        for idx, provider in enumerate(self._hostname_providers):
+            result = results[idx]
+            if isinstance(result, BaseException):
+                _LOGGER.debug("Hostname provider %s failed: %s", provider.name, result)
+                continue
+            for ip, hostname in result.items():
+                hostnames.setdefault(ip, hostname)
+        return hostnames
+
     async def _async_get_nameservers(
         self,
         net_data: SystemNetworkData,
+        deadline: float | None = None,
     ) -> list[IPv4Address | IPv6Address]:
         """Get nameservers to query."""
         if (
@@ -165,7 +877,8 @@ class DiscoverHosts:
             # If there are no in-network nameservers
             and not any(ip in net_data.network for ip in net_data.nameservers)
             # And the router responds to ARP
-            and str(router_ip) in await net_data.async_get_neighbours([str(router_ip)])
+            and str(router_ip)
+            in await net_data.async_get_neighbours([str(router_ip)], deadline)
         ):
             return [*net_data.nameservers, router_ip]
         return net_data.nameservers
@@ -173,26 +886,66 @@ class DiscoverHosts:
     async def async_get_hostnames(
         self,
         sys_network_data: SystemNetworkData,
+        deadline: float | None = None,
     ) -> dict[str, str]:
-        """Lookup PTR records for all addresses in the network."""
-        all_nameservers = await self._async_get_nameservers(sys_network_data)
+        """
+        Lookup PTR records for all addresses in the network.
+
+        The addresses most likely to be in use are looked up first, see
+        ScanPlan.order. Lookups stop when the loop time reaches deadline
+        and the hostnames resolved so far are returned.
+        """
+        all_nameservers = await self._async_get_nameservers(sys_network_data, deadline)
         _LOGGER.debug("Using nameservers %s", all_nameservers)
         _LOGGER.debug("Using network %s", sys_network_data.network)
         _LOGGER.debug("Previous failed nameservers %s", self._failed_nameservers)
-        ips = list(sys_network_data.network.hosts())
+        # Only read the neighbour table, probing happens after the sweep
+        neighbours = await sys_network_data.async_get_neighbours((), deadline)
+        ips = self._get_scan_plan(sys_network_data.network).order(
+            sys_network_data.router_ip,
+            neighbours,
+            (host[IP_ADDRESS] for host in self._last_result or ()),
+        )
+        return await self._async_query_nameservers(all_nameservers, ips, deadline)
+
+    def _get_scan_plan(self, network: IPv4Network) -> ScanPlan:
+        """Return the plan for network, reusing it until the network changes."""
+        if (plan := self._scan_plan) is None or plan.network != network:
+            self._scan_plan = plan = ScanPlan(network)
+        return plan
+
+    async def _async_query_nameservers(
+        self,
+        nameservers: list[IPv4Address | IPv6Address],
+        ips: list[IPv4Address],
+        deadline: float | None = None,
+    ) -> dict[str, str]:
+        """Lookup PTR records for ips, falling back through the nameservers."""
         hostnames: dict[str, str] = {}
         failed_nameservers_this_run: set[IPv4Address | IPv6Address] = set()
-        for nameserver in all_nameservers:
+        for nameserver in nameservers:
             if nameserver in self._failed_nameservers:
                 _LOGGER.debug("Skipping previously failed nameserver %s", nameserver)
                 continue
+            if self._deadline_reached(deadline):
+                break
             ips_to_lookup = [ip for ip in ips if str(ip) not in hostnames]
-            results = await async_query_for_ptrs(str(nameserver), ips_to_lookup)
+            results = await async_query_for_ptrs(
+                str(nameserver),
+                ips_to_lookup,
+                deadline,
+                resolver_factory=self._resolver_factory,
+                query_bucket_size=self._query_bucket_size,
+                dns_timeout=self._dns_timeout,
+            )
             if not results:
                 _LOGGER.debug("No results from %s", nameserver)
                 failed_nameservers_this_run.add(nameserver)
                 continue
+            budget = LoopBudget(self._loop_budget)
             for idx, ip in enumerate(ips_to_lookup):
+                if budget.expired():
+                    await budget.async_yield()
                 short_host = dns_message_short_hostname(results[idx])
                 if short_host is None:
                     continue
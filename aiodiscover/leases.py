@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import calendar
+import logging
+import os
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import NamedTuple
+
+from cached_ipaddress import cached_ip_addresses
+
+from .network import _normalize_mac
+
+DNSMASQ = "dnsmasq"
+ISC_DHCPD = "isc-dhcpd"
+KEA_CSV = "kea-csv"
+
+ISC_LEASE_BLOCK = re.compile(rb"^lease\s+(\S+)\s*\{(.*?)^\}", re.MULTILINE | re.DOTALL)
+ISC_BINDING_STATE = re.compile(r"^\s*binding state\s+(\w+);", re.MULTILINE)
+ISC_HARDWARE = re.compile(r"^\s*hardware ethernet\s+([0-9A-Fa-f:]+);", re.MULTILINE)
+ISC_HOSTNAME = re.compile(r'^\s*client-hostname\s+"(.*)";', re.MULTILINE)
+ISC_ENDS = re.compile(
+    r"^\s*ends\s+(?:never|epoch\s+(\d+)|\d\s+(\S+\s+\S+));", re.MULTILINE
+)
+ISC_DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+KEA_STATE_DEFAULT = "0"
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Lease(NamedTuple):
+    """A DHCP lease."""
+
+    ip: str
+    mac: str
+    hostname: str | None
+    # Seconds since the epoch, None if the lease never expires
+    expires: float | None
+
+
+def _make_lease(
+    ip: str, mac: str, hostname: str | None, expires: float | None
+) -> Lease | None:
+    """Validate and normalize the fields of a lease."""
+    if not cached_ip_addresses(ip) or not (normalized_mac := _normalize_mac(mac)):
+        return None
+    if hostname:
+        hostname = hostname.partition(".")[0]
+    return Lease(ip, normalized_mac, hostname or None, expires)
+
+
+class _LeaseParser(ABC):
+    """Parse a lease file format."""
+
+    # Append only formats are journals that can be read from the last
+    # offset, the others are snapshots that are rewritten in place.
+    append_only = True
+
+    def reset(self) -> None:  # noqa: B027
+        """Reset any state kept between reads."""
+
+    @abstractmethod
+    def feed(self, data: bytes, leases: dict[str, Lease]) -> int:
+        """Parse complete records from data and return the bytes consumed."""
+
+
+class _LineLeaseParser(_LeaseParser):
+    """Parse a format with one lease per line."""
+
+    def feed(self, data: bytes, leases: dict[str, Lease]) -> int:
+        consumed = data.rfind(b"\n") + 1
+        for line in data[:consumed].decode(errors="replace").splitlines():
+            try:
+                lease = self.parse_line(line) if line else None
+            except (ValueError, IndexError, KeyError):
+                _LOGGER.debug("Ignoring malformed lease line: %s", line)
+                continue
+            if lease:
+                leases[lease.ip] = lease
+        return consumed
+
+    @abstractmethod
+    def parse_line(self, line: str) -> Lease | None:
+        """Return the lease on a line, or None if it holds no lease."""
+
+
+class _DnsmasqLeaseParser(_LineLeaseParser):
+    """
+    Parse a dnsmasq leases file.
+
+    <expiry> <mac> <ip> <hostname or *> <client id>
+    """
+
+    append_only = False
+
+    def parse_line(self, line: str) -> Lease | None:
+        fields = line.split()
+        if len(fields) < 4 or not fields[0].isdigit():
+            return None
+        expiry = int(fields[0])
+        hostname = None if fields[3] == "*" else fields[3]
+        return _make_lease(fields[2], fields[1], hostname, expiry or None)
+
+
+class _KeaLeaseParser(_LineLeaseParser):
+    """Parse a Kea memfile CSV lease file."""
+
+    def __init__(self) -> None:
+        self._columns: dict[str, int] = {}
+
+    def reset(self) -> None:
+        self._columns = {}
+
+    def parse_line(self, line: str) -> Lease | None:
+        fields = line.split(",")
+        if fields[0] == "address":
+            self._columns = {name: idx for idx, name in enumerate(fields)}
+            return None
+        columns = self._columns
+        if not columns or len(fields) < len(columns):
+            return None
+        ip = fields[columns["address"]]
+        if (
+            fields[columns["state"]] != KEA_STATE_DEFAULT
+            or fields[columns["valid_lifetime"]] == "0"
+        ):
+            # Declined, reclaimed or deleted leases replace the previous entry
+            return _make_lease(ip, fields[columns["hwaddr"]], None, 0)
+        return _make_lease(
+            ip,
+            fields[columns["hwaddr"]],
+            fields[columns["hostname"]].replace("&#x2c", ","),
+            int(fields[columns["expire"]]),
+        )
+
+
+class _ISCLeaseParser(_LeaseParser):
+    """Parse an ISC dhcpd.leases file."""
+
+    def feed(self, data: bytes, leases: dict[str, Lease]) -> int:
+        consumed = 0
+        for match in ISC_LEASE_BLOCK.finditer(data):
+            consumed = match.end()
+            if lease := self.parse_block(
+                match.group(1).decode(errors="replace"),
+                match.group(2).decode(errors="replace"),
+            ):
+                leases[lease.ip] = lease
+        return consumed
+
+    def parse_block(self, ip: str, block: str) -> Lease | None:
+        if not (hardware := ISC_HARDWARE.search(block)):
+            return None
+        expires: float | None = None
+        if (binding_state := ISC_BINDING_STATE.search(block)) and binding_state.group(
+            1
+        ) != "active":
+            expires = 0
+        elif ends := ISC_ENDS.search(block):
+            if ends.group(1):
+                expires = int(ends.group(1))
+            elif ends.group(2):
+                try:
+                    expires = calendar.timegm(
+                        time.strptime(ends.group(2), ISC_DATE_FORMAT)
+                    )
+                except ValueError:
+                    return None
+        hostname = ISC_HOSTNAME.search(block)
+        return _make_lease(
+            ip, hardware.group(1), hostname.group(1) if hostname else None, expires
+        )
+
+
+_PARSERS: dict[str, type[_LeaseParser]] = {
+    DNSMASQ: _DnsmasqLeaseParser,
+    ISC_DHCPD: _ISCLeaseParser,
+    KEA_CSV: _KeaLeaseParser,
+}
+
+
+class LeaseFile:
+    """
+    A DHCP server lease file that is read incrementally.
+
+    Each read is a single stat() when the file has not changed. Journal
+    formats (ISC dhcpd, Kea) are read from the offset where the previous
+    read stopped; the file is parsed from the start again when it is
+    replaced or truncated, which is how the servers compact them.
+
+    Reads are locked since a scan and async_resolve may read the same
+    file from executor threads at the same time.
+    """
+
+    def __init__(self, path: str, lease_format: str) -> None:
+        """Init the lease file."""
+        if lease_format not in _PARSERS:
+            raise ValueError(f"Unsupported lease file format {lease_format}")
+        self.path = path
+        self.lease_format = lease_format
+        self._parser = _PARSERS[lease_format]()
+        self._leases: dict[str, Lease] = {}
+        self._offset = 0
+        self._file_id: tuple[int, int] | None = None
+        self._size = -1
+        self._mtime_ns = -1
+        self._lock = threading.Lock()
+
+    def _reset(self) -> None:
+        self._parser.reset()
+        self._leases = {}
+        self._offset = 0
+
+    def read(self) -> dict[str, Lease]:
+        """Return all known leases, reading only what changed on disk."""
+        with self._lock:
+            return dict(self._read())
+
+    def _read(self) -> dict[str, Lease]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset()
+            self._file_id = None
+            self._size = -1
+            return self._leases
+        if stat.st_size == self._size and stat.st_mtime_ns == self._mtime_ns:
+            return self._leases
+        file_id = (stat.st_dev, stat.st_ino)
+        if (
+            file_id != self._file_id
+            or stat.st_size < self._offset
+            or not self._parser.append_only
+        ):
+            self._reset()
+        with open(self.path, "rb") as file:
+            file.seek(self._offset)
+            data = file.read()
+        self._offset += self._parser.feed(data, self._leases)
+        self._file_id = file_id
+        self._size = stat.st_size
+        self._mtime_ns = stat.st_mtime_ns
+        _LOGGER.debug(
+            "Read %s leases from %s up to offset %s",
+            len(self._leases),
+            self.path,
+            self._offset,
+        )
+        return self._leases
+
+    def active_leases(self, now: float | None = None) -> dict[str, Lease]:
+        """Return the leases that have not expired."""
+        if now is None:
+            now = time.time()
+        with self._lock:
+            return {
+                ip: lease
+                for ip, lease in self._read().items()
+                if lease.expires is None or lease.expires > now
+            }
@@ -1,29 +1,55 @@
 from __future__ import annotations
 
 import asyncio
+import logging
+import os
 import re
 import socket
 import sys
 from contextlib import suppress
 from ipaddress import IPv4Address, IPv4Network, IPv6Address, ip_network
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, NamedTuple
 
 import ifaddr
 from cached_ipaddress import cached_ip_addresses
 from ifaddr import Adapter
 
+from .cache import BoundedCache, register_cache
 from .util import asyncio_timeout
 
 if TYPE_CHECKING:
-    from collections.abc import Iterable
+    from collections.abc import Awaitable, Callable, Iterable
 
     from pyroute2.iproute import IPRoute
+
 # Some MAC addresses will drop the leading zero so
 # our mac validation must allow a single char
 VALID_MAC_ADDRESS = re.compile("^([0-9A-Fa-f]{1,2}[:-]){5}([0-9A-Fa-f]{1,2})$")
+# Validates and captures the octets of a MAC address in one match
+MAC_OCTETS = re.compile("([0-9A-Fa-f]{1,2})[:-]" * 5 + "([0-9A-Fa-f]{1,2})")
+# The form the kernel and most arp implementations already report
+CANONICAL_MAC_ADDRESS = re.compile("(?:[0-9a-f]{2}:){5}[0-9a-f]{2}")
+# Captures the ip and MAC address of an arp -a -n line, for example
+# ? (192.168.1.2) at aa:bb:cc:dd:ee:ff on en0 ifscope [ethernet]
+# Fields are separated by [^\S\n] so a short line never runs into the next
+ARP_LINE = re.compile(
+    r"^[^\S\n]*\S+[^\S\n]+\(?([^\s()]+)\)?[^\S\n]+\S+[^\S\n]+(\S+)", re.MULTILINE
+)
+# Normalized MAC addresses and valid ips of neighbours are memoized by
+# how they were reported, since the same devices show up scan after scan
+NEIGHBOUR_CACHE_SIZE = 4096
 
 ARP_CACHE_POPULATE_TIME = 10
 ARP_TIMEOUT = 10
+MIN_ARP_TIMEOUT = 0.1
+
+# Probes are paced so switches and routers that rate limit
+# ARP do not drop the requests for a large network
+ARP_PROBE_RATE = 1000
+ARP_PROBE_BURST = 64
+ARP_PROBE_RETRIES = 2
+# Doubled after every retry
+ARP_PROBE_RETRY_DELAY = 1.0
 
 DEFAULT_NETWORK_PREFIX = 24
 
@@ -42,6 +68,33 @@ LOOPBACK_TARGET_IP = "127.0.0.1"
 
 IGNORE_MACS = {"00:00:00:00:00:00", "ff:ff:ff:ff:ff:ff"}
 
+# Kernel neighbour states (NUD_*), NUD_NONE is also used when the
+# backend does not report states
+NUD_NONE = 0x00
+NUD_INCOMPLETE = 0x01
+NUD_REACHABLE = 0x02
+NUD_STALE = 0x04
+NUD_DELAY = 0x08
+NUD_PROBE = 0x10
+NUD_FAILED = 0x20
+NUD_NOARP = 0x40
+NUD_PERMANENT = 0x80
+# States that the kernel has recently confirmed or never needs to
+NUD_CONFIRMED = NUD_REACHABLE | NUD_PERMANENT | NUD_NOARP
+# States without a usable link layer address
+NUD_UNRESOLVED = NUD_INCOMPLETE | NUD_FAILED
+
+# Unconfirmed entries last confirmed longer ago than this are probed again
+NEIGHBOUR_STALE_AGE = 60
+
+# NDA_CACHEINFO reports ages in clock ticks (USER_HZ)
+try:
+    CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+except (AttributeError, OSError, ValueError):
+    CLOCK_TICKS = 100
+
+_LOGGER = logging.getLogger(__name__)
+
 
 def load_resolv_conf() -> list[IPv4Address | IPv6Address]:
     """Load the resolv.conf."""
@@ -90,6 +143,17 @@ def get_network(local_ip: IPv4Address, adapters: list[Adapter]) -> IPv4Network:
     return network
 
 
+def get_interface_ip(interface: str, adapters: list[Adapter]) -> str | None:
+    """Find the first IPv4 address of an interface."""
+    for adapter in adapters:
+        if interface not in (adapter.name, adapter.nice_name):
+            continue
+        for ip in adapter.ips:
+            if isinstance(ip.ip, str):
+                return ip.ip
+    return None
+
+
 def get_ip_prefix_from_adapters(local_ip: str, adapters: list[Adapter]) -> int | None:
     """Find the network prefix for an adapter."""
     for adapter in adapters:
@@ -114,33 +178,248 @@ def get_router_ip(ipr: IPRoute) -> IPv4Address | None:
     )
 
 
+class Neighbour(NamedTuple):
+    """An entry in the neighbour table."""
+
+    mac: str | None
+    state: int
+    # Seconds since the kernel last confirmed the entry, None if unknown
+    age: float | None = None
+
+
+def _neighbour_needs_probe(neighbour: Neighbour | None) -> bool:
+    """
+    Return if a neighbour entry should be probed.
+
+    Missing and unresolved entries are probed, as are unconfirmed ones
+    that are older than NEIGHBOUR_STALE_AGE. Entries without a state,
+    from the arp command, are trusted as is.
+    """
+    if neighbour is None or not neighbour.mac or neighbour.state & NUD_UNRESOLVED:
+        return True
+    if neighbour.state == NUD_NONE or neighbour.state & NUD_CONFIRMED:
+        return False
+    return neighbour.age is None or neighbour.age >= NEIGHBOUR_STALE_AGE
+
+
+def _usable_neighbours(neighbours: dict[str, Neighbour]) -> dict[str, str]:
+    """Return the macs of the entries that are not FAILED or INCOMPLETE."""
+    return {
+        ip: neighbour.mac
+        for ip, neighbour in neighbours.items()
+        if neighbour.mac and not neighbour.state & NUD_UNRESOLVED
+    }
+
+
+_NEIGHBOUR_IP_CACHE: BoundedCache[str, bool] = register_cache(
+    BoundedCache("neighbour_ips", NEIGHBOUR_CACHE_SIZE)
+)
+_MAC_CACHE: BoundedCache[str, str] = register_cache(
+    BoundedCache("macs", NEIGHBOUR_CACHE_SIZE)
+)
+
+
+def _valid_neighbour_ip(ip: str) -> bool:
+    """Return if an ip can be a neighbour."""
+    if (valid := _NEIGHBOUR_IP_CACHE.get(ip)) is None:
+        valid = (ip_addr := cached_ip_addresses(ip)) is not None and not (
+            ip_addr.is_loopback
+            or ip_addr.is_link_local
+            or ip_addr.is_multicast
+            or ip_addr.is_unspecified
+        )
+        _NEIGHBOUR_IP_CACHE.set(ip, valid)
+    return valid
+
+
+def _canonical_mac(mac: str) -> str:
+    """Return the mac in lower case with two digits per octet, or ""."""
+    if CANONICAL_MAC_ADDRESS.fullmatch(mac):
+        return "" if mac in IGNORE_MACS else mac
+    if not (match := MAC_OCTETS.fullmatch(mac)):
+        return ""
+    mac = ":".join([octet.zfill(2) for octet in match.groups()]).lower()
+    return "" if mac in IGNORE_MACS else mac
+
+
+def _normalize_mac(mac: str) -> str | None:
+    """Return the mac with two digits per octet or None if it is not valid."""
+    if (normalized := _MAC_CACHE.get(mac)) is None:
+        normalized = _canonical_mac(mac)
+        _MAC_CACHE.set(mac, normalized)
+    return normalized or None
+
+
 def _fill_neighbor(neighbours: dict[str, str], ip: str, mac: str) -> None:
     """Add a neighbor if it is valid."""
-    if not (ip_addr := cached_ip_addresses(ip)):
-        return
-    if (
-        ip_addr.is_loopback
-        or ip_addr.is_link_local
-        or ip_addr.is_multicast
-        or ip_addr.is_unspecified
-    ):
-        return
-    if not VALID_MAC_ADDRESS.match(mac):
-        return
-    mac = ":".join([i.zfill(2) for i in mac.split(":")])
-    if mac in IGNORE_MACS:
-        return
-    neighbours[ip] = mac
-
-
-def async_populate_arp(ip_addresses: Iterable[str]) -> socket.socket:
-    """Send an empty packet to a host to populate the arp cache."""
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, 0)
-    sock.setblocking(False)
-    for ip_addr in ip_addresses:
-        with suppress(Exception):
-            sock.sendto(b"", (ip_addr, 80))
-    return sock
+    if _valid_neighbour_ip(ip) and (normalized_mac := _normalize_mac(mac)):
+        neighbours[ip] = normalized_mac
+
+
+def create_ip_route() -> IPRoute | None:
+    """Open a netlink socket, or return None to fall back to the arp command."""
+    with suppress(Exception):
+        from pyroute2.iproute import IPRoute
+
+        return IPRoute()
+    return None
+
+
+def parse_arp_output(out_data: bytes) -> dict[str, str]:
+    """Parse the output of arp -a -n."""
+    neighbours: dict[str, str] = {}
+    for ip, mac in ARP_LINE.findall(out_data.decode()):
+        _fill_neighbor(neighbours, ip, mac)
+    return neighbours
+
+
+def parse_ip_route_neighbours(messages: Iterable[Any]) -> dict[str, Neighbour]:
+    """Parse the neighbour messages from pyroute2."""
+    neighbours: dict[str, Neighbour] = {}
+    for neighbour in messages:
+        ip = None
+        mac = None
+        age = None
+        for key, value in neighbour["attrs"]:
+            if key == "NDA_DST":
+                ip = value
+            elif key == "NDA_LLADDR":
+                mac = value
+            elif key == "NDA_CACHEINFO":
+                with suppress(Exception):
+                    age = value.get("ndm_confirmed") / CLOCK_TICKS
+        if not ip or not _valid_neighbour_ip(ip):
+            continue
+        normalized_mac = _normalize_mac(mac) if mac else None
+        if mac and not normalized_mac:
+            continue
+        neighbours[ip] = Neighbour(
+            normalized_mac, neighbour.get("state") or NUD_NONE, age
+        )
+    return neighbours
+
+
+class ArpProbeProgress(NamedTuple):
+    """Progress of an arp probe run."""
+
+    total: int
+    sent: int
+    resolved: int
+    attempt: int
+
+
+class _TokenBucket:
+    """A token bucket refilled at rate tokens per second."""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        """Init a full bucket."""
+        self._loop = asyncio.get_running_loop()
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = self._loop.time()
+
+    def take(self, wanted: int) -> int:
+        """Take up to wanted tokens and return how many were taken."""
+        now = self._loop.time()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        taken = min(int(self._tokens), wanted)
+        self._tokens -= taken
+        return taken
+
+    def wait_time(self, wanted: int) -> float:
+        """Seconds until a full burst, or wanted tokens if fewer, are available."""
+        return max(min(wanted, self.burst) - self._tokens, 0) / self.rate
+
+
+class ArpProber:
+    """
+    Populate the arp cache with paced probes.
+
+    Probes are sent from a token bucket of rate packets per second that
+    holds up to burst packets. After each round the neighbour table is
+    read and the ips that are still missing are probed again, with the
+    wait doubling each time, until all are resolved, the retries are
+    used up or the deadline is reached.
+    """
+
+    def __init__(
+        self,
+        rate: float = ARP_PROBE_RATE,
+        burst: int = ARP_PROBE_BURST,
+        retries: int = ARP_PROBE_RETRIES,
+        retry_delay: float = ARP_PROBE_RETRY_DELAY,
+        progress_callback: Callable[[ArpProbeProgress], None] | None = None,
+    ) -> None:
+        """Init the prober."""
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.progress_callback = progress_callback
+
+    async def _async_send(
+        self,
+        sock: socket.socket,
+        ips: list[str],
+        bucket: _TokenBucket,
+        deadline: float,
+    ) -> int:
+        """Send a probe to each ip as fast as the token bucket allows."""
+        loop = asyncio.get_running_loop()
+        sent = 0
+        total = len(ips)
+        while sent < total:
+            if not (count := bucket.take(total - sent)):
+                await asyncio.sleep(bucket.wait_time(total - sent))
+                if loop.time() >= deadline:
+                    break
+                continue
+            self._send_probes(sock, ips[sent : sent + count])
+            sent += count
+        return sent
+
+    def _send_probes(self, sock: socket.socket, ips: list[str]) -> None:
+        """Send an empty packet to each ip to trigger ARP resolution."""
+        for ip_addr in ips:
+            with suppress(Exception):
+                sock.sendto(b"", (ip_addr, 80))
+
+    async def async_probe(
+        self,
+        ips: list[str],
+        get_neighbours: Callable[[], Awaitable[dict[str, str]]],
+        deadline: float,
+    ) -> dict[str, str]:
+        """Probe ips and return the neighbour table read after the last round."""
+        loop = asyncio.get_running_loop()
+        neighbours: dict[str, str] = {}
+        pending = ips
+        bucket = _TokenBucket(self.rate, self.burst)
+        delay = self.retry_delay
+        sent = 0
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, 0)
+        sock.setblocking(False)
+        try:
+            for attempt in range(self.retries + 1):
+                sent += await self._async_send(sock, pending, bucket, deadline)
+                if (wait := min(delay, deadline - loop.time())) > 0:
+                    await asyncio.sleep(wait)
+                neighbours = await get_neighbours()
+                pending = [ip for ip in pending if ip not in neighbours]
+                if self.progress_callback:
+                    self.progress_callback(
+                        ArpProbeProgress(
+                            len(ips), sent, len(ips) - len(pending), attempt
+                        )
+                    )
+                if not pending or loop.time() >= deadline:
+                    break
+                delay *= 2
+        finally:
+            sock.close()
+        return neighbours
 
 
 class SystemNetworkData:
@@ -152,24 +431,39 @@ class SystemNetworkData:
     router_ip: IPv4Address | None = None
     local_ip: IPv4Address | None = None
 
-    def __init__(self, ip_route: IPRoute | None, local_ip: str | None = None) -> None:
-        """Init system network data."""
+    def __init__(
+        self,
+        ip_route: IPRoute | None,
+        local_ip: str | None = None,
+        arp_prober: ArpProber | None = None,
+        network: str | None = None,
+        nameservers: Iterable[str] | None = None,
+    ) -> None:
+        """
+        Init system network data.
+
+        network and nameservers replace the ones found by setup.
+        """
         self.ip_route = ip_route
+        self.arp_prober = arp_prober or ArpProber()
         self.local_ip = cached_ip_addresses(local_ip) if local_ip else None
+        self._network = network
+        self._nameservers = (
+            None
+            if nameservers is None
+            else [
+                ip_addr
+                for nameserver in nameservers
+                if (ip_addr := cached_ip_addresses(nameserver))
+            ]
+        )
 
     def setup(self) -> None:
         """Obtain the local network data."""
-        try:
-            resolvers = load_resolv_conf()
-        except FileNotFoundError:
-            if sys.platform != "win32":
-                raise
+        if self._nameservers is not None:
+            self.nameservers = self._nameservers
         else:
-            self.nameservers = [
-                ip_addr
-                for ip_addr in resolvers
-                if any(ip_addr in network for network in PRIVATE_AND_LOCAL_NETWORKS)
-            ]
+            self._load_nameservers()
         self.adapters = list(ifaddr.get_adapters())
         if not self.local_ip:
             self.local_ip = (
@@ -179,7 +473,13 @@ class SystemNetworkData:
                 or get_local_ip(LOOPBACK_TARGET_IP)
             )
         assert self.local_ip is not None
-        self.network = get_network(self.local_ip, self.adapters)
+        if self._network:
+            network = ip_network(self._network, False)
+            if not isinstance(network, IPv4Network):
+                raise ValueError(f"Only IPv4 networks can be scanned: {network}")
+            self.network = network
+        else:
+            self.network = get_network(self.local_ip, self.adapters)
         if self.ip_route:
             with suppress(Exception):
                 self.router_ip = get_router_ip(self.ip_route)
@@ -195,25 +495,81 @@ class SystemNetworkData:
             network_address = str(self.network.network_address)
             self.router_ip = cached_ip_addresses(f"{network_address[:-1]}1")
 
-    async def async_get_neighbours(self, ips: Iterable[str]) -> dict[str, str]:
-        """Get neighbours with best available method."""
-        neighbours = await self._async_get_neighbours()
-        ips_missing_arp = [ip for ip in ips if ip not in neighbours]
-        if not ips_missing_arp:
-            return neighbours
-        sock = async_populate_arp(ips_missing_arp)
-        await asyncio.sleep(ARP_CACHE_POPULATE_TIME)
-        sock.close()
-        neighbours.update(await self._async_get_neighbours())
-        return neighbours
+    def _load_nameservers(self) -> None:
+        """Use the private and local nameservers from resolv.conf."""
+        try:
+            resolvers = load_resolv_conf()
+        except FileNotFoundError:
+            if sys.platform != "win32":
+                raise
+        else:
+            self.nameservers = [
+                ip_addr
+                for ip_addr in resolvers
+                if any(ip_addr in network for network in PRIVATE_AND_LOCAL_NETWORKS)
+            ]
 
-    async def _async_get_neighbours(self) -> dict[str, str]:
+    async def async_get_neighbours(
+        self,
+        ips: Iterable[str],
+        deadline: float | None = None,
+    ) -> dict[str, str]:
+        """
+        Get neighbours with best available method.
+
+        Missing ips, and ips whose entries have gone unconfirmed for
+        NEIGHBOUR_STALE_AGE, are probed for at most ARP_CACHE_POPULATE_TIME;
+        recently confirmed entries are not. FAILED and INCOMPLETE entries
+        are left out. If deadline is set, probing and running the arp
+        command are cut short at that loop time.
+        """
+        states = await self.async_get_neighbour_states(deadline)
+        ips_to_probe = [ip for ip in ips if _neighbour_needs_probe(states.get(ip))]
+        if not ips_to_probe:
+            return _usable_neighbours(states)
+        populate_deadline = asyncio.get_running_loop().time() + ARP_CACHE_POPULATE_TIME
+        if deadline is not None:
+            populate_deadline = min(populate_deadline, deadline)
+        if populate_deadline <= asyncio.get_running_loop().time():
+            return _usable_neighbours(states)
+        _LOGGER.debug(
+            "Probing %s neighbours, %s of them stale",
+            len(ips_to_probe),
+            sum(1 for ip in ips_to_probe if ip in states),
+        )
+
+        async def _async_get_resolved() -> dict[str, str]:
+            nonlocal states
+            states = await self.async_get_neighbour_states(deadline)
+            return {
+                ip: neighbour.mac
+                for ip, neighbour in states.items()
+                if neighbour.mac and not _neighbour_needs_probe(neighbour)
+            }
+
+        await self.arp_prober.async_probe(
+            ips_to_probe, _async_get_resolved, populate_deadline
+        )
+        return _usable_neighbours(states)
+
+    async def _async_get_neighbours(
+        self, deadline: float | None = None
+    ) -> dict[str, str]:
         """Get neighbours from the arp table."""
         if self.ip_route:
             return await self._async_get_neighbours_ip_route()
-        return await self._async_get_neighbours_arp()
+        arp_timeout: float = ARP_TIMEOUT
+        if deadline is not None:
+            # Always give the arp command a brief chance to answer
+            arp_timeout = min(
+                arp_timeout,
+                max(deadline - asyncio.get_running_loop().time(), MIN_ARP_TIMEOUT),
+            )
+        return await self._async_get_neighbours_arp(arp_timeout)
 
-    async def _async_get_neighbours_arp(self) -> dict[str, str]:
+    async def _async_get_neighbours_arp(
+        self, arp_timeout: float = ARP_TIMEOUT
+    ) -> dict[str, str]:
         """Get neighbours with arp command."""
         neighbours: dict[str, str] = {}
         arp = await asyncio.create_subprocess_exec(
@@ -226,7 +582,7 @@ class SystemNetworkData:
             close_fds=False,
         )
         try:
-            async with asyncio_timeout(ARP_TIMEOUT):
+            async with asyncio_timeout(arp_timeout):
                 out_data, _ = await arp.communicate()
         except asyncio.TimeoutError:
             if arp:
@@ -237,35 +593,45 @@ class SystemNetworkData:
         except AttributeError:
             return neighbours
 
-        for line in out_data.decode().splitlines():
-            chomped = line.strip()
-            data = chomped.split()
-            if len(data) < 4:
-                continue
-            ip = data[1].strip("()")
-            mac = data[3]
-            _fill_neighbor(neighbours, ip, mac)
+        # Parse in the executor so a large table does not block the loop
+        return await asyncio.get_running_loop().run_in_executor(
+            None, parse_arp_output, out_data
+        )
 
-        return neighbours
+    async def async_get_neighbour_states(
+        self, deadline: float | None = None
+    ) -> dict[str, Neighbour]:
+        """
+        Get the neighbour table with the kernel state of each entry.
+
+        Entries without a link layer address, such as FAILED ones, are
+        included with mac set to None. The age of an entry is the time
+        since the kernel last confirmed it. The arp command reports
+        neither, so its entries are NUD_NONE without an age.
+        """
+        if self.ip_route:
+            return await self._async_get_neighbour_states_ip_route()
+        return {
+            ip: Neighbour(mac, NUD_NONE)
+            for ip, mac in (await self._async_get_neighbours(deadline)).items()
+        }
 
     async def _async_get_neighbours_ip_route(self) -> dict[str, str]:
         """Get neighbours with pyroute2."""
-        neighbours: dict[str, str] = {}
-        loop = asyncio.get_running_loop()
+        return _usable_neighbours(await self._async_get_neighbour_states_ip_route())
+
+    async def _async_get_neighbour_states_ip_route(self) -> dict[str, Neighbour]:
+        """Get neighbours and their states with pyroute2."""
         # This shouldn't ever block but it does
         # interact with netlink so its safer to run
-        # in the executor
+        # in the executor, along with parsing a
+        # potentially large table
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self._get_neighbour_states_ip_route
+        )
+
+    def _get_neighbour_states_ip_route(self) -> dict[str, Neighbour]:
+        """Read and parse the neighbour table with pyroute2."""
         if TYPE_CHECKING:
             assert self.ip_route is not None
-        for neighbour in await loop.run_in_executor(None, self.ip_route.get_neighbours):
-            ip = None
-            mac = None
-            for key, value in neighbour["attrs"]:
-                if key == "NDA_DST":
-                    ip = value
-                elif key == "NDA_LLADDR":
-                    mac = value
-            if ip and mac:
-                _fill_neighbor(neighbours, ip, mac)
-
-        return neighbours
+        return parse_ip_route_neighbours(self.ip_route.get_neighbours())
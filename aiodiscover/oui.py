@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import argparse
+import csv
+import mmap
+import os
+import struct
+import sys
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Sequence
+
+OUI_MAGIC = b"AIOOUI\x00\x01"
+# magic, record count
+HEADER = struct.Struct("!8sI")
+# (prefix bits << 48) | prefix, vendor offset, vendor length
+RECORD = struct.Struct("!QIH")
+KEY = struct.Struct("!Q")
+
+MAC_BITS = 48
+MAC_MASK = (1 << MAC_BITS) - 1
+# MA-S (and IAB), MA-M and MA-L assignments, most specific first
+PREFIX_BITS = (36, 28, 24)
+
+
+class InvalidOUIDatabase(Exception):
+    """The file is not an OUI database."""
+
+
+def _record_key(prefix_bits: int, prefix: int) -> int:
+    """Return the sort key for a prefix left aligned in a 48 bit MAC."""
+    return (prefix_bits << MAC_BITS) | prefix
+
+
+def mac_to_int(mac: str) -> int | None:
+    """Convert a MAC address in any common notation to an int."""
+    digits = mac.replace(":", "").replace("-", "").replace(".", "")
+    if len(digits) != 12:
+        return None
+    try:
+        return int(digits, 16)
+    except ValueError:
+        return None
+
+
+def read_ieee_csv(paths: Iterable[str]) -> dict[tuple[int, int], str]:
+    """
+    Read IEEE registry CSV exports.
+
+    These are the oui.csv (MA-L), mam.csv (MA-M), oui36.csv (MA-S)
+    and iab.csv files published by the IEEE Registration Authority.
+    """
+    assignments: dict[tuple[int, int], str] = {}
+    for path in paths:
+        with open(path, newline="", encoding="utf-8") as file:
+            for row in csv.DictReader(file):
+                assignment = (row.get("Assignment") or "").strip()
+                vendor = (row.get("Organization Name") or "").strip()
+                if not assignment or not vendor:
+                    continue
+                prefix_bits = len(assignment) * 4
+                if prefix_bits not in PREFIX_BITS:
+                    continue
+                try:
+                    prefix = int(assignment, 16) << (MAC_BITS - prefix_bits)
+                except ValueError:
+                    continue
+                assignments[(prefix_bits, prefix)] = vendor
+    return assignments
+
+
+def build_oui_database(
+    assignments: dict[tuple[int, int], str],
+    output_path: str,
+) -> int:
+    """Write a sorted binary index of assignments and return the record count."""
+    strings = bytearray()
+    string_offsets: dict[str, tuple[int, int]] = {}
+    records: list[tuple[int, int, int]] = []
+    for (prefix_bits, prefix), vendor in assignments.items():
+        if vendor not in string_offsets:
+            encoded = vendor.encode()[:0xFFFF]
+            string_offsets[vendor] = (len(strings), len(encoded))
+            strings += encoded
+        offset, length = string_offsets[vendor]
+        records.append((_record_key(prefix_bits, prefix), offset, length))
+    records.sort()
+    strings_start = HEADER.size + len(records) * RECORD.size
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(HEADER.pack(OUI_MAGIC, len(records)))
+        for key, offset, length in records:
+            file.write(RECORD.pack(key, strings_start + offset, length))
+        file.write(strings)
+    os.replace(tmp_path, output_path)
+    return len(records)
+
+
+class OUIDatabase:
+    """
+    Look up MAC vendors in a memory mapped index built by build_oui_database.
+
+    The index is mapped read only, so every process that opens the same
+    file shares one copy in the page cache instead of each holding its
+    own dict of the IEEE registry.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Map the database."""
+        with open(path, "rb") as file:
+            try:
+                self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as ex:
+                raise InvalidOUIDatabase(f"{path} is empty") from ex
+        if len(self._mmap) < HEADER.size:
+            self.close()
+            raise InvalidOUIDatabase(f"{path} is too short")
+        magic, self._count = HEADER.unpack_from(self._mmap)
+        if (
+            magic != OUI_MAGIC
+            or len(self._mmap) < HEADER.size + self._count * RECORD.size
+        ):
+            self.close()
+            raise InvalidOUIDatabase(f"{path} is not an OUI database")
+
+    def __len__(self) -> int:
+        """Return the number of assignments."""
+        return self._count
+
+    def close(self) -> None:
+        """Unmap the database."""
+        self._mmap.close()
+
+    def _find(self, key: int) -> int | None:
+        """Binary search for the record index with key."""
+        low = 0
+        high = self._count
+        while low < high:
+            mid = (low + high) // 2
+            (mid_key,) = KEY.unpack_from(self._mmap, HEADER.size + mid * RECORD.size)
+            if mid_key < key:
+                low = mid + 1
+            elif mid_key > key:
+                high = mid
+            else:
+                return mid
+        return None
+
+    def lookup(self, mac: str) -> str | None:
+        """Return the vendor of the most specific assignment covering mac."""
+        if (mac_int := mac_to_int(mac)) is None:
+            return None
+        for prefix_bits in PREFIX_BITS:
+            shift = MAC_BITS - prefix_bits
+            key = _record_key(prefix_bits, (mac_int >> shift) << shift)
+            if (idx := self._find(key)) is not None:
+                _, offset, length = RECORD.unpack_from(
+                    self._mmap, HEADER.size + idx * RECORD.size
+                )
+                return self._mmap[offset : offset + length].decode()
+        return None
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Build an OUI database from IEEE registry CSV files."""
+    parser = argparse.ArgumentParser(
+        prog="python -m aiodiscover.oui",
+        description="Build a MAC vendor index from IEEE registry CSV files.",
+    )
+    parser.add_argument("csv_files", nargs="+", help="oui.csv, mam.csv, oui36.csv")
+    parser.add_argument("-o", "--output", required=True, help="index file to write")
+    args = parser.parse_args(argv)
+    count = build_oui_database(read_ieee_csv(args.csv_files), args.output)
+    print(f"Wrote {count} assignments to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+from ipaddress import IPv4Address, IPv4Network
+from typing import TYPE_CHECKING
+
+from cached_ipaddress import cached_ip_addresses
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+# Host offsets from the network address of the default pools of common
+# DHCP servers and consumer routers, swept after known addresses
+DHCP_POOL_OFFSETS = (range(100, 200), range(2, 50))
+
+
+def host_range(network: IPv4Network) -> tuple[int, int]:
+    """Return the first and one past the last host of a network as ints."""
+    first = int(network.network_address)
+    stop = int(network.broadcast_address) + 1
+    if network.prefixlen < 31:
+        # Skip the network and broadcast address like network.hosts()
+        return first + 1, stop - 1
+    return first, stop
+
+
+class PlannedIPv4Address(IPv4Address):
+    """An address with the strings a scan needs computed once."""
+
+    __slots__ = ("_hash", "_str", "reverse_pointer")
+
+    def __init__(self, address: int) -> None:
+        """Init the address and its strings."""
+        super().__init__(address)
+        self._hash = super().__hash__()
+        self._str = super().__str__()
+        self.reverse_pointer = super().reverse_pointer  # type: ignore[misc]
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __str__(self) -> str:
+        return self._str
+
+
+class ScanPlan:
+    """
+    The addresses of a network prepared once and reused by every scan.
+
+    The address objects carry their string and reverse pointer names, so
+    building the PTR queries and the result keys allocates nothing new,
+    and the part of the scan order that does not depend on the neighbour
+    table or the previous result is computed up front.
+    """
+
+    def __init__(self, network: IPv4Network) -> None:
+        """Prepare the plan."""
+        self.network = network
+        self._first, stop = host_range(network)
+        self.hosts: list[IPv4Address] = [
+            PlannedIPv4Address(ip) for ip in range(self._first, stop)
+        ]
+        network_address = int(network.network_address)
+        pools: dict[int, None] = {}
+        for offsets in DHCP_POOL_OFFSETS:
+            pools.update(
+                dict.fromkeys(
+                    idx
+                    for idx in (
+                        network_address + offset - self._first for offset in offsets
+                    )
+                    if 0 <= idx < len(self.hosts)
+                )
+            )
+        self._default_order = [
+            *pools,
+            *(idx for idx in range(len(self.hosts)) if idx not in pools),
+        ]
+
+    def _index(self, ip_int: int) -> int | None:
+        """Return the index of an address or None if it is not a host."""
+        idx = ip_int - self._first
+        return idx if 0 <= idx < len(self.hosts) else None
+
+    def order(
+        self,
+        router_ip: IPv4Address | None = None,
+        neighbour_ips: Iterable[str] = (),
+        previous_ips: Iterable[str] = (),
+    ) -> list[IPv4Address]:
+        """
+        Order the hosts by how likely they are to be in use.
+
+        The router comes first, then the addresses in the neighbour table,
+        the addresses found by the previous scan and the default DHCP
+        pools. The remaining addresses follow in numeric order.
+        """
+        known: dict[int, None] = {}
+        if router_ip is not None and (idx := self._index(int(router_ip))) is not None:
+            known[idx] = None
+        for ips in (neighbour_ips, previous_ips):
+            ip_ints = [
+                int(ip_addr)
+                for ip in ips
+                if (ip_addr := cached_ip_addresses(ip)) is not None
+                and ip_addr.version == 4
+            ]
+            known.update(
+                dict.fromkeys(
+                    idx
+                    for ip_int in sorted(ip_ints)
+                    if (idx := self._index(ip_int)) is not None
+                )
+            )
+        hosts = self.hosts
+        return [hosts[idx] for idx in known] + [
+            hosts[idx] for idx in self._default_order if idx not in known
+        ]
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING, NamedTuple
+
+from .network import NUD_CONFIRMED, NUD_NONE
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from .network import Neighbour, SystemNetworkData
+
+PRESENCE_POLL_INTERVAL = 5
+PRESENCE_CONSIDER_AWAY = 30
+# Long enough for the kernel to move a STALE entry through DELAY
+# and PROBE to REACHABLE or FAILED
+PRESENCE_PROBE_TIMEOUT = 8
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class PresenceChange(NamedTuple):
+    """A device that came home or went away."""
+
+    mac: str
+    ip: str
+    home: bool
+
+
+def _is_confirmed(neighbour: Neighbour | None, mac: str) -> bool:
+    """
+    Return if a neighbour entry confirms the device with mac is present.
+
+    NUD_NONE is what the arp command reports for any entry with a MAC.
+    """
+    if neighbour is None or neighbour.mac != mac:
+        return False
+    return neighbour.state == NUD_NONE or bool(neighbour.state & NUD_CONFIRMED)
+
+
+class PresenceTracker:
+    """
+    Track the presence of known devices from the kernel neighbour table.
+
+    Each poll reads the neighbour table and only probes the known ips
+    whose entries are not already confirmed, so a poll of devices that
+    are online sends nothing. A device is home while its entry keeps
+    being confirmed and is considered away once it has not been
+    confirmed for consider_away seconds.
+    """
+
+    def __init__(
+        self,
+        sys_network_data: SystemNetworkData,
+        callback: Callable[[PresenceChange], None],
+        consider_away: float = PRESENCE_CONSIDER_AWAY,
+        probe_timeout: float = PRESENCE_PROBE_TIMEOUT,
+    ) -> None:
+        """Init the tracker."""
+        self._loop = asyncio.get_running_loop()
+        self._sys_network_data = sys_network_data
+        self._callback = callback
+        self.consider_away = consider_away
+        self.probe_timeout = probe_timeout
+        # mac -> ip
+        self._hosts: dict[str, str] = {}
+        self._home: dict[str, bool] = {}
+        self._last_seen: dict[str, float] = {}
+
+    @property
+    def home(self) -> dict[str, bool]:
+        """Return the presence of each tracked mac."""
+        return dict(self._home)
+
+    def update_hosts(self, hosts: dict[str, str]) -> None:
+        """
+        Track a new mapping of mac to ip from a discovery scan.
+
+        Newly found devices start out home since the scan just saw them
+        and devices missing from the mapping are no longer tracked.
+        """
+        now = self._loop.time()
+        for mac in hosts.keys() - self._hosts.keys():
+            self._home[mac] = True
+            self._last_seen[mac] = now
+        for mac in self._hosts.keys() - hosts.keys():
+            del self._home[mac]
+            del self._last_seen[mac]
+        self._hosts = dict(hosts)
+
+    async def _async_get_confirmed(self) -> dict[str, str]:
+        """Return the ips of the tracked devices that are confirmed present."""
+        states = await self._sys_network_data.async_get_neighbour_states()
+        return {
+            ip: mac
+            for mac, ip in self._hosts.items()
+            if _is_confirmed(states.get(ip), mac)
+        }
+
+    async def async_poll(self) -> None:
+        """Probe the unconfirmed devices and report presence changes."""
+        confirmed = await self._async_get_confirmed()
+        if to_probe := [ip for ip in self._hosts.values() if ip not in confirmed]:
+            confirmed = await self._sys_network_data.arp_prober.async_probe(
+                to_probe,
+                self._async_get_confirmed,
+                self._loop.time() + self.probe_timeout,
+            )
+        now = self._loop.time()
+        for mac, ip in self._hosts.items():
+            if confirmed.get(ip) == mac:
+                self._last_seen[mac] = now
+                if not self._home[mac]:
+                    self._set_home(mac, ip, True)
+            elif self._home[mac] and now - self._last_seen[mac] >= self.consider_away:
+                self._set_home(mac, ip, False)
+
+    def _set_home(self, mac: str, ip: str, home: bool) -> None:
+        """Record a presence change and call the callback."""
+        self._home[mac] = home
+        try:
+            self._callback(PresenceChange(mac, ip, home))
+        except Exception:
+            _LOGGER.exception("Error calling presence callback")
@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import socket
+import struct
+from abc import ABC, abstractmethod
+from contextlib import suppress
+from typing import TYPE_CHECKING, Any
+
+from cached_ipaddress import cached_ip_addresses
+
+from .util import asyncio_timeout
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+
+MDNS_PORT = 5353
+NETBIOS_NS_PORT = 137
+
+PROVIDER_RESPONSE_TIMEOUT = 1.5
+
+DNS_HEADER = struct.Struct("!HHHHHH")
+DNS_RR_HEADER = struct.Struct("!HHIH")
+DNS_FLAG_RESPONSE = 0x8000
+DNS_CLASS_IN = 1
+DNS_TYPE_PTR = 12
+NETBIOS_TYPE_NBSTAT = 0x21
+NETBIOS_GROUP_NAME = 0x8000
+NETBIOS_WORKSTATION_SUFFIX = 0x00
+NETBIOS_NAME_ENTRY_LENGTH = 18
+NETBIOS_NAME_LENGTH = 15
+
+# Guard against compression pointer loops in malformed packets
+MAX_NAME_POINTERS = 16
+
+# A node status request for the wildcard name "*", first-level encoded
+NBSTAT_QUERY = (
+    DNS_HEADER.pack(0x4E42, 0, 1, 0, 0, 0)
+    + b"\x20CK"
+    + b"A" * 30
+    + b"\x00"
+    + struct.pack("!HH", NETBIOS_TYPE_NBSTAT, DNS_CLASS_IN)
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _read_name(data: bytes, offset: int) -> tuple[str, int]:
+    """Read a possibly compressed DNS name and return it with the next offset."""
+    labels: list[str] = []
+    end: int | None = None
+    pointers = 0
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            pointers += 1
+            if pointers > MAX_NAME_POINTERS:
+                raise ValueError("Too many compression pointers")
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            continue
+        offset += 1
+        if not length:
+            break
+        labels.append(data[offset : offset + length].decode())
+        offset += length
+    return ".".join(labels), offset if end is None else end
+
+
+def _encode_name(name: str) -> bytes:
+    """Encode a DNS name without compression."""
+    encoded = b"".join(
+        len(label).to_bytes(1, "big") + label
+        for label in (part.encode() for part in name.split("."))
+        if label
+    )
+    return encoded + b"\x00"
+
+
+def build_mdns_ptr_query(ip: str) -> bytes:
+    """Build a legacy unicast mDNS query for the PTR record of an ip."""
+    ip_addr = cached_ip_addresses(ip)
+    if TYPE_CHECKING:
+        assert ip_addr is not None
+    return (
+        DNS_HEADER.pack(0, 0, 1, 0, 0, 0)
+        + _encode_name(ip_addr.reverse_pointer)
+        + struct.pack("!HH", DNS_TYPE_PTR, DNS_CLASS_IN)
+    )
+
+
+def build_netbios_nbstat_query(ip: str) -> bytes:
+    """Build a NetBIOS node status query."""
+    return NBSTAT_QUERY
+
+
+def parse_mdns_ptr_response(data: bytes) -> str | None:
+    """Get the short hostname from an mDNS PTR response."""
+    try:
+        _, flags, qdcount, ancount, _, _ = DNS_HEADER.unpack_from(data)
+        if not flags & DNS_FLAG_RESPONSE:
+            return None
+        offset = DNS_HEADER.size
+        for _ in range(qdcount):
+            _, offset = _read_name(data, offset)
+            offset += 4
+        for _ in range(ancount):
+            _, offset = _read_name(data, offset)
+            rtype, _, _, rdlength = DNS_RR_HEADER.unpack_from(data, offset)
+            offset += DNS_RR_HEADER.size
+            if rtype == DNS_TYPE_PTR:
+                name, _ = _read_name(data, offset)
+                return name.partition(".")[0] or None
+            offset += rdlength
+    except (struct.error, IndexError, ValueError):
+        return None
+    return None
+
+
+def parse_netbios_nbstat_response(data: bytes) -> str | None:
+    """Get the workstation name from a NetBIOS node status response."""
+    try:
+        _, flags, _, ancount, _, _ = DNS_HEADER.unpack_from(data)
+        if not flags & DNS_FLAG_RESPONSE or not ancount:
+            return None
+        _, offset = _read_name(data, DNS_HEADER.size)
+        rtype, _, _, _ = DNS_RR_HEADER.unpack_from(data, offset)
+        if rtype != NETBIOS_TYPE_NBSTAT:
+            return None
+        offset += DNS_RR_HEADER.size
+        num_names = data[offset]
+        offset += 1
+        for _ in range(num_names):
+            entry = data[offset : offset + NETBIOS_NAME_ENTRY_LENGTH]
+            offset += NETBIOS_NAME_ENTRY_LENGTH
+            if len(entry) < NETBIOS_NAME_ENTRY_LENGTH:
+                return None
+            (nb_flags,) = struct.unpack_from("!H", entry, NETBIOS_NAME_LENGTH + 1)
+            if (
+                entry[NETBIOS_NAME_LENGTH] == NETBIOS_WORKSTATION_SUFFIX
+                and not nb_flags & NETBIOS_GROUP_NAME
+            ):
+                name = entry[:NETBIOS_NAME_LENGTH].decode("ascii").strip()
+                # NetBIOS names are case-insensitive and sent upper case
+                return name.lower() or None
+    except (struct.error, IndexError, ValueError):
+        return None
+    return None
+
+
+class _UDPQueryProtocol(asyncio.DatagramProtocol):
+    """Collect one response per queried ip."""
+
+    def __init__(
+        self,
+        ips: Iterable[str],
+        parse_response: Callable[[bytes], str | None],
+    ) -> None:
+        """Init the protocol."""
+        self.responses: dict[str, str] = {}
+        self.done: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._pending = set(ips)
+        self._parse_response = parse_response
+
+    def datagram_received(self, data: bytes, addr: tuple[str | Any, int]) -> None:
+        """Handle a response."""
+        ip = addr[0]
+        if ip not in self._pending or (name := self._parse_response(data)) is None:
+            return
+        self.responses[ip] = name
+        self._pending.discard(ip)
+        if not self._pending and not self.done.done():
+            self.done.set_result(None)
+
+    def error_received(self, exc: Exception) -> None:
+        """Ignore ICMP errors from hosts that do not listen."""
+
+
+async def async_query_udp(
+    ips: list[str],
+    port: int,
+    build_query: Callable[[str], bytes],
+    parse_response: Callable[[bytes], str | None],
+    timeout: float,
+) -> dict[str, str]:
+    """Send a query to each ip and collect the names from the responses."""
+    if not ips:
+        return {}
+    loop = asyncio.get_running_loop()
+    protocol = _UDPQueryProtocol(ips, parse_response)
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: protocol,
+        local_addr=("0.0.0.0", 0),  # noqa: S104
+        family=socket.AF_INET,
+    )
+    try:
+        for ip in ips:
+            with suppress(OSError):
+                transport.sendto(build_query(ip), (ip, port))
+        with suppress(asyncio.TimeoutError):
+            async with asyncio_timeout(timeout):
+                await protocol.done
+    finally:
+        transport.close()
+    return protocol.responses
+
+
+class HostnameProvider(ABC):
+    """
+    A source of hostnames for addresses the PTR sweep did not resolve.
+
+    Providers are only asked about addresses that are already known
+    to be present in the neighbour table so they never trigger a sweep
+    of the whole network.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    async def async_get_hostnames(self, ips: list[str]) -> dict[str, str]:
+        """Return a mapping of ip to short hostname for the ips that answered."""
+
+
+class _UDPHostnameProvider(HostnameProvider):
+    """A provider that sends one UDP query per address."""
+
+    port: int
+
+    def __init__(
+        self,
+        timeout: float = PROVIDER_RESPONSE_TIMEOUT,
+        port: int | None = None,
+    ) -> None:
+        """Init the provider."""
+        self.timeout = timeout
+        if port is not None:
+            self.port = port
+
+    @abstractmethod
+    def build_query(self, ip: str) -> bytes:
+        """Return the query packet to send to ip."""
+
+    @abstractmethod
+    def parse_response(self, data: bytes) -> str | None:
+        """Return the short hostname in a response packet, if any."""
+
+    async def async_get_hostnames(self, ips: list[str]) -> dict[str, str]:
+        """Query each ip directly."""
+        return await async_query_udp(
+            ips,
+            self.port,
+            self.build_query,
+            self.parse_response,
+            self.timeout,
+        )
+
+
+class MDNSHostnameProvider(_UDPHostnameProvider):
+    """Resolve hostnames with a unicast mDNS reverse lookup."""
+
+    name = "mdns"
+    port = MDNS_PORT
+
+    def build_query(self, ip: str) -> bytes:
+        return build_mdns_ptr_query(ip)
+
+    def parse_response(self, data: bytes) -> str | None:
+        return parse_mdns_ptr_response(data)
+
+
+class NetBIOSHostnameProvider(_UDPHostnameProvider):
+    """Resolve hostnames with a NetBIOS node status query."""
+
+    name = "netbios"
+    port = NETBIOS_NS_PORT
+
+    def build_query(self, ip: str) -> bytes:
+        return build_netbios_nbstat_query(ip)
+
+    def parse_response(self, data: bytes) -> str | None:
+        return parse_netbios_nbstat_response(data)
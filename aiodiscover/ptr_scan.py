@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor
+from ipaddress import IPv4Address, IPv4Network, ip_network
+from typing import TYPE_CHECKING
+
+from .discovery import (
+    HOSTNAME,
+    IP_ADDRESS,
+    async_query_for_ptrs,
+    dns_message_short_hostname,
+)
+from .plan import host_range
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator, Iterable, Sequence
+
+# Addresses resolved by each worker job
+PTR_SCAN_SHARD_SIZE = 4096
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def shard_networks(
+    networks: Iterable[str | IPv4Network],
+    shard_size: int = PTR_SCAN_SHARD_SIZE,
+) -> list[tuple[int, int]]:
+    """Split the hosts of the networks into ranges of at most shard_size."""
+    shards: list[tuple[int, int]] = []
+    for network_or_str in networks:
+        network = ip_network(network_or_str, strict=False)
+        if not isinstance(network, IPv4Network):
+            raise ValueError(f"Only IPv4 networks can be scanned: {network}")
+        start, stop = host_range(network)
+        shards.extend(
+            (shard_start, min(shard_start + shard_size, stop))
+            for shard_start in range(start, stop, shard_size)
+        )
+    return shards
+
+
+async def _async_scan_shard(
+    nameservers: Sequence[str],
+    start: int,
+    stop: int,
+) -> list[tuple[str, str]]:
+    """Resolve a range of addresses, trying nameservers until one answers."""
+    ips = [IPv4Address(ip_int) for ip_int in range(start, stop)]
+    for nameserver in nameservers:
+        results = await async_query_for_ptrs(nameserver, ips)
+        hostnames = [
+            (str(ip), short_host)
+            for idx, ip in enumerate(ips)
+            if (short_host := dns_message_short_hostname(results[idx])) is not None
+        ]
+        if hostnames:
+            return hostnames
+        _LOGGER.debug("No results from %s for %s-%s", nameserver, ips[0], ips[-1])
+    return []
+
+
+def _scan_shard(
+    nameservers: Sequence[str],
+    start: int,
+    stop: int,
+) -> list[tuple[str, str]]:
+    """Resolve a range of addresses in a worker with its own event loop."""
+    return asyncio.run(_async_scan_shard(nameservers, start, stop))
+
+
+async def async_scan_ptr(
+    networks: Iterable[str | IPv4Network],
+    nameservers: Sequence[str],
+    max_workers: int | None = None,
+    shard_size: int = PTR_SCAN_SHARD_SIZE,
+    executor: Executor | None = None,
+) -> AsyncIterator[dict[str, str]]:
+    """
+    Scan arbitrary, possibly routed, networks with PTR lookups only.
+
+    The addresses are split into shards that are resolved in a pool of
+    worker processes, each with its own event loop and resolver, so
+    handling the answers is not bound to one CPU. Hosts are yielded as
+    soon as the shard that found them completes. No neighbour table is
+    involved, so hosts carry a hostname and ip but no MAC address.
+    """
+    loop = asyncio.get_running_loop()
+    shards = shard_networks(networks, shard_size)
+    pool = executor or ProcessPoolExecutor(max_workers=max_workers)
+    nameserver_list = list(nameservers)
+    futures = [
+        loop.run_in_executor(pool, _scan_shard, nameserver_list, start, stop)
+        for start, stop in shards
+    ]
+    try:
+        for future in asyncio.as_completed(futures):
+            for ip, hostname in await future:
+                yield {HOSTNAME: hostname, IP_ADDRESS: ip}
+    finally:
+        for future in futures:
+            future.cancel()
+        if not executor:
+            # Do not block the event loop waiting for workers to exit
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,410 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import selectors
+import time
+from collections import deque
+from ipaddress import IPv4Address, IPv4Network
+from typing import TYPE_CHECKING, Any, NamedTuple, TypeVar
+
+from aiodns import DNSResolver
+from aiodns.error import ARES_ENOTFOUND, ARES_ESERVFAIL, ARES_ETIMEOUT, DNSError
+
+from .discovery import DiscoverHosts
+from .network import ArpProber, Neighbour, SystemNetworkData, create_ip_route
+
+if TYPE_CHECKING:
+    import socket
+    from collections.abc import Callable, Coroutine
+
+RECORDING_VERSION = 1
+
+# Answer for names the recording never saw, as for an ip without a record
+NOT_RECORDED = {"latency": 0.0, "error": ARES_ENOTFOUND}
+
+_T = TypeVar("_T")
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class PTRReply(NamedTuple):
+    """A replayed PTR answer."""
+
+    name: str
+
+
+class ScanRecording:
+    """
+    What recorded scans saw of the network.
+
+    ptr holds the outcome of every PTR query by nameserver and reverse
+    pointer name, in the order the queries were sent: the name and latency
+    of an answer, the c-ares error code and latency of a failure, or
+    timeout when the query was cancelled without an answer. neighbours
+    holds every read of the neighbour table with its latency.
+    """
+
+    def __init__(
+        self,
+        network: str | None = None,
+        router_ip: str | None = None,
+        local_ip: str | None = None,
+        nameservers: list[str] | None = None,
+        ptr: dict[str, dict[str, list[dict[str, Any]]]] | None = None,
+        neighbours: list[dict[str, Any]] | None = None,
+    ) -> None:
+        """Init the recording."""
+        self.network = network
+        self.router_ip = router_ip
+        self.local_ip = local_ip
+        self.nameservers = nameservers or []
+        self.ptr = ptr or {}
+        self.neighbours = neighbours or []
+
+    @classmethod
+    def load(cls, path: str) -> ScanRecording:
+        """Load a recording saved with save."""
+        with open(path) as file:
+            data = json.load(file)
+        if not isinstance(data, dict) or data.get("version") != RECORDING_VERSION:
+            raise ValueError(f"Unknown recording version in {path}")
+        return cls(
+            data["network"],
+            data["router_ip"],
+            data["local_ip"],
+            data["nameservers"],
+            data["ptr"],
+            data["neighbours"],
+        )
+
+    def save(self, path: str) -> None:
+        """Atomically save the recording."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(
+                {
+                    "version": RECORDING_VERSION,
+                    "network": self.network,
+                    "router_ip": self.router_ip,
+                    "local_ip": self.local_ip,
+                    "nameservers": self.nameservers,
+                    "ptr": self.ptr,
+                    "neighbours": self.neighbours,
+                },
+                file,
+            )
+        os.replace(tmp_path, path)
+
+
+def _recorded_answer(future: asyncio.Future[Any], latency: float) -> dict[str, Any]:
+    """Return how a PTR query ended as JSON types."""
+    if future.cancelled():
+        return {"timeout": True}
+    if (exc := future.exception()) is None:
+        return {"latency": latency, "name": future.result().name}
+    if isinstance(exc, DNSError) and exc.args:
+        return {"latency": latency, "error": exc.args[0]}
+    return {"latency": latency, "error": ARES_ESERVFAIL}
+
+
+class _RecordingResolver:
+    """Pass PTR queries to a resolver and record how they end."""
+
+    def __init__(self, resolver: Any, answers: dict[str, list[dict[str, Any]]]) -> None:
+        self._resolver = resolver
+        self._answers = answers
+
+    def query(self, host: str, qtype: str) -> asyncio.Future[Any]:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        attempts = self._answers.setdefault(host, [])
+        future = self._resolver.query(host, qtype)
+
+        def _record(future: asyncio.Future[Any]) -> None:
+            attempts.append(_recorded_answer(future, loop.time() - start))
+
+        future.add_done_callback(_record)
+        return future
+
+    def cancel(self) -> None:
+        self._resolver.cancel()
+
+
+class _RecordingNetworkData(SystemNetworkData):
+    """Record every read of the neighbour table."""
+
+    def __init__(self, recording: ScanRecording, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._recording = recording
+
+    async def async_get_neighbour_states(
+        self, deadline: float | None = None
+    ) -> dict[str, Neighbour]:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        states = await super().async_get_neighbour_states(deadline)
+        self._recording.neighbours.append(
+            {
+                "latency": loop.time() - start,
+                "states": {
+                    ip: [neighbour.mac, neighbour.state, neighbour.age]
+                    for ip, neighbour in states.items()
+                },
+            }
+        )
+        return states
+
+
+class ScanRecorder:
+    """
+    Record the PTR answers and neighbour tables of real scans.
+
+    Scan with the DiscoverHosts from async_create_discover_hosts, then
+    save the recording to replay it with ScanReplay.
+    """
+
+    def __init__(self, resolver_factory: Callable[..., Any] = DNSResolver) -> None:
+        """Init the recorder; resolver_factory creates the real resolvers."""
+        self.recording = ScanRecording()
+        self._resolver_factory = resolver_factory
+
+    def resolver_factory(self, nameservers: list[str], timeout: float) -> Any:
+        """Create a recording resolver, called like DNSResolver."""
+        return _RecordingResolver(
+            self._resolver_factory(nameservers=nameservers, timeout=timeout),
+            self.recording.ptr.setdefault(nameservers[0], {}),
+        )
+
+    async def async_create_discover_hosts(
+        self,
+        local_ip: str | None = None,
+        network: str | None = None,
+        nameservers: list[str] | None = None,
+        arp_prober: ArpProber | None = None,
+        **kwargs: Any,
+    ) -> DiscoverHosts:
+        """Set up the network data and create a DiscoverHosts that records."""
+        sys_network_data = _RecordingNetworkData(
+            self.recording,
+            create_ip_route(),
+            local_ip,
+            arp_prober,
+            network,
+            nameservers,
+        )
+        await asyncio.get_running_loop().run_in_executor(None, sys_network_data.setup)
+        recording = self.recording
+        recording.network = str(sys_network_data.network)
+        recording.router_ip = str(sys_network_data.router_ip)
+        recording.local_ip = str(sys_network_data.local_ip)
+        recording.nameservers = [str(ip) for ip in sys_network_data.nameservers]
+        return DiscoverHosts(
+            resolver_factory=self.resolver_factory,
+            sys_network_data=sys_network_data,
+            **kwargs,
+        )
+
+
+def _resolve(future: asyncio.Future[Any], result: Any) -> None:
+    """Complete a replayed query unless it was cancelled."""
+    if future.done():
+        return
+    if isinstance(result, Exception):
+        future.set_exception(result)
+    else:
+        future.set_result(result)
+
+
+class _ReplayResolver:
+    """Answer PTR queries from a recording after the recorded latency."""
+
+    def __init__(
+        self, answers: dict[str, deque[dict[str, Any]]], timeout: float
+    ) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._answers = answers
+        self._timeout = timeout
+        self._pending: list[tuple[asyncio.Future[Any], asyncio.TimerHandle]] = []
+
+    def query(self, host: str, qtype: str) -> asyncio.Future[Any]:
+        attempts = self._answers.get(host)
+        if not attempts:
+            answer = NOT_RECORDED
+        elif len(attempts) > 1:
+            answer = attempts.popleft()
+        else:
+            # Later scans keep getting the last answer
+            answer = attempts[0]
+        result: Any
+        if answer.get("timeout"):
+            delay = self._timeout
+            result = DNSError(ARES_ETIMEOUT, "Timeout while contacting DNS servers")
+        elif "error" in answer:
+            delay = answer["latency"]
+            result = DNSError(answer["error"], "Replayed error")
+        else:
+            delay = answer["latency"]
+            result = PTRReply(answer["name"])
+        future = self._loop.create_future()
+        handle = self._loop.call_later(delay, _resolve, future, result)
+        self._pending.append((future, handle))
+        return future
+
+    def cancel(self) -> None:
+        for future, handle in self._pending:
+            handle.cancel()
+            future.cancel()
+        self._pending.clear()
+
+
+class _ReplayArpProber(ArpProber):
+    """Pace probes like ArpProber without sending any."""
+
+    def _send_probes(self, sock: socket.socket, ips: list[str]) -> None:
+        pass
+
+
+class _ReplayNetworkData(SystemNetworkData):
+    """Network data and neighbour tables from a recording."""
+
+    def __init__(self, recording: ScanRecording, arp_prober: ArpProber | None) -> None:
+        super().__init__(
+            None,
+            recording.local_ip,
+            arp_prober or _ReplayArpProber(),
+            recording.network,
+            recording.nameservers,
+        )
+        self._recording = recording
+        self._tables = deque(recording.neighbours)
+
+    def setup(self) -> None:
+        self.nameservers = self._nameservers or []
+        self.adapters = []
+        self.network = IPv4Network(self._network)
+        if self._recording.router_ip:
+            self.router_ip = IPv4Address(self._recording.router_ip)
+
+    async def async_get_neighbour_states(
+        self, deadline: float | None = None
+    ) -> dict[str, Neighbour]:
+        if not self._tables:
+            return {}
+        table = self._tables.popleft() if len(self._tables) > 1 else self._tables[0]
+        await asyncio.sleep(table["latency"])
+        return {
+            ip: Neighbour(mac, state, age)
+            for ip, (mac, state, age) in table["states"].items()
+        }
+
+
+class ScanReplay:
+    """
+    Feed a recording back through DiscoverHosts.
+
+    PTR answers and neighbour tables are returned in the order they were
+    recorded, after their recorded latencies. Run the scans with
+    run_with_virtual_clock so the latencies pass without waiting while
+    loop.time() and the scan stats report the time they would have taken.
+    """
+
+    def __init__(self, recording: ScanRecording) -> None:
+        """Init the replay."""
+        self.recording = recording
+        self._answers = {
+            nameserver: {name: deque(attempts) for name, attempts in answers.items()}
+            for nameserver, answers in recording.ptr.items()
+        }
+
+    def resolver_factory(self, nameservers: list[str], timeout: float) -> Any:
+        """Create a replaying resolver, called like DNSResolver."""
+        return _ReplayResolver(self._answers.get(nameservers[0], {}), timeout)
+
+    def create_discover_hosts(
+        self, arp_prober: ArpProber | None = None, **kwargs: Any
+    ) -> DiscoverHosts:
+        """Create a DiscoverHosts that scans the recording."""
+        sys_network_data = _ReplayNetworkData(self.recording, arp_prober)
+        sys_network_data.setup()
+        return DiscoverHosts(
+            resolver_factory=self.resolver_factory,
+            sys_network_data=sys_network_data,
+            **kwargs,
+        )
+
+
+class _VirtualClockSelector(selectors.BaseSelector):
+    """Poll for I/O and advance the clock instead of waiting for timers."""
+
+    def __init__(self, loop: VirtualClockEventLoop) -> None:
+        self._loop = loop
+        self._selector = selectors.DefaultSelector()
+
+    def register(
+        self, fileobj: Any, events: int, data: Any = None
+    ) -> selectors.SelectorKey:
+        return self._selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj: Any) -> selectors.SelectorKey:
+        return self._selector.unregister(fileobj)
+
+    def modify(
+        self, fileobj: Any, events: int, data: Any = None
+    ) -> selectors.SelectorKey:
+        return self._selector.modify(fileobj, events, data)
+
+    def select(
+        self, timeout: float | None = None
+    ) -> list[tuple[selectors.SelectorKey, int]]:
+        if (ready := self._selector.select(0)) or (
+            timeout is not None and timeout <= 0
+        ):
+            return ready
+        if timeout is None:
+            # Nothing is scheduled, wait for a thread or real I/O
+            return self._selector.select(None)
+        self._loop.advance(timeout)
+        return []
+
+    def close(self) -> None:
+        self._selector.close()
+
+    def get_map(self) -> Any:
+        return self._selector.get_map()
+
+
+class VirtualClockEventLoop(asyncio.SelectorEventLoop):
+    """
+    An event loop whose clock only moves when the loop would otherwise wait.
+
+    Timers run in order without real waiting, so a replay of a slow network
+    takes as long as the CPU needs while loop.time() moves as it would have
+    on the network. Work in the executor does not stop the clock, so the
+    replayed scans avoid it.
+    """
+
+    def __init__(self) -> None:
+        """Init the loop at the current monotonic time."""
+        self._now = time.monotonic()
+        super().__init__(_VirtualClockSelector(self))
+
+    def time(self) -> float:
+        """Return the virtual time."""
+        return self._now
+
+    def advance(self, seconds: float) -> None:
+        """Move the clock forward."""
+        self._now += seconds
+
+
+def run_with_virtual_clock(main: Coroutine[Any, Any, _T]) -> _T:
+    """Run main to completion on a new VirtualClockEventLoop."""
+    loop = VirtualClockEventLoop()
+    try:
+        return loop.run_until_complete(main)
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
@@ -0,0 +1,306 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import stat
+import struct
+from collections import deque
+from contextlib import suppress
+from typing import TYPE_CHECKING, Any
+
+from .discovery import IP_ADDRESS, MAC_ADDRESS
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from .discovery import DiscoverHosts
+    from .snapshot import DiscoveryResult
+
+DEFAULT_SOCKET_PATH = "/run/aiodiscover.sock"
+DEFAULT_SCAN_INTERVAL = 300
+
+# Every frame is a big endian payload length followed by a JSON object
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+# Complete results kept to answer diff requests
+RESULT_HISTORY = 8
+
+OP_DISCOVER = "discover"
+OP_DIFF = "diff"
+OP_RESOLVE = "resolve"
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class DiscoveryServerError(Exception):
+    """The server could not handle a request."""
+
+
+async def async_read_frame(reader: asyncio.StreamReader) -> dict[str, Any]:
+    """Read one frame, raising IncompleteReadError when the peer is gone."""
+    (length,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {length} bytes exceeds {MAX_FRAME_SIZE}")
+    message = json.loads(await reader.readexactly(length))
+    if not isinstance(message, dict):
+        raise ValueError("Frame is not a JSON object")
+    return message
+
+
+def encode_frame(message: dict[str, Any]) -> bytes:
+    """Encode a message as a frame."""
+    payload = json.dumps(message, separators=(",", ":")).encode()
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def _host_key(host: dict[str, str]) -> str:
+    """Return what identifies a host across scans."""
+    return host.get(MAC_ADDRESS) or host[IP_ADDRESS]
+
+
+def diff_hosts(
+    old: Iterable[dict[str, str]], new: Iterable[dict[str, str]]
+) -> dict[str, list[dict[str, str]]]:
+    """Return the hosts that were added, removed or changed, keyed by MAC."""
+    old_hosts = {_host_key(host): host for host in old}
+    new_hosts = {_host_key(host): host for host in new}
+    return {
+        "added": [host for key, host in new_hosts.items() if key not in old_hosts],
+        "removed": [host for key, host in old_hosts.items() if key not in new_hosts],
+        "changed": [
+            host
+            for key, host in new_hosts.items()
+            if key in old_hosts and old_hosts[key] != host
+        ],
+    }
+
+
+def _result_to_json(result: DiscoveryResult) -> dict[str, Any]:
+    """Convert a result and its metadata to JSON types."""
+    return {
+        "hosts": list(result),
+        "timestamp": result.timestamp,
+        "stale": result.stale,
+        "partial": result.partial,
+    }
+
+
+class DiscoveryServer:
+    """
+    Serve one DiscoverHosts to local processes over a Unix socket.
+
+    A scan runs every scan_interval seconds and the requests of all
+    clients are answered from the same scanner, so hosts with several
+    consumers sweep the network once. discover requests get the latest
+    result of the background scans; only without a scan_interval, or
+    before the first scan completed, does a request start a scan. Each request and response is a
+    length prefixed JSON frame: {"id": 1, "op": "discover"} is answered
+    with {"id": 1, "ok": true, "result": {...}}.
+    """
+
+    def __init__(
+        self,
+        discover_hosts: DiscoverHosts,
+        path: str = DEFAULT_SOCKET_PATH,
+        scan_interval: float | None = DEFAULT_SCAN_INTERVAL,
+    ) -> None:
+        """Init the server."""
+        self.discover_hosts = discover_hosts
+        self.path = path
+        self.scan_interval = scan_interval
+        self._history: deque[DiscoveryResult] = deque(maxlen=RESULT_HISTORY)
+        self._server: asyncio.AbstractServer | None = None
+        self._scan_task: asyncio.Task[None] | None = None
+        # The handler task and writer of each connected client
+        self._clients: dict[asyncio.Task[Any], asyncio.StreamWriter] = {}
+        self._remove_listener = discover_hosts.async_add_listener(self._history.append)
+
+    async def async_start(self) -> None:
+        """Start listening and scanning."""
+        with suppress(FileNotFoundError):
+            if stat.S_ISSOCK(os.stat(self.path).st_mode):
+                # Left behind by a server that did not shut down cleanly
+                os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(
+            self._async_handle_client, self.path
+        )
+        if self.scan_interval:
+            self._scan_task = asyncio.get_running_loop().create_task(
+                self._async_scan_periodically(self.scan_interval)
+            )
+
+    async def async_stop(self) -> None:
+        """Stop listening and scanning."""
+        self._remove_listener()
+        if self._scan_task:
+            self._scan_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._scan_task
+            self._scan_task = None
+        if self._server:
+            self._server.close()
+            # Newer Pythons wait for the connections in wait_closed, and
+            # idle clients would otherwise keep theirs open forever
+            for task, writer in list(self._clients.items()):
+                writer.close()
+                task.cancel()
+            await asyncio.gather(*self._clients, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+            with suppress(FileNotFoundError):
+                os.unlink(self.path)
+
+    async def _async_scan_periodically(self, interval: float) -> None:
+        """Keep the shared result fresh."""
+        while True:
+            try:
+                await self.discover_hosts.async_discover()
+            except Exception:
+                _LOGGER.exception("Error running discovery")
+            await asyncio.sleep(interval)
+
+    async def _async_handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Answer the requests of one client until it disconnects."""
+        task = asyncio.current_task()
+        if TYPE_CHECKING:
+            assert task is not None
+        self._clients[task] = writer
+        try:
+            while True:
+                try:
+                    request = await async_read_frame(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except ValueError as ex:
+                    _LOGGER.debug("Closing connection after a bad frame: %s", ex)
+                    break
+                response: dict[str, Any] = {"id": request.get("id")}
+                try:
+                    response["result"] = await self._async_handle_request(request)
+                    response["ok"] = True
+                except DiscoveryServerError as ex:
+                    response["ok"] = False
+                    response["error"] = str(ex)
+                except Exception as ex:
+                    _LOGGER.exception("Error handling request %s", request)
+                    response["ok"] = False
+                    response["error"] = repr(ex)
+                writer.write(encode_frame(response))
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            # Cancelled by async_stop; the stream protocol reports a
+            # cancelled handler task as an error, so finish normally
+            pass
+        finally:
+            del self._clients[task]
+            writer.close()
+            with suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _async_handle_request(self, request: dict[str, Any]) -> Any:
+        """Dispatch a request to the scanner."""
+        op = request.get("op")
+        timeout = request.get("timeout")
+        if op == OP_DISCOVER:
+            if (
+                self.scan_interval
+                and (result := self.discover_hosts.last_result) is not None
+            ):
+                return _result_to_json(result)
+            return _result_to_json(await self.discover_hosts.async_discover(timeout))
+        if op == OP_DIFF:
+            return self._diff(request.get("since"))
+        if op == OP_RESOLVE:
+            ips = request.get("ips")
+            if not isinstance(ips, list):
+                raise DiscoveryServerError("resolve requires a list of ips")
+            return {"hosts": await self.discover_hosts.async_resolve(ips, timeout)}
+        raise DiscoveryServerError(f"Unknown op {op}")
+
+    def _diff(self, since: float | None) -> dict[str, Any]:
+        """
+        Diff the latest result against the result with timestamp since.
+
+        When since is not one of the recent results, every host is
+        reported as added with full set so the client starts over.
+        """
+        if not self._history:
+            latest = self.discover_hosts.last_result
+            if latest is None:
+                raise DiscoveryServerError("No discovery result yet")
+            self._history.append(latest)
+        latest = self._history[-1]
+        previous = next(
+            (result for result in self._history if result.timestamp == since), None
+        )
+        return {
+            "timestamp": latest.timestamp,
+            "full": previous is None,
+            **diff_hosts(previous or (), latest),
+        }
+
+
+class DiscoveryClient:
+    """A client for DiscoveryServer."""
+
+    def __init__(self, path: str = DEFAULT_SOCKET_PATH) -> None:
+        """Init the client."""
+        self.path = path
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._lock = asyncio.Lock()
+        self._request_id = 0
+
+    async def async_connect(self) -> None:
+        """Connect to the server."""
+        self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+
+    async def async_close(self) -> None:
+        """Disconnect from the server."""
+        if self._writer:
+            self._writer.close()
+            with suppress(ConnectionError):
+                await self._writer.wait_closed()
+        self._reader = self._writer = None
+
+    async def _async_request(self, op: str, **kwargs: Any) -> Any:
+        """Send a request and wait for its response."""
+        async with self._lock:
+            if not self._writer:
+                await self.async_connect()
+            if TYPE_CHECKING:
+                assert self._reader is not None and self._writer is not None
+            self._request_id += 1
+            try:
+                self._writer.write(
+                    encode_frame({"id": self._request_id, "op": op, **kwargs})
+                )
+                await self._writer.drain()
+                response = await async_read_frame(self._reader)
+            except BaseException:
+                # The stream is out of sync once a request is cut short
+                await self.async_close()
+                raise
+        if not response.get("ok"):
+            raise DiscoveryServerError(response.get("error"))
+        return response["result"]
+
+    async def async_discover(self, timeout: float | None = None) -> dict[str, Any]:
+        """Return the hosts, timestamp, stale and partial of a discovery."""
+        return await self._async_request(OP_DISCOVER, timeout=timeout)
+
+    async def async_diff(self, since: float | None = None) -> dict[str, Any]:
+        """Return the changes since the result with timestamp since."""
+        return await self._async_request(OP_DIFF, since=since)
+
+    async def async_resolve(
+        self, ips: list[str], timeout: float | None = None
+    ) -> list[dict[str, str]]:
+        """Look up a few ips without a network sweep."""
+        result = await self._async_request(OP_RESOLVE, ips=ips, timeout=timeout)
+        return result["hosts"]
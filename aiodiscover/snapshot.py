@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from typing import Any
+
+SNAPSHOT_VERSION = 1
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class DiscoveryResult(list[dict[str, str]]):
+    """
+    The hosts found by a discovery scan.
+
+    This is a plain list of host dicts with metadata about when the scan
+    completed, whether it was served from a previous scan and whether the
+    scan ran out of time before every phase completed.
+    """
+
+    def __init__(
+        self,
+        hosts: Any = (),
+        timestamp: float | None = None,
+        stale: bool = False,
+        partial: bool = False,
+    ) -> None:
+        """Init the result."""
+        super().__init__(hosts)
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.stale = stale
+        self.partial = partial
+
+    @property
+    def age(self) -> float:
+        """Seconds since the scan that produced this result completed."""
+        return max(time.time() - self.timestamp, 0.0)
+
+    def copy(self) -> DiscoveryResult:
+        """Return a copy whose hosts can be changed without affecting this one."""
+        return DiscoveryResult(
+            [dict(host) for host in self], self.timestamp, self.stale, self.partial
+        )
+
+    def as_stale(self) -> DiscoveryResult:
+        """Return a copy flagged as served from a previous scan."""
+        return DiscoveryResult(
+            [dict(host) for host in self], self.timestamp, stale=True
+        )
+
+
+def load_snapshot(path: str) -> DiscoveryResult | None:
+    """Load a result previously saved with save_snapshot."""
+    try:
+        with open(path) as file:
+            data = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as ex:
+        _LOGGER.debug("Ignoring unreadable snapshot %s: %s", path, ex)
+        return None
+    if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+        _LOGGER.debug("Ignoring snapshot %s with unknown version", path)
+        return None
+    hosts = data.get("hosts")
+    timestamp = data.get("timestamp")
+    if (
+        not isinstance(hosts, list)
+        or not all(isinstance(host, dict) for host in hosts)
+        or not isinstance(timestamp, (int, float))
+        or isinstance(timestamp, bool)
+    ):
+        _LOGGER.debug("Ignoring malformed snapshot %s", path)
+        return None
+    return DiscoveryResult(hosts, timestamp)
+
+
+def save_snapshot(path: str, result: DiscoveryResult) -> None:
+    """Atomically save a result so it survives a restart."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(
+            {
+                "version": SNAPSHOT_VERSION,
+                "timestamp": result.timestamp,
+                "hosts": list(result),
+            },
+            file,
+        )
+    os.replace(tmp_path, path)
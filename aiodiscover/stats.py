@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+
+PHASE_SETUP = "setup"
+PHASE_LEASES = "leases"
+PHASE_PTR = "ptr"
+PHASE_NEIGHBOURS = "neighbours"
+PHASE_PROVIDERS = "providers"
+
+ADDRESSES = "addresses"
+HOSTNAMES = "hostnames"
+NEIGHBOURS = "neighbours"
+HOSTS = "hosts"
+
+# How often the loop lag monitor checks in
+LOOP_LAG_INTERVAL = 0.05
+
+
+class ScanStats:
+    """How long each phase of a scan took and what it found."""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        """Init empty stats timed with clock."""
+        self._clock = clock
+        self.started = clock()
+        self.finished: float | None = None
+        # Seconds spent in each phase, in the order they ran
+        self.phases: dict[str, float] = {}
+        self.counters: dict[str, int] = {}
+        # Longest time the event loop was late running a callback
+        self.max_loop_lag = 0.0
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time a phase; a phase that runs more than once is summed."""
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + self._clock() - start
+
+    def count(self, name: str, value: int) -> None:
+        """Add to a counter."""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self) -> None:
+        """Mark the scan as finished."""
+        self.finished = self._clock()
+
+    @property
+    def duration(self) -> float:
+        """Seconds from the start to the end of the scan, or until now."""
+        return (self.finished or self._clock()) - self.started
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the stats as JSON types."""
+        return {
+            "duration": self.duration,
+            "phases": dict(self.phases),
+            "counters": dict(self.counters),
+            "max_loop_lag": self.max_loop_lag,
+        }
+
+
+class LoopLagMonitor:
+    """
+    Measure how late the event loop runs a periodic timer.
+
+    The lag is whatever blocked the loop while the monitor ran, so it
+    includes other tasks sharing the loop as well as the scan itself.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL) -> None:
+        """Init the monitor."""
+        self._loop = asyncio.get_running_loop()
+        self.interval = interval
+        self.max_lag = 0.0
+        self._expected = 0.0
+        self._handle: asyncio.TimerHandle | None = None
+
+    def start(self) -> None:
+        """Start measuring."""
+        self._schedule()
+
+    def stop(self) -> float:
+        """Stop measuring and return the largest lag seen."""
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+            self._record()
+        return self.max_lag
+
+    def _schedule(self) -> None:
+        self._expected = self._loop.time() + self.interval
+        self._handle = self._loop.call_at(self._expected, self._tick)
+
+    def _record(self) -> None:
+        self.max_lag = max(self.max_lag, self._loop.time() - self._expected)
+
+    def _tick(self) -> None:
+        self._record()
+        self._schedule()
@@ -1 +1,12 @@
 #!/usr/bin/env python
+from collections.abc import Iterator
+from unittest.mock import patch
+
+import pytest
+
+
+@pytest.fixture
+def no_ip_route() -> Iterator[None]:
+    """Fall back to the arp command instead of opening a netlink socket."""
+    with patch("pyroute2.iproute.IPRoute", side_effect=OSError):
+        yield
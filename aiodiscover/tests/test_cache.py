@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+import random
+import sys
+import threading
+from ipaddress import IPv4Address
+from unittest.mock import patch
+
+import pytest
+
+from aiodiscover import discovery
+from aiodiscover.cache import (
+    IP_ADDRESS_CACHE,
+    BoundedCache,
+    BoundedSet,
+    CacheInfo,
+    cache_info,
+    register_cache,
+    set_cache_limit,
+)
+
+
+def test_bounded_cache() -> None:
+    """Verify least recently used entries are evicted and lookups counted."""
+    cache: BoundedCache[str, int] = BoundedCache("test", 2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("b") is None
+    assert list(cache) == ["a", "c"]
+    assert cache.info() == CacheInfo(hits=1, misses=1, evictions=1, size=2, maxsize=2)
+
+    cache.resize(1)
+    assert list(cache) == ["c"]
+    assert cache.info().evictions == 2
+    with pytest.raises(ValueError):
+        cache.resize(0)
+
+
+def test_bounded_set() -> None:
+    """Verify the set compares like a set and stays bounded."""
+    members: BoundedSet[str] = BoundedSet("test", 2)
+    members.update(["a", "b", "c"])
+    assert members == {"b", "c"}
+    assert "a" not in members
+    assert "c" in members
+    assert members.info() == CacheInfo(hits=1, misses=1, evictions=1, size=2, maxsize=2)
+    members.clear()
+    assert members == set()
+
+
+def test_cache_info_and_limits() -> None:
+    """Verify module level caches are reported and can be resized."""
+    cache: BoundedCache[str, int] = register_cache(BoundedCache("test_limits", 8))
+    cache.set("a", 1)
+    cache.set("b", 2)
+    info = cache_info()
+    assert info["test_limits"].size == 2
+    assert "idna" in info
+    assert info[IP_ADDRESS_CACHE].evictions is None
+
+    set_cache_limit("test_limits", 1)
+    assert list(cache) == ["b"]
+    with pytest.raises(ValueError, match="fixed size"):
+        set_cache_limit(IP_ADDRESS_CACHE, 1)
+
+
+def test_decode_idna_cache() -> None:
+    """Verify idna names are decoded once."""
+    before = cache_info()["idna"]
+    assert discovery.decode_idna("xn--bcher-kva.example") == "bücher.example"
+    assert discovery.decode_idna("xn--bcher-kva.example") == "bücher.example"
+    after = cache_info()["idna"]
+    assert after.hits - before.hits >= 1
+
+
+@pytest.mark.asyncio
+async def test_discover_hosts_cache_info() -> None:
+    """Verify failed nameservers are bounded and reported per scanner."""
+    discover_hosts = discovery.DiscoverHosts()
+    with patch.object(discovery, "MAX_FAILED_NAMESERVERS", 1):
+        bounded = discovery.DiscoverHosts()
+    bounded._failed_nameservers.update(
+        [IPv4Address("10.0.0.1"), IPv4Address("10.0.0.2")]
+    )
+    assert bounded._failed_nameservers == {IPv4Address("10.0.0.2")}
+    info = discover_hosts.cache_info()
+    assert info["failed_nameservers"].maxsize == discovery.MAX_FAILED_NAMESERVERS
+    assert "idna" in info
+
+
+def test_bounded_cache_threads() -> None:
+    """Verify lookups and evictions from several threads do not race."""
+    cache: BoundedCache[str, int] = BoundedCache("test_threads", 64)
+    keys = [f"10.0.0.{idx}" for idx in range(128)]
+    errors: list[Exception] = []
+
+    def _use(seed: int) -> None:
+        randrange = random.Random(seed).randrange  # noqa: S311
+        try:
+            for value in range(100000):
+                if cache.get(key := keys[randrange(128)]) is None:
+                    cache.set(key, value)
+        except Exception as ex:
+            errors.append(ex)
+
+    threads = [threading.Thread(target=_use, args=(seed,)) for seed in range(4)]
+    # Switch threads often to give a race the chance to happen
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert errors == []
+    assert len(cache) == 64
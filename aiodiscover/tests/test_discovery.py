@@ -1,15 +1,24 @@
 #!/usr/bin/env python
 import asyncio
+import json
 import sys
+import time
 from dataclasses import dataclass
 from ipaddress import IPv4Address, IPv4Network
+from pathlib import Path
 from typing import Any
 from unittest.mock import patch
 
 import pytest
 
 from aiodiscover import discovery
+from aiodiscover.leases import DNSMASQ, LeaseFile
 from aiodiscover.network import SystemNetworkData
+from aiodiscover.oui import OUIDatabase, build_oui_database
+from aiodiscover.providers import HostnameProvider
+from aiodiscover.snapshot import DiscoveryResult, load_snapshot
+from aiodiscover.stats import LoopLagMonitor
+from aiodiscover.util import LoopBudget
 
 if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
@@ -49,7 +58,9 @@ async def test_async_discover_hosts_with_dns_mock_neighbor_mock() -> None:
     """Verify discover hosts does not throw."""
     discover_hosts = discovery.DiscoverHosts()
 
-    async def _async_get_hostnames(sys_network_data: Any) -> dict[str, str]:
+    async def _async_get_hostnames(
+        sys_network_data: Any, deadline: float | None = None
+    ) -> dict[str, str]:
         return {"1.2.3.4": "router", "4.5.5.6": "any"}
 
     discover_hosts.async_get_hostnames = _async_get_hostnames  # type: ignore
@@ -207,6 +218,43 @@ async def test_async_query_for_ptrs_chunked() -> None:
     assert response[2].name == "name3"  # type: ignore
 
 
+@pytest.mark.asyncio
+async def test_async_query_for_ptrs_options() -> None:
+    """Verify the bucket size and timeout passed to async_query_for_ptrs are used."""
+    loop = asyncio.get_running_loop()
+    timeouts: list[float] = []
+
+    @dataclass
+    class MockReply:
+        name: str
+
+    class MockResolver:
+        def __init__(self, nameservers: list[str], timeout: float) -> None:
+            timeouts.append(timeout)
+
+        def query(self, *args: Any, **kwargs: Any) -> Any:
+            future = loop.create_future()
+            future.set_result(MockReply(name="name"))
+            return future
+
+        def cancel(self) -> None:
+            pass
+
+    ips = [IPv4Address(f"192.168.107.{idx}") for idx in range(2, 7)]
+    with patch.object(discovery, "chunked", wraps=discovery.chunked) as mock_chunked:
+        response = await discovery.async_query_for_ptrs(
+            "192.168.107.1",
+            ips,
+            resolver_factory=MockResolver,
+            query_bucket_size=2,
+            dns_timeout=0.5,
+        )
+
+    assert len(response) == 5
+    assert timeouts == [0.5]
+    mock_chunked.assert_called_once_with(ips, 2)
+
+
 @pytest.mark.asyncio
 async def test_async_get_hostnames_no_results() -> None:
     """Verify async_get_hostnames with no results."""
@@ -282,8 +330,9 @@ async def test_async_get_hostnames_partial_responding() -> None:
     ):
         hostnames = await discover_hosts.async_get_hostnames(net_data)
 
+    # The router is looked up first
     assert hostnames == {
-        "192.168.0.0": "xyz",
+        "192.168.0.1": "xyz",
     }
     assert discover_hosts._failed_nameservers == set()
 
@@ -296,7 +345,8 @@ async def test_async_get_hostnames_first_nameserver_fails() -> None:
     net_data.router_ip = IPv4Address("192.168.0.1")
     net_data.network = IPv4Network("192.168.0.0/31")
     net_data.nameservers = [IPv4Address("172.0.0.3"), IPv4Address("172.0.0.4")]
-    hosts = list(net_data.network.hosts())
+    # The router is looked up first
+    hosts = [IPv4Address("192.168.0.1"), IPv4Address("192.168.0.0")]
     subnet_size = len(hosts)
 
     queries: list[tuple[str, list[IPv4Address]]] = []
@@ -304,6 +354,8 @@ async def test_async_get_hostnames_first_nameserver_fails() -> None:
     async def _mock_query_for_ptrs(
         nameserver: str,
         ips_to_lookup: list[IPv4Address],
+        deadline: float | None = None,
+        **kwargs: Any,
     ) -> Any:
         queries.append((nameserver, ips_to_lookup))
         if nameserver == str(IPv4Address("172.0.0.4")):
@@ -354,6 +406,71 @@ async def test_async_get_hostnames_first_nameserver_fails() -> None:
         assert discover_hosts._failed_nameservers == {IPv4Address("172.0.0.3")}
 
 
+def test_order_by_likelihood() -> None:
+    """Test known and likely addresses are ordered first."""
+    network = IPv4Network("192.168.0.0/24")
+    ordered = discovery.order_by_likelihood(
+        network,
+        IPv4Address("192.168.0.1"),
+        ["192.168.0.77", "192.168.0.5", "10.0.0.5", "fe80::1"],
+        ["192.168.0.150", "192.168.0.5", "not an ip"],
+    )
+    assert [str(ip) for ip in ordered[:5]] == [
+        "192.168.0.1",
+        "192.168.0.5",
+        "192.168.0.77",
+        "192.168.0.150",
+        "192.168.0.100",
+    ]
+    # The DHCP pools follow, then the rest in numeric order
+    assert ordered[102] == IPv4Address("192.168.0.199")
+    assert ordered[103] == IPv4Address("192.168.0.2")
+    assert ordered[-1] == IPv4Address("192.168.0.254")
+    assert sorted(ordered) == list(network.hosts())
+
+
+@pytest.mark.asyncio
+async def test_async_get_hostnames_known_ips_first() -> None:
+    """Verify neighbours and the previous result are looked up first."""
+    discover_hosts = discovery.DiscoverHosts()
+    discover_hosts._last_result = DiscoveryResult(
+        [{discovery.IP_ADDRESS: "192.168.0.6"}]
+    )
+    net_data = SystemNetworkData(None, None)
+    net_data.router_ip = IPv4Address("192.168.0.1")
+    net_data.network = IPv4Network("192.168.0.0/29")
+    net_data.nameservers = [IPv4Address("172.0.0.3")]
+    queries: list[list[IPv4Address]] = []
+
+    async def _mock_query_for_ptrs(
+        nameserver: str,
+        ips_to_lookup: list[IPv4Address],
+        deadline: float | None = None,
+        **kwargs: Any,
+    ) -> Any:
+        queries.append(ips_to_lookup)
+        return [MockReply(name="xyz.org")] * len(ips_to_lookup)
+
+    with (
+        patch.object(
+            net_data,
+            "async_get_neighbours",
+            return_value={"192.168.0.4": "aa:bb:cc:dd:ee:ff"},
+        ),
+        patch("aiodiscover.discovery.async_query_for_ptrs", _mock_query_for_ptrs),
+    ):
+        await discover_hosts.async_get_hostnames(net_data)
+
+    assert [str(ip) for ip in queries[0]] == [
+        "192.168.0.1",
+        "192.168.0.4",
+        "192.168.0.6",
+        "192.168.0.2",
+        "192.168.0.3",
+        "192.168.0.5",
+    ]
+
+
 @pytest.mark.asyncio
 async def test_cache_clear() -> None:
     """Verify async_get_hostnames when the first nameserver fails."""
@@ -364,7 +481,7 @@ async def test_cache_clear() -> None:
         net_data.router_ip = IPv4Address("192.168.0.1")
         net_data.network = IPv4Network("192.168.0.0/31")
         net_data.nameservers = [IPv4Address("172.0.0.3"), IPv4Address("172.0.0.4")]
-        discover_hosts._failed_nameservers = {IPv4Address("172.0.0.3")}
+        discover_hosts._failed_nameservers.add(IPv4Address("172.0.0.3"))
         assert discover_hosts._last_cache_clear == 0
         discover_hosts._cleanup_cache()
         assert discover_hosts._failed_nameservers == {IPv4Address("172.0.0.3")}
@@ -374,3 +491,689 @@ async def test_cache_clear() -> None:
         mock_time.return_value = discovery.CACHE_CLEAR_INTERVAL + 10
         discover_hosts._cleanup_cache()
         assert discover_hosts._failed_nameservers == set()
+
+
+@pytest.mark.asyncio
+async def test_async_discover_hosts_with_hostname_providers(no_ip_route: None) -> None:
+    """Verify hostname providers fill in neighbours without a PTR record."""
+    queried: list[list[str]] = []
+
+    class _Provider(HostnameProvider):
+        name = "mock"
+
+        def __init__(self, hostnames: dict[str, str]) -> None:
+            self.hostnames = hostnames
+
+        async def async_get_hostnames(self, ips: list[str]) -> dict[str, str]:
+            queried.append(ips)
+            return {ip: self.hostnames[ip] for ip in ips if ip in self.hostnames}
+
+    class _FailingProvider(HostnameProvider):
+        async def async_get_hostnames(self, ips: list[str]) -> dict[str, str]:
+            raise OSError
+
+    discover_hosts = discovery.DiscoverHosts(
+        hostname_providers=[
+            _FailingProvider(),
+            _Provider({"1.2.3.5": "mdns-name"}),
+            _Provider({"1.2.3.5": "ignored", "1.2.3.6": "netbios-name"}),
+        ]
+    )
+
+    async def _async_get_hostnames(
+        sys_network_data: Any, deadline: float | None = None
+    ) -> dict[str, str]:
+        return {"1.2.3.4": "router"}
+
+    discover_hosts.async_get_hostnames = _async_get_hostnames  # type: ignore
+    with (
+        patch(
+            "aiodiscover.network.SystemNetworkData.async_get_neighbours",
+            return_value={
+                "1.2.3.4": "aa:bb:cc:dd:ee:ff",
+                "1.2.3.5": "aa:bb:cc:dd:ee:01",
+                "1.2.3.6": "aa:bb:cc:dd:ee:02",
+                "1.2.3.7": "aa:bb:cc:dd:ee:03",
+                "5.6.7.8": "aa:bb:cc:dd:ee:04",
+            },
+        ),
+        patch(
+            "aiodiscover.network.get_network",
+            return_value=IPv4Network("1.2.3.0/24", False),
+        ),
+    ):
+        hosts = await discover_hosts.async_discover()
+
+    # Only in-network neighbours without a PTR record are queried
+    assert queried == [["1.2.3.5", "1.2.3.6", "1.2.3.7"]] * 2
+    assert hosts == [
+        {"hostname": "router", "ip": "1.2.3.4", "macaddress": "aa:bb:cc:dd:ee:ff"},
+        {"hostname": "mdns-name", "ip": "1.2.3.5", "macaddress": "aa:bb:cc:dd:ee:01"},
+        {
+            "hostname": "netbios-name",
+            "ip": "1.2.3.6",
+            "macaddress": "aa:bb:cc:dd:ee:02",
+        },
+    ]
+
+
+@pytest.mark.asyncio
+async def test_async_discover_hosts_from_lease_files(
+    tmp_path: Path, no_ip_route: None
+) -> None:
+    """Verify lease files replace the PTR sweep."""
+    path = tmp_path / "dnsmasq.leases"
+    path.write_text(
+        "0 aa:bb:cc:dd:ee:01 1.2.3.4 router *\n"
+        "0 aa:bb:cc:dd:ee:02 1.2.3.5 laptop *\n"
+        "0 aa:bb:cc:dd:ee:03 1.2.3.6 * *\n"
+        "0 aa:bb:cc:dd:ee:04 5.6.7.8 remote *\n"
+    )
+    discover_hosts = discovery.DiscoverHosts(
+        lease_files=[LeaseFile(str(path), DNSMASQ)]
+    )
+    with (
+        patch(
+            "aiodiscover.network.SystemNetworkData.async_get_neighbours",
+            return_value={
+                "1.2.3.4": "aa:bb:cc:dd:ee:ff",
+                "1.2.3.6": "aa:bb:cc:dd:ee:03",
+                "5.6.7.8": "aa:bb:cc:dd:ee:04",
+            },
+        ) as mock_get_neighbours,
+        patch(
+            "aiodiscover.network.get_network",
+            return_value=IPv4Network("1.2.3.0/24", False),
+        ),
+        patch.object(discover_hosts, "async_get_hostnames") as mock_get_hostnames,
+    ):
+        hosts = await discover_hosts.async_discover()
+
+    assert not mock_get_hostnames.called
+    assert mock_get_neighbours.call_args[0][0] == ()
+    # The laptop still has a lease but is no longer a neighbour
+    assert hosts == [
+        {"hostname": "router", "ip": "1.2.3.4", "macaddress": "aa:bb:cc:dd:ee:ff"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_async_discover_stale_while_revalidate(
+    tmp_path: Path, no_ip_route: None
+) -> None:
+    """Verify the last result is returned while a refresh runs in the background."""
+    snapshot_path = str(tmp_path / "snapshot.json")
+    scans: list[asyncio.Event] = []
+
+    async def _async_get_hostnames(
+        sys_network_data: Any, deadline: float | None = None
+    ) -> dict[str, str]:
+        event = asyncio.Event()
+        scans.append(event)
+        if len(scans) == 2:
+            await event.wait()
+        return {"1.2.3.4": f"router{len(scans)}"}
+
+    with (
+        patch(
+            "aiodiscover.network.SystemNetworkData.async_get_neighbours",
+            return_value={"1.2.3.4": "aa:bb:cc:dd:ee:ff"},
+        ),
+        patch(
+            "aiodiscover.network.get_network",
+            return_value=IPv4Network("1.2.3.0/24", False),
+        ),
+    ):
+        discover_hosts = discovery.DiscoverHosts(
+            stale_while_revalidate=True, snapshot_path=snapshot_path
+        )
+        discover_hosts.async_get_hostnames = _async_get_hostnames  # type: ignore
+        results: list[DiscoveryResult] = []
+        remove_listener = discover_hosts.async_add_listener(results.append)
+
+        # Nothing cached yet, so the first call scans
+        hosts = await discover_hosts.async_discover()
+        assert hosts == [
+            {"hostname": "router1", "ip": "1.2.3.4", "macaddress": "aa:bb:cc:dd:ee:ff"}
+        ]
+        assert hosts.stale is False
+        assert results == [hosts]
+        assert discover_hosts.last_result == hosts
+
+        # The second call returns the cached result and refreshes it
+        stale_hosts = await discover_hosts.async_discover()
+        assert stale_hosts == hosts
+        assert stale_hosts.stale is True
+        assert stale_hosts.timestamp == hosts.timestamp
+        assert stale_hosts.age >= 0
+        await asyncio.sleep(0)
+        assert len(scans) == 2
+        # A refresh is already running so no additional scan is started
+        await discover_hosts.async_discover()
+        await asyncio.sleep(0)
+        assert len(scans) == 2
+        scan_task = discover_hosts._scan_task
+        assert scan_task is not None
+        scans[1].set()
+        assert await scan_task is results[-1]
+        assert results[-1][0]["hostname"] == "router2"
+        await asyncio.sleep(0)
+        assert discover_hosts._scan_task is None
+        remove_listener()
+
+        # A new instance loads the snapshot without scanning
+        new_discover_hosts = discovery.DiscoverHosts(
+            stale_while_revalidate=True, snapshot_path=snapshot_path
+        )
+        new_discover_hosts.async_get_hostnames = _async_get_hostnames  # type: ignore
+        hosts = await new_discover_hosts.async_discover()
+        assert hosts.stale is True
+        assert hosts[0]["hostname"] == "router2"
+        refresh_task = new_discover_hosts._scan_task
+        assert refresh_task is not None
+        assert (await refresh_task)[0]["hostname"] == "router3"
+
+
+def test_load_snapshot_invalid(tmp_path: Path) -> None:
+    """Verify unreadable snapshots are ignored."""
+    path = tmp_path / "snapshot.json"
+    assert load_snapshot(str(path)) is None
+    path.write_text("not json")
+    assert load_snapshot(str(path)) is None
+    path.write_text('{"version": 0}')
+    assert load_snapshot(str(path)) is None
+    for data in (
+        {"version": 1},
+        {"version": 1, "hosts": []},
+        {"version": 1, "hosts": "hosts", "timestamp": 1.0},
+        {"version": 1, "hosts": [["1.2.3.4"]], "timestamp": 1.0},
+        {"version": 1, "hosts": [], "timestamp": "now"},
+    ):
+        path.write_text(json.dumps(data))
+        assert load_snapshot(str(path)) is None
+
+
+@pytest.mark.asyncio
+async def test_async_discover_single_flight(no_ip_route: None) -> None:
+    """Verify concurrent callers share one scan and one setup job."""
+    scan_count = 0
+    release = asyncio.Event()
+
+    async def _async_get_hostnames(
+        sys_network_data: Any, deadline: float | None = None
+    ) -> dict[str, str]:
+        nonlocal scan_count
+        scan_count += 1
+        await release.wait()
+        return {"1.2.3.4": f"router{scan_count}"}
+
+    discover_hosts = discovery.DiscoverHosts(min_scan_interval=60)
+    discover_hosts.async_get_hostnames = _async_get_hostnames  # type: ignore
+    with (
+        patch(
+            "aiodiscover.network.SystemNetworkData.async_get_neighbours",
+            return_value={"1.2.3.4": "aa:bb:cc:dd:ee:ff"},
+        ),
+        patch(
+            "aiodiscover.network.get_network",
+            return_value=IPv4Network("1.2.3.0/24", False),
+        ),
+        patch.object(
+            discover_hosts,
+            "_setup_sys_network_data",
+            wraps=discover_hosts._setup_sys_network_data,
+        ) as mock_setup,
+    ):
+        tasks = [asyncio.create_task(discover_hosts.async_discover()) for _ in range(3)]
+        # A cancelled caller does not cancel the shared scan
+        await asyncio.sleep(0)
+        tasks[0].cancel()
+        while not scan_count:
+            await asyncio.sleep(0.01)
+        release.set()
+        first, second = await asyncio.gather(*tasks[1:])
+        assert tasks[0].cancelled()
+        # Each caller gets its own copy of the shared result
+        assert first == second
+        assert first is not second
+        assert first[0] is not second[0]
+        assert first[0]["hostname"] == "router1"
+        assert scan_count == 1
+        assert mock_setup.call_count == 1
+
+        # Within the minimum interval the cached result is returned
+        first.clear()
+        assert await discover_hosts.async_discover() == second
+        assert scan_count == 1
+
+        last_result = discover_hosts.last_result
+        assert last_result is not None
+        last_result.timestamp -= 61
+        third = await discover_hosts.async_discover()
+        assert third[0]["hostname"] == "router2"
+        assert scan_count == 2
+        assert mock_setup.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_sys_network_data_setup_failure_is_retried() -> None:
+    """Verify a failed setup job is not cached."""
+    discover_hosts = discovery.DiscoverHosts()
+    with (
+        patch.object(
+            discover_hosts, "_setup_sys_network_data", side_effect=OSError
+        ) as mock_setup,
+        pytest.raises(OSError),
+    ):
+        await discover_hosts.async_discover()
+    assert discover_hosts._sys_network_data_future is None
+    assert discover_hosts._scan_task is None
+    assert mock_setup.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_async_query_for_ptrs_deadline() -> None:
+    """Test async_query_for_ptrs stops waiting at the deadline."""
+    loop = asyncio.get_running_loop()
+    futures: list[asyncio.Future[Any]] = []
+
+    def mock_query(*args: Any, **kwargs: Any) -> Any:
+        future = loop.create_future()
+        if not futures:
+            future.set_result(MockReply(name="name1"))
+        futures.append(future)
+        return future
+
+    with (
+        patch("aiodiscover.discovery.DNSResolver.query", mock_query),
+        patch.object(discovery, "QUERY_BUCKET_SIZE", 2),
+    ):
+        response = await discovery.async_query_for_ptrs(
+            "192.168.107.1",
+            [
+                IPv4Address("192.168.107.2"),
+                IPv4Address("192.168.107.3"),
+                IPv4Address("192.168.107.4"),
+            ],
+            loop.time() + 0.05,
+        )
+
+    # The second chunk is never sent since the deadline passed
+    assert len(futures) == 2
+    assert len(response) == 3
+    assert response[0].name == "name1"  # type: ignore
+    assert response[1:] == [None, None]
+
+
+def test_rtt_estimator() -> None:
+    """Test the timeout follows the observed round trip times."""
+    estimator = discovery.RTTEstimator(floor=0.1, ceiling=2)
+    assert estimator.percentile(0.95) is None
+    assert estimator.timeout() == 2
+    for _ in range(discovery.RTT_MIN_SAMPLES):
+        estimator.add(0.001)
+    assert len(estimator) == discovery.RTT_MIN_SAMPLES
+    # A fast LAN is clamped to the floor
+    assert estimator.timeout() == 0.1
+    for _ in range(100):
+        estimator.add(0.3)
+    assert estimator.percentile(0.95) == 0.3
+    assert estimator.timeout() == pytest.approx(0.9)
+    for _ in range(discovery.RTT_MAX_SAMPLES):
+        estimator.add(1)
+    assert len(estimator) == discovery.RTT_MAX_SAMPLES
+    assert estimator.timeout() == 2
+
+
+@pytest.mark.asyncio
+async def test_async_query_for_ptrs_retries_timed_out() -> None:
+    """Test queries without an answer are retried once."""
+    loop = asyncio.get_running_loop()
+    queried: list[str] = []
+
+    def mock_query(self: Any, name: str, query_type: str) -> Any:
+        future = loop.create_future()
+        # The first query for .3 is lost
+        if name != "3.107.168.192.in-addr.arpa" or name in queried:
+            future.set_result(MockReply(name=name.partition(".")[0]))
+        queried.append(name)
+        return future
+
+    with (
+        patch("aiodiscover.discovery.DNSResolver.query", mock_query),
+        patch.object(discovery, "DNS_RESPONSE_TIMEOUT", 0.05),
+        patch.object(discovery, "QUERY_BUCKET_SIZE", 2),
+    ):
+        response = await discovery.async_query_for_ptrs(
+            "192.168.107.1",
+            [
+                IPv4Address("192.168.107.2"),
+                IPv4Address("192.168.107.3"),
+                IPv4Address("192.168.107.4"),
+            ],
+        )
+
+    assert queried.count("3.107.168.192.in-addr.arpa") == 2
+    assert len(queried) == 4
+    assert [reply.name for reply in response] == ["2", "3", "4"]  # type: ignore
+
+
+@pytest.mark.asyncio
+async def test_async_query_for_ptrs_no_retry_when_nameserver_down() -> None:
+    """Test queries are not retried when the nameserver does not answer."""
+    loop = asyncio.get_running_loop()
+    queried: list[str] = []
+
+    def mock_query(self: Any, name: str, query_type: str) -> Any:
+        queried.append(name)
+        return loop.create_future()
+
+    ips = [IPv4Address(f"192.168.107.{idx}") for idx in range(2, 6)]
+    with (
+        patch("aiodiscover.discovery.DNSResolver.query", mock_query),
+        patch.object(discovery, "DNS_RESPONSE_TIMEOUT", 0.05),
+        patch.object(discovery, "QUERY_BUCKET_SIZE", 2),
+    ):
+        response = await discovery.async_query_for_ptrs("192.168.107.1", ips)
+
+    assert len(queried) == 4
+    assert response == [None] * 4
+
+
+@pytest.mark.asyncio
+async def test_async_discover_timeout_partial(no_ip_route: None) -> None:
+    """Verify a scan that runs out of time returns the resolved hosts."""
+    loop = asyncio.get_running_loop()
+
+    def mock_query(resolver: Any, name: str, *args: Any, **kwargs: Any) -> Any:
+        future = loop.create_future()
+        if name == "4.3.2.1.in-addr.arpa":
+            future.set_result(MockReply(name="router.local"))
+        return future
+
+    discover_hosts = discovery.DiscoverHosts()
+    with (
+        patch(
+            "aiodiscover.network.SystemNetworkData.async_get_neighbours",
+            return_value={"1.2.3.4": "aa:bb:cc:dd:ee:ff"},
+        ),
+        patch(
+            "aiodiscover.network.get_network",
+            return_value=IPv4Network("1.2.3.0/29", False),
+        ),
+        patch(
+            "aiodiscover.network.load_resolv_conf",
+            return_value=[IPv4Address("192.168.0.53")],
+        ),
+        patch("aiodiscover.discovery.DNSResolver.query", mock_query),
+    ):
+        start = loop.time()
+        hosts = await discover_hosts.async_discover(timeout=0.5)
+
+    assert loop.time() - start < discovery.DNS_RESPONSE_TIMEOUT
+    assert hosts == [
+        {"hostname": "router", "ip": "1.2.3.4", "macaddress": "aa:bb:cc:dd:ee:ff"}
+    ]
+    assert hosts.partial is True
+    # Partial results do not replace the last complete result
+    assert discover_hosts.last_result is None
+
+
+@pytest.mark.asyncio
+async def test_async_discover_timeout_waiting_for_running_scan(
+    no_ip_route: None,
+) -> None:
+    """Verify a caller with a timeout does not wait for a running scan forever."""
+    release = asyncio.Event()
+
+    async def _async_get_hostnames(
+        sys_network_data: Any, deadline: float | None = None
+    ) -> dict[str, str]:
+        await release.wait()
+        return {"1.2.3.4": "router"}
+
+    discover_hosts = discovery.DiscoverHosts()
+    discover_hosts.async_get_hostnames = _async_get_hostnames  # type: ignore
+    with (
+        patch(
+            "aiodiscover.network.SystemNetworkData.async_get_neighbours",
+            return_value={"1.2.3.4": "aa:bb:cc:dd:ee:ff"},
+        ),
+        patch(
+            "aiodiscover.network.get_network",
+            return_value=IPv4Network("1.2.3.0/24", False),
+        ),
+    ):
+        scan = asyncio.create_task(discover_hosts.async_discover())
+        await asyncio.sleep(0)
+        hosts = await discover_hosts.async_discover(timeout=0.01)
+        assert hosts == []
+        assert hosts.partial is True
+
+        release.set()
+        complete = await scan
+        assert complete.partial is False
+
+        release.clear()
+        scan = asyncio.create_task(discover_hosts.async_discover())
+        await asyncio.sleep(0)
+        hosts = await discover_hosts.async_discover(timeout=0.01)
+        assert hosts == complete
+        assert hosts.stale is True
+        assert hosts.partial is True
+        release.set()
+        await scan
+
+
+@pytest.mark.asyncio
+async def test_async_discover_no_timeout_joins_deadline_scan(
+    no_ip_route: None,
+) -> None:
+    """Verify a caller without a timeout never gets a partial result."""
+    loop = asyncio.get_running_loop()
+    deadlines: list[float | None] = []
+
+    async def _async_get_hostnames(
+        sys_network_data: Any, deadline: float | None = None
+    ) -> dict[str, str]:
+        deadlines.append(deadline)
+        if deadline is not None:
+            await asyncio.sleep(deadline - loop.time())
+            return {}
+        return {"1.2.3.4": "router"}
+
+    discover_hosts = discovery.DiscoverHosts()
+    discover_hosts.async_get_hostnames = _async_get_hostnames  # type: ignore
+    with (
+        patch(
+            "aiodiscover.network.SystemNetworkData.async_get_neighbours",
+            return_value={"1.2.3.4": "aa:bb:cc:dd:ee:ff"},
+        ),
+        patch(
+            "aiodiscover.network.get_network",
+            return_value=IPv4Network("1.2.3.0/24", False),
+        ),
+    ):
+        limited, complete = await asyncio.gather(
+            discover_hosts.async_discover(timeout=0.05),
+            discover_hosts.async_discover(),
+        )
+
+    assert limited.partial is True
+    assert complete.partial is False
+    assert complete == [
+        {"hostname": "router", "ip": "1.2.3.4", "macaddress": "aa:bb:cc:dd:ee:ff"}
+    ]
+    assert discover_hosts.last_result == complete
+    assert len(deadlines) == 2
+    assert deadlines[1] is None
+
+
+@pytest.mark.asyncio
+async def test_async_get_neighbours_deadline() -> None:
+    """Verify waiting for the arp cache is cut short at the deadline."""
+    loop = asyncio.get_running_loop()
+    net_data = SystemNetworkData(None, None)
+    with (
+        patch.object(net_data, "_async_get_neighbours", return_value={}),
+        patch.object(net_data.arp_prober, "_async_send", return_value=1) as mock_send,
+    ):
+        start = loop.time()
+        assert await net_data.async_get_neighbours(["1.2.3.4"], start + 0.05) == {}
+        assert loop.time() - start < 1
+        assert mock_send.call_count == 1
+
+        # Nothing is sent once the deadline has passed
+        assert await net_data.async_get_neighbours(["1.2.3.4"], start) == {}
+        assert mock_send.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_async_discover_hosts_with_vendor(
+    tmp_path: Path, no_ip_route: None
+) -> None:
+    """Verify the vendor is added from the OUI database."""
+    oui_path = str(tmp_path / "oui.bin")
+    build_oui_database({(24, 0xAABBCC << 24): "Vendor"}, oui_path)
+    discover_hosts = discovery.DiscoverHosts(oui_database=OUIDatabase(oui_path))
+
+    async def _async_get_hostnames(
+        sys_network_data: Any, deadline: float | None = None
+    ) -> dict[str, str]:
+        return {"1.2.3.4": "router", "1.2.3.5": "any"}
+
+    discover_hosts.async_get_hostnames = _async_get_hostnames  # type: ignore
+    with (
+        patch(
+            "aiodiscover.network.SystemNetworkData.async_get_neighbours",
+            return_value={
+                "1.2.3.4": "aa:bb:cc:dd:ee:ff",
+                "1.2.3.5": "ff:bb:cc:0d:ee:ff",
+            },
+        ),
+        patch(
+            "aiodiscover.network.get_network",
+            return_value=IPv4Network("1.2.3.0/24", False),
+        ),
+    ):
+        hosts = await discover_hosts.async_discover()
+
+    assert hosts == [
+        {
+            "hostname": "router",
+            "ip": "1.2.3.4",
+            "macaddress": "aa:bb:cc:dd:ee:ff",
+            "vendor": "Vendor",
+        },
+        {"hostname": "any", "ip": "1.2.3.5", "macaddress": "ff:bb:cc:0d:ee:ff"},
+    ]
+    stats = discover_hosts.last_stats
+    assert stats is not None
+    assert list(stats.phases) == ["setup", "ptr", "neighbours"]
+    assert stats.counters == {
+        "addresses": 256,
+        "hostnames": 2,
+        "neighbours": 2,
+        "hosts": 2,
+    }
+    assert stats.max_loop_lag >= 0
+
+
+@pytest.mark.asyncio
+async def test_async_resolve() -> None:
+    """Verify async_resolve only looks up the given ips."""
+    discover_hosts = discovery.DiscoverHosts()
+    net_data = SystemNetworkData(None, None)
+    net_data.router_ip = IPv4Address("192.168.0.1")
+    net_data.network = IPv4Network("192.168.0.0/24")
+    net_data.nameservers = [IPv4Address("192.168.0.1")]
+    queries: list[list[IPv4Address]] = []
+
+    async def _mock_query_for_ptrs(
+        nameserver: str,
+        ips_to_lookup: list[IPv4Address],
+        deadline: float | None = None,
+        **kwargs: Any,
+    ) -> Any:
+        queries.append(ips_to_lookup)
+        return [
+            MockReply(name="known.local") if str(ip) != "192.168.0.7" else None
+            for ip in ips_to_lookup
+        ]
+
+    with (
+        patch.object(
+            discover_hosts, "_async_get_sys_network_data", return_value=net_data
+        ),
+        patch.object(
+            net_data,
+            "async_get_neighbours",
+            return_value={
+                "192.168.0.5": "aa:bb:cc:dd:ee:05",
+                "192.168.0.7": "aa:bb:cc:dd:ee:07",
+            },
+        ) as mock_get_neighbours,
+        patch("aiodiscover.discovery.async_query_for_ptrs", _mock_query_for_ptrs),
+    ):
+        hosts = await discover_hosts.async_resolve(
+            [
+                "192.168.0.5",
+                "192.168.0.6",
+                "192.168.0.7",
+                "192.168.0.5",
+                "invalid",
+                "8.8.8.8",
+            ],
+            timeout=5,
+        )
+        # Off-link ips can never be in the neighbour table
+        assert await discover_hosts.async_resolve(["8.8.8.8"]) == []
+
+    assert mock_get_neighbours.call_count == 1
+    assert queries == [
+        [
+            IPv4Address("192.168.0.5"),
+            IPv4Address("192.168.0.6"),
+            IPv4Address("192.168.0.7"),
+        ]
+    ]
+    assert mock_get_neighbours.call_args[0][0] == [
+        "192.168.0.5",
+        "192.168.0.6",
+        "192.168.0.7",
+    ]
+    assert hosts == [
+        {
+            discovery.HOSTNAME: "known",
+            discovery.MAC_ADDRESS: "aa:bb:cc:dd:ee:05",
+            discovery.IP_ADDRESS: "192.168.0.5",
+        }
+    ]
+    assert discover_hosts.last_result is None
+    assert await discover_hosts.async_resolve([]) == []
+
+
+@pytest.mark.asyncio
+async def test_loop_budget() -> None:
+    """Verify the budget expires and yielding starts a new slice."""
+    budget = LoopBudget(0)
+    assert budget.expired()
+    budget = LoopBudget(60)
+    assert not budget.expired()
+    with patch.object(discovery.asyncio, "sleep") as mock_sleep:
+        await budget.async_yield()
+    mock_sleep.assert_called_once_with(0)
+    assert not budget.expired()
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor() -> None:
+    """Verify blocking the loop shows up as lag."""
+    monitor = LoopLagMonitor(0.001)
+    monitor.start()
+    await asyncio.sleep(0)
+    time.sleep(0.05)
+    await asyncio.sleep(0.01)
+    assert monitor.stop() >= 0.04
+    # Stopping twice keeps the result
+    assert monitor.stop() >= 0.04
@@ -1,8 +1,29 @@
 #!/usr/bin/env python
+import subprocess
+import sys
 
 import aiodiscover
 
+# Optional features that import heavy modules are left out of the package
+OPTIONAL_MODULES = ("aiodiscover.ptr_scan", "aiodiscover.replay", "aiodiscover.server")
+
 
 def test_get_module_version() -> None:
     """Verify get_module_version does not throw."""
     assert aiodiscover.get_module_version() == aiodiscover.__version__
+
+
+def test_import_skips_optional_modules() -> None:
+    """Verify importing the package does not load the optional features."""
+    loaded = subprocess.run(  # noqa: S603
+        [
+            sys.executable,
+            "-c",
+            "import sys, aiodiscover; "
+            f"print([name for name in {OPTIONAL_MODULES!r} if name in sys.modules])",
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout.strip()
+    assert loaded == "[]"
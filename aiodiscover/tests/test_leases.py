@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+import os
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+from aiodiscover.leases import DNSMASQ, ISC_DHCPD, KEA_CSV, Lease, LeaseFile
+
+ISC_LEASE = """lease {ip} {{
+  starts 4 2023/11/16 10:00:00;
+  ends {ends};
+  binding state {state};
+  next binding state free;
+  hardware ethernet {mac};
+  client-hostname "{hostname}";
+}}
+"""
+
+
+def _isc_lease(
+    ip: str,
+    mac: str,
+    hostname: str,
+    ends: str = "never",
+    state: str = "active",
+) -> str:
+    return ISC_LEASE.format(ip=ip, mac=mac, hostname=hostname, ends=ends, state=state)
+
+
+def test_dnsmasq_leases(tmp_path: Path) -> None:
+    """Verify dnsmasq leases are parsed and rewrites are picked up."""
+    path = tmp_path / "dnsmasq.leases"
+    path.write_text(
+        "1700000100 aa:bb:cc:dd:ee:01 192.168.1.20 laptop 01:aa:bb:cc:dd:ee:01\n"
+        "0 AA:BB:CC:DD:EE:2 192.168.1.21 * *\n"
+        "duid 00:01:00:01:2c:1f:00:00:aa:bb:cc:dd:ee:ff\n"
+        "1700000100 aa:bb:cc:dd:ee:03 192.168.1.22 printer.lan *\n"
+    )
+    lease_file = LeaseFile(str(path), DNSMASQ)
+    assert lease_file.read() == {
+        "192.168.1.20": Lease(
+            "192.168.1.20", "aa:bb:cc:dd:ee:01", "laptop", 1700000100
+        ),
+        "192.168.1.21": Lease("192.168.1.21", "aa:bb:cc:dd:ee:02", None, None),
+        "192.168.1.22": Lease(
+            "192.168.1.22", "aa:bb:cc:dd:ee:03", "printer", 1700000100
+        ),
+    }
+    assert list(lease_file.active_leases(1700000200)) == ["192.168.1.21"]
+
+    # dnsmasq rewrites the whole file in place
+    with open(path, "r+") as file:
+        file.write("0 aa:bb:cc:dd:ee:04 192.168.1.30 tv *\n")
+        file.truncate()
+    os.utime(path, ns=(0, 0))
+    assert lease_file.read() == {
+        "192.168.1.30": Lease("192.168.1.30", "aa:bb:cc:dd:ee:04", "tv", None),
+    }
+
+
+def test_isc_leases_incremental(tmp_path: Path) -> None:
+    """Verify ISC leases are read from the last complete block."""
+    path = tmp_path / "dhcpd.leases"
+    first = (
+        "# The format of this file is documented in dhcpd.leases(5).\n"
+        + _isc_lease("192.168.1.20", "aa:bb:cc:dd:ee:01", "laptop")
+    )
+    path.write_text(first)
+    lease_file = LeaseFile(str(path), ISC_DHCPD)
+    assert lease_file.read() == {
+        "192.168.1.20": Lease("192.168.1.20", "aa:bb:cc:dd:ee:01", "laptop", None),
+    }
+    offset = len(first.rstrip("\n"))
+    assert lease_file._offset == offset
+
+    # A partially written block is not consumed until it is complete
+    second = _isc_lease(
+        "192.168.1.21", "aa:bb:cc:dd:ee:02", "phone", ends="epoch 1700000100"
+    )
+    with open(path, "a") as file:
+        file.write(second[:40])
+    assert "192.168.1.21" not in lease_file.read()
+    assert lease_file._offset == offset
+    with open(path, "a") as file:
+        file.write(second[40:])
+        file.write(
+            _isc_lease(
+                "192.168.1.20",
+                "aa:bb:cc:dd:ee:01",
+                "laptop",
+                ends="4 2023/11/16 22:00:00",
+                state="free",
+            )
+        )
+    assert lease_file.read() == {
+        "192.168.1.20": Lease("192.168.1.20", "aa:bb:cc:dd:ee:01", "laptop", 0),
+        "192.168.1.21": Lease("192.168.1.21", "aa:bb:cc:dd:ee:02", "phone", 1700000100),
+    }
+    assert list(lease_file.active_leases(1700000000)) == ["192.168.1.21"]
+
+    # dhcpd compacts the file by replacing it
+    replacement = tmp_path / "dhcpd.leases~"
+    replacement.write_text(
+        _isc_lease(
+            "192.168.1.22", "aa:bb:cc:dd:ee:03", "tv", ends="4 2023/11/16 22:00:00"
+        )
+    )
+    os.replace(replacement, path)
+    assert lease_file.read() == {
+        "192.168.1.22": Lease("192.168.1.22", "aa:bb:cc:dd:ee:03", "tv", 1700172000),
+    }
+
+    path.unlink()
+    assert lease_file.read() == {}
+
+
+def test_isc_leases_threads(tmp_path: Path) -> None:
+    """Verify leases read from several threads while the file grows are consistent."""
+    path = tmp_path / "dhcpd.leases"
+    path.write_text("")
+    lease_file = LeaseFile(str(path), ISC_DHCPD)
+    done = threading.Event()
+    errors: list[Exception] = []
+
+    def _read() -> None:
+        try:
+            while not done.is_set():
+                lease_file.active_leases(0)
+        except Exception as ex:
+            errors.append(ex)
+
+    threads = [threading.Thread(target=_read) for _ in range(4)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for idx in range(2000):
+            with open(path, "a") as file:
+                file.write(
+                    _isc_lease(
+                        f"10.0.{idx // 256}.{idx % 256}",
+                        f"aa:bb:cc:dd:{idx // 256:02x}:{idx % 256:02x}",
+                        "h",
+                    )
+                )
+    finally:
+        done.set()
+        for thread in threads:
+            thread.join()
+        sys.setswitchinterval(interval)
+
+    assert errors == []
+    assert len(lease_file.read()) == 2000
+    assert lease_file._offset == len(path.read_text().rstrip("\n"))
+
+
+def test_kea_leases(tmp_path: Path) -> None:
+    """Verify Kea CSV leases are parsed and later rows replace earlier ones."""
+    path = tmp_path / "kea-leases4.csv"
+    path.write_text(
+        "address,hwaddr,client_id,valid_lifetime,expire,subnet_id,fqdn_fwd,"
+        "fqdn_rev,hostname,state,user_context,pool_id\n"
+        "192.168.1.20,aa:bb:cc:dd:ee:01,,3600,1700000100,1,0,0,laptop.lan,0,,0\n"
+        "192.168.1.21,aa:bb:cc:dd:ee:02,,3600,1700000100,1,0,0,,0,,0\n"
+        "192.168.1.22,aa:bb:cc:dd:ee:03,,3600,not-a-number,1,0,0,bad,0,,0\n"
+    )
+    lease_file = LeaseFile(str(path), KEA_CSV)
+    assert lease_file.read() == {
+        "192.168.1.20": Lease(
+            "192.168.1.20", "aa:bb:cc:dd:ee:01", "laptop", 1700000100
+        ),
+        "192.168.1.21": Lease("192.168.1.21", "aa:bb:cc:dd:ee:02", None, 1700000100),
+    }
+    with open(path, "a") as file:
+        file.write("192.168.1.20,aa:bb:cc:dd:ee:01,,0,1700000100,1,0,0,,0,,0\n")
+    assert lease_file.active_leases(1700000000) == {
+        "192.168.1.21": Lease("192.168.1.21", "aa:bb:cc:dd:ee:02", None, 1700000100),
+    }
+
+
+def test_unsupported_lease_format() -> None:
+    """Verify an unknown format is rejected."""
+    with pytest.raises(ValueError):
+        LeaseFile("/dev/null", "unknown")
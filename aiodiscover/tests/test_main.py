@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+import json
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from aiodiscover import __main__ as cli
+from aiodiscover.discovery import HOSTNAME, IP_ADDRESS, MAC_ADDRESS
+from aiodiscover.snapshot import DiscoveryResult
+from aiodiscover.stats import ADDRESSES, HOSTS, PHASE_PTR, PHASE_SETUP, ScanStats
+
+HOST = {HOSTNAME: "one", MAC_ADDRESS: "aa:bb:cc:dd:ee:01", IP_ADDRESS: "10.0.0.1"}
+
+
+def _stats(ptr_time: float) -> ScanStats:
+    stats = ScanStats()
+    stats.phases = {PHASE_SETUP: 0.5, PHASE_PTR: ptr_time}
+    stats.counters = {ADDRESSES: 256, HOSTS: 1}
+    stats.finished = stats.started + ptr_time + 0.5
+    return stats
+
+
+def test_format_summary() -> None:
+    """Verify phases are averaged and throughput is reported."""
+    summary = cli.format_summary([_stats(1.0), _stats(3.0)]).splitlines()
+    assert summary[0] == "2 scan(s)"
+    assert summary[2].split() == ["setup", "0.500s", "0.500s"]
+    assert summary[3].split() == ["ptr", "2.000s", "3.000s"]
+    assert summary[4].split() == ["total", "2.500s", "3.500s"]
+    assert summary[-3] == "hosts: 1-1"
+    assert summary[-2] == "ptr sweep: 128 addresses/s"
+    assert summary[-1] == "max loop lag: 0.0ms"
+
+
+def test_scan_command(capsys: pytest.CaptureFixture[str]) -> None:
+    """Verify hosts are streamed as JSON lines with a summary on stderr."""
+    created: list[dict[str, Any]] = []
+
+    class MockDiscoverHosts:
+        def __init__(self, **kwargs: Any) -> None:
+            created.append(kwargs)
+            self.last_stats: ScanStats | None = None
+
+        async def async_discover(self, timeout: float | None = None) -> Any:
+            self.last_stats = _stats(1.0)
+            return DiscoveryResult([HOST], partial=timeout is not None)
+
+    with patch.object(cli, "DiscoverHosts", MockDiscoverHosts):
+        assert (
+            cli.main(
+                [
+                    "scan",
+                    "--network",
+                    "10.0.0.0/24",
+                    "--nameserver",
+                    "10.0.0.53",
+                    "--nameserver",
+                    "10.0.0.54",
+                    "--repeat",
+                    "2",
+                    "--timeout",
+                    "5",
+                    "--concurrency",
+                    "16",
+                    "--dns-timeout",
+                    "0.5",
+                ]
+            )
+            == 0
+        )
+
+    assert created[0]["network"] == "10.0.0.0/24"
+    assert created[0]["nameservers"] == ["10.0.0.53", "10.0.0.54"]
+    assert created[0]["query_bucket_size"] == 16
+    assert created[0]["dns_timeout"] == 0.5
+    out, err = capsys.readouterr()
+    assert [json.loads(line) for line in out.splitlines()] == [
+        {"scan": 0, **HOST},
+        {"scan": 1, **HOST},
+    ]
+    assert "Scan 1 timed out, results are partial" in err
+    assert "2 scan(s)" in err
+
+
+def test_scan_command_unknown_interface() -> None:
+    """Verify an interface without an IPv4 address is rejected."""
+    with pytest.raises(SystemExit, match="No IPv4 address on interface"):
+        cli.main(["scan", "--interface", "does-not-exist0"])
@@ -1,9 +1,26 @@
 #!/usr/bin/env python
 import asyncio
 import sys
+from collections.abc import Awaitable, Callable
 from ipaddress import IPv4Address, IPv6Address
+from typing import Any
 
-from aiodiscover.network import parse_resolv_conf
+import pytest
+
+from aiodiscover.network import (
+    CLOCK_TICKS,
+    NEIGHBOUR_STALE_AGE,
+    NUD_FAILED,
+    NUD_REACHABLE,
+    NUD_STALE,
+    ArpProbeProgress,
+    ArpProber,
+    Neighbour,
+    SystemNetworkData,
+    _normalize_mac,
+    parse_arp_output,
+    parse_resolv_conf,
+)
 
 if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
@@ -26,3 +43,186 @@ def test_parse_resolv_conf() -> None:
         IPv4Address("32.2.1.1"),
         IPv6Address("2001:4860:4860::8888"),
     ]
+
+
+@pytest.mark.asyncio
+async def test_arp_prober_paces_and_retries() -> None:
+    """Verify probes are paced and missing ips are retried with backoff."""
+    loop = asyncio.get_running_loop()
+    progress: list[ArpProbeProgress] = []
+    reads = 0
+    ips = [f"127.0.0.{i}" for i in range(1, 21)]
+
+    async def _get_neighbours() -> dict[str, str]:
+        nonlocal reads
+        reads += 1
+        # Half the ips answer the first round, the rest the second
+        resolved = ips[:10] if reads == 1 else ips
+        return dict.fromkeys(resolved, "aa:bb:cc:dd:ee:ff")
+
+    prober = ArpProber(
+        rate=200,
+        burst=5,
+        retries=3,
+        retry_delay=0.01,
+        progress_callback=progress.append,
+    )
+    start = loop.time()
+    neighbours = await prober.async_probe(ips, _get_neighbours, start + 5)
+    # 30 probes at 200/s after the first burst of 5 takes at least 0.125s
+    assert loop.time() - start >= 0.12
+    assert set(neighbours) == set(ips)
+    assert progress == [
+        ArpProbeProgress(total=20, sent=20, resolved=10, attempt=0),
+        ArpProbeProgress(total=20, sent=30, resolved=20, attempt=1),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_arp_prober_deadline() -> None:
+    """Verify probing stops at the deadline."""
+    loop = asyncio.get_running_loop()
+    progress: list[ArpProbeProgress] = []
+
+    async def _get_neighbours() -> dict[str, str]:
+        return {}
+
+    prober = ArpProber(rate=10, burst=1, progress_callback=progress.append)
+    start = loop.time()
+    neighbours = await prober.async_probe(
+        [f"127.0.0.{i}" for i in range(1, 101)], _get_neighbours, start + 0.2
+    )
+    assert loop.time() - start < 1
+    assert neighbours == {}
+    assert len(progress) == 1
+    assert progress[0].sent < 100
+
+
+def test_parse_arp_output() -> None:
+    """Verify arp -a -n output is parsed and incomplete entries are dropped."""
+    assert parse_arp_output(
+        b"? (192.168.1.2) at aa:bb:cc:dd:ee:2 on en0 ifscope [ethernet]\n"
+        b"? (192.168.1.3) at (incomplete) on en0 ifscope [ethernet]\n"
+        b"? (127.0.0.1) at aa:bb:cc:dd:ee:ff on lo0\n"
+        b"garbage\n"
+    ) == {"192.168.1.2": "aa:bb:cc:dd:ee:02"}
+    # A line with fewer fields does not swallow the next entry
+    assert parse_arp_output(
+        b"gateway (10.0.0.9)\n? (10.0.0.2) at aa:bb:cc:dd:ee:0f on en0\n"
+    ) == {"10.0.0.2": "aa:bb:cc:dd:ee:0f"}
+
+
+def test_normalize_mac() -> None:
+    """Verify MACs are validated and canonicalized in one pass."""
+    assert _normalize_mac("aa:bb:cc:dd:ee:ff") == "aa:bb:cc:dd:ee:ff"
+    assert _normalize_mac("AA-B-C:dd:E:f") == "aa:0b:0c:dd:0e:0f"
+    assert _normalize_mac("FF:FF:FF:FF:FF:FF") is None
+    assert _normalize_mac("0:0:0:0:0:0") is None
+    assert _normalize_mac("(incomplete)") is None
+    assert _normalize_mac("aa:bb:cc:dd:ee:ff:00") is None
+    assert _normalize_mac("aaa:bb:cc:dd:ee:ff") is None
+    # Memoized, including invalid ones
+    assert _normalize_mac("(incomplete)") is None
+    assert _normalize_mac("AA-B-C:dd:E:f") == "aa:0b:0c:dd:0e:0f"
+
+
+class _MockIPRoute:
+    def __init__(self, neighbours: list[dict[str, Any]]) -> None:
+        self._neighbours = neighbours
+
+    def get_neighbours(self) -> list[dict[str, Any]]:
+        return self._neighbours
+
+
+@pytest.mark.asyncio
+async def test_async_get_neighbour_states() -> None:
+    """Verify neighbour states are read from netlink."""
+    net_data = SystemNetworkData(
+        _MockIPRoute(  # type: ignore[arg-type]
+            [
+                {
+                    "state": NUD_REACHABLE,
+                    "attrs": [
+                        ("NDA_DST", "192.168.1.2"),
+                        ("NDA_LLADDR", "aa:bb:cc:dd:ee:1"),
+                    ],
+                },
+                {"state": NUD_FAILED, "attrs": [("NDA_DST", "192.168.1.3")]},
+                {
+                    "state": NUD_STALE,
+                    "attrs": [
+                        ("NDA_DST", "192.168.1.4"),
+                        ("NDA_LLADDR", "00:00:00:00:00:00"),
+                    ],
+                },
+                {"state": NUD_STALE, "attrs": [("NDA_DST", "127.0.0.1")]},
+            ]
+        )
+    )
+    assert await net_data.async_get_neighbour_states() == {
+        "192.168.1.2": Neighbour("aa:bb:cc:dd:ee:01", NUD_REACHABLE),
+        "192.168.1.3": Neighbour(None, NUD_FAILED),
+    }
+    assert await net_data.async_get_neighbours(()) == {
+        "192.168.1.2": "aa:bb:cc:dd:ee:01"
+    }
+
+
+@pytest.mark.asyncio
+async def test_async_get_neighbours_uses_states() -> None:
+    """Verify fresh entries are not probed, old ones are and FAILED are dropped."""
+    neighbours = [
+        {
+            "state": NUD_REACHABLE,
+            "attrs": [
+                ("NDA_DST", "192.168.1.2"),
+                ("NDA_LLADDR", "aa:bb:cc:dd:ee:02"),
+                ("NDA_CACHEINFO", {"ndm_confirmed": 5 * CLOCK_TICKS}),
+            ],
+        },
+        {
+            "state": NUD_STALE,
+            "attrs": [
+                ("NDA_DST", "192.168.1.3"),
+                ("NDA_LLADDR", "aa:bb:cc:dd:ee:03"),
+                ("NDA_CACHEINFO", {"ndm_confirmed": 10 * CLOCK_TICKS}),
+            ],
+        },
+        {
+            "state": NUD_STALE,
+            "attrs": [
+                ("NDA_DST", "192.168.1.4"),
+                ("NDA_LLADDR", "aa:bb:cc:dd:ee:04"),
+                (
+                    "NDA_CACHEINFO",
+                    {"ndm_confirmed": (NEIGHBOUR_STALE_AGE + 1) * CLOCK_TICKS},
+                ),
+            ],
+        },
+        {"state": NUD_FAILED, "attrs": [("NDA_DST", "192.168.1.5")]},
+    ]
+    net_data = SystemNetworkData(_MockIPRoute(neighbours))  # type: ignore[arg-type]
+    states = await net_data.async_get_neighbour_states()
+    assert states["192.168.1.2"].age == 5
+    probed: list[list[str]] = []
+
+    async def _async_probe(
+        ips: list[str],
+        get_neighbours: Callable[[], Awaitable[dict[str, str]]],
+        deadline: float,
+    ) -> dict[str, str]:
+        probed.append(ips)
+        # The stale entry is confirmed, the failed one stays failed
+        neighbours[2]["state"] = NUD_REACHABLE
+        return await get_neighbours()
+
+    net_data.arp_prober.async_probe = _async_probe  # type: ignore[method-assign]
+    result = await net_data.async_get_neighbours(
+        ["192.168.1.2", "192.168.1.3", "192.168.1.4", "192.168.1.5", "192.168.1.6"]
+    )
+    assert probed == [["192.168.1.4", "192.168.1.5", "192.168.1.6"]]
+    assert result == {
+        "192.168.1.2": "aa:bb:cc:dd:ee:02",
+        "192.168.1.3": "aa:bb:cc:dd:ee:03",
+        "192.168.1.4": "aa:bb:cc:dd:ee:04",
+    }
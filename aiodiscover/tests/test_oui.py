@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+from pathlib import Path
+
+import pytest
+
+from aiodiscover.oui import (
+    InvalidOUIDatabase,
+    OUIDatabase,
+    build_oui_database,
+    mac_to_int,
+    main,
+    read_ieee_csv,
+)
+
+CSV_HEADER = "Registry,Assignment,Organization Name,Organization Address\n"
+
+
+def _write_registry(tmp_path: Path) -> list[str]:
+    oui = tmp_path / "oui.csv"
+    oui.write_text(
+        CSV_HEADER + "MA-L,001122,Large Vendor,Somewhere\n"
+        "MA-L,70B3D5,IEEE Registration Authority,Somewhere\n"
+        'MA-L,AABBCC,"Vendor, Inc.",Somewhere\n'
+        "MA-L,ZZZZZZ,Bad Assignment,Somewhere\n"
+        "MA-L,,No Assignment,Somewhere\n"
+    )
+    mam = tmp_path / "mam.csv"
+    mam.write_text(CSV_HEADER + "MA-M,70B3D51,Medium Vendor,Somewhere\n")
+    oui36 = tmp_path / "oui36.csv"
+    oui36.write_text(CSV_HEADER + "MA-S,70B3D5123,Small Vendor,Somewhere\n")
+    return [str(oui), str(mam), str(oui36)]
+
+
+def test_build_and_lookup(tmp_path: Path) -> None:
+    """Verify the most specific assignment wins."""
+    output = str(tmp_path / "oui.bin")
+    assert build_oui_database(read_ieee_csv(_write_registry(tmp_path)), output) == 5
+    database = OUIDatabase(output)
+    assert len(database) == 5
+    assert database.lookup("00:11:22:33:44:55") == "Large Vendor"
+    assert database.lookup("AA-BB-CC-00-00-01") == "Vendor, Inc."
+    assert database.lookup("70:b3:d5:12:34:56") == "Small Vendor"
+    assert database.lookup("70:b3:d5:19:99:99") == "Medium Vendor"
+    assert database.lookup("70:b3:d5:f0:00:00") == "IEEE Registration Authority"
+    assert database.lookup("02:00:00:00:00:00") is None
+    assert database.lookup("not a mac") is None
+    database.close()
+
+
+def test_invalid_database(tmp_path: Path) -> None:
+    """Verify files that are not an index are rejected."""
+    empty = tmp_path / "empty.bin"
+    empty.write_bytes(b"")
+    with pytest.raises(InvalidOUIDatabase):
+        OUIDatabase(str(empty))
+    short = tmp_path / "short.bin"
+    short.write_bytes(b"AIO")
+    with pytest.raises(InvalidOUIDatabase):
+        OUIDatabase(str(short))
+    wrong = tmp_path / "wrong.bin"
+    wrong.write_bytes(b"\x00" * 64)
+    with pytest.raises(InvalidOUIDatabase):
+        OUIDatabase(str(wrong))
+
+
+def test_mac_to_int() -> None:
+    """Verify MAC notations are converted."""
+    assert mac_to_int("00:11:22:33:44:55") == 0x001122334455
+    assert mac_to_int("0011.2233.4455") == 0x001122334455
+    assert mac_to_int("00:11:22") is None
+    assert mac_to_int("zz:11:22:33:44:55") is None
+
+
+def test_main(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    """Verify the build tool."""
+    output = str(tmp_path / "oui.bin")
+    assert main([*_write_registry(tmp_path), "-o", output]) == 0
+    assert "Wrote 5 assignments" in capsys.readouterr().out
+    assert OUIDatabase(output).lookup("00:11:22:33:44:55") == "Large Vendor"
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+from ipaddress import IPv4Address, IPv4Network
+
+import pytest
+
+from aiodiscover import discovery
+from aiodiscover.plan import PlannedIPv4Address, ScanPlan, host_range
+
+
+def test_planned_address() -> None:
+    """Verify planned addresses behave like IPv4Address."""
+    planned = PlannedIPv4Address(int(IPv4Address("192.168.1.5")))
+    address = IPv4Address("192.168.1.5")
+    assert planned == address
+    assert hash(planned) == hash(address)
+    assert str(planned) == "192.168.1.5"
+    assert planned.reverse_pointer == "5.1.168.192.in-addr.arpa"
+    assert {address: 1}[planned] == 1
+
+
+@pytest.mark.parametrize(
+    "network", ["192.168.1.0/24", "10.0.0.0/22", "10.0.0.0/31", "10.0.0.1/32"]
+)
+def test_scan_plan_hosts(network: str) -> None:
+    """Verify the plan covers the same hosts as network.hosts()."""
+    ip_network = IPv4Network(network)
+    plan = ScanPlan(ip_network)
+    assert plan.hosts == list(ip_network.hosts())
+    assert sorted(plan.order()) == list(ip_network.hosts())
+    start, stop = host_range(ip_network)
+    assert stop - start == len(plan.hosts)
+
+
+def test_scan_plan_order() -> None:
+    """Verify known addresses only move to the front for one call."""
+    plan = ScanPlan(IPv4Network("192.168.1.0/24"))
+    first = plan.order(IPv4Address("192.168.1.1"), ["192.168.1.250"])
+    assert [str(ip) for ip in first[:3]] == [
+        "192.168.1.1",
+        "192.168.1.250",
+        "192.168.1.100",
+    ]
+    second = plan.order()
+    assert str(second[0]) == "192.168.1.100"
+    # The same address objects are handed out by every scan
+    assert first[1] is plan.hosts[249]
+
+
+@pytest.mark.asyncio
+async def test_scan_plan_reused_until_network_changes() -> None:
+    """Verify DiscoverHosts keeps one plan per network."""
+    discover_hosts = discovery.DiscoverHosts()
+    network = IPv4Network("192.168.1.0/24")
+    plan = discover_hosts._get_scan_plan(network)
+    assert discover_hosts._get_scan_plan(IPv4Network("192.168.1.0/24")) is plan
+    other = discover_hosts._get_scan_plan(IPv4Network("192.168.2.0/24"))
+    assert other is not plan
+    assert other.network == IPv4Network("192.168.2.0/24")
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+import asyncio
+import sys
+from collections.abc import Awaitable, Callable
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from aiodiscover import discovery
+from aiodiscover.network import (
+    NUD_FAILED,
+    NUD_NONE,
+    NUD_REACHABLE,
+    NUD_STALE,
+    ArpProber,
+    Neighbour,
+    SystemNetworkData,
+)
+from aiodiscover.presence import PresenceChange, PresenceTracker
+from aiodiscover.snapshot import DiscoveryResult
+
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+MAC_1 = "aa:bb:cc:dd:ee:01"
+MAC_2 = "aa:bb:cc:dd:ee:02"
+
+
+def _net_data(states: dict[str, Neighbour], probed: list[list[str]]) -> Any:
+    """Return network data that reads states and records the probed ips."""
+    net_data = SystemNetworkData(None, None)
+
+    async def _async_get_neighbour_states(
+        deadline: float | None = None,
+    ) -> dict[str, Neighbour]:
+        return dict(states)
+
+    async def _async_probe(
+        ips: list[str],
+        get_neighbours: Callable[[], Awaitable[dict[str, str]]],
+        deadline: float,
+    ) -> dict[str, str]:
+        probed.append(ips)
+        return await get_neighbours()
+
+    net_data.async_get_neighbour_states = _async_get_neighbour_states  # type: ignore[method-assign]
+    net_data.arp_prober = ArpProber()
+    net_data.arp_prober.async_probe = _async_probe  # type: ignore[method-assign]
+    return net_data
+
+
+@pytest.mark.asyncio
+async def test_presence_tracker_home_and_away() -> None:
+    """Verify only unconfirmed hosts are probed and transitions are reported."""
+    states = {
+        "192.168.1.2": Neighbour(MAC_1, NUD_REACHABLE),
+        "192.168.1.3": Neighbour(None, NUD_FAILED),
+    }
+    probed: list[list[str]] = []
+    changes: list[PresenceChange] = []
+    tracker = PresenceTracker(_net_data(states, probed), changes.append, 0)
+    tracker.update_hosts({MAC_1: "192.168.1.2", MAC_2: "192.168.1.3"})
+    assert tracker.home == {MAC_1: True, MAC_2: True}
+
+    await tracker.async_poll()
+    assert probed == [["192.168.1.3"]]
+    assert changes == [PresenceChange(MAC_2, "192.168.1.3", False)]
+
+    # Reported only once
+    await tracker.async_poll()
+    assert len(changes) == 1
+
+    states["192.168.1.3"] = Neighbour(MAC_2, NUD_REACHABLE)
+    probed.clear()
+    await tracker.async_poll()
+    assert probed == []
+    assert changes[1:] == [PresenceChange(MAC_2, "192.168.1.3", True)]
+    assert tracker.home == {MAC_1: True, MAC_2: True}
+
+
+@pytest.mark.asyncio
+async def test_presence_tracker_consider_away() -> None:
+    """Verify stale or reassigned entries count as away after the threshold."""
+    states = {
+        "192.168.1.2": Neighbour(MAC_1, NUD_STALE),
+        # The ip now belongs to another device
+        "192.168.1.3": Neighbour("aa:bb:cc:dd:ee:99", NUD_REACHABLE),
+    }
+    probed: list[list[str]] = []
+    changes: list[PresenceChange] = []
+    tracker = PresenceTracker(_net_data(states, probed), changes.append, 60)
+    tracker.update_hosts({MAC_1: "192.168.1.2", MAC_2: "192.168.1.3"})
+
+    await tracker.async_poll()
+    assert probed == [["192.168.1.2", "192.168.1.3"]]
+    assert changes == []
+
+    loop = asyncio.get_running_loop()
+    with patch.object(loop, "time", return_value=loop.time() + 61):
+        await tracker.async_poll()
+    assert changes == [
+        PresenceChange(MAC_1, "192.168.1.2", False),
+        PresenceChange(MAC_2, "192.168.1.3", False),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_presence_tracker_update_hosts_replaces() -> None:
+    """Verify devices missing from a new scan are no longer tracked."""
+    states = {
+        "192.168.1.2": Neighbour(MAC_1, NUD_REACHABLE),
+        "192.168.1.4": Neighbour(MAC_2, NUD_REACHABLE),
+    }
+    probed: list[list[str]] = []
+    changes: list[PresenceChange] = []
+    tracker = PresenceTracker(_net_data(states, probed), changes.append, 0)
+    tracker.update_hosts({MAC_1: "192.168.1.2", MAC_2: "192.168.1.3"})
+    tracker.update_hosts({MAC_2: "192.168.1.4"})
+    assert tracker.home == {MAC_2: True}
+
+    await tracker.async_poll()
+    assert probed == []
+    assert changes == []
+
+
+@pytest.mark.asyncio
+async def test_presence_tracker_arp_command_entries() -> None:
+    """Verify entries without a kernel state confirm the device."""
+    states = {"192.168.1.2": Neighbour(MAC_1, NUD_NONE)}
+    probed: list[list[str]] = []
+    changes: list[PresenceChange] = []
+    tracker = PresenceTracker(_net_data(states, probed), changes.append, 0)
+    tracker.update_hosts({MAC_1: "192.168.1.2"})
+    await tracker.async_poll()
+    assert probed == []
+    assert changes == []
+
+
+@pytest.mark.asyncio
+async def test_async_track_presence() -> None:
+    """Verify DiscoverHosts polls the hosts of the last result."""
+    discover_hosts = discovery.DiscoverHosts()
+    discover_hosts._last_result = DiscoveryResult(
+        [
+            {
+                discovery.HOSTNAME: "one",
+                discovery.MAC_ADDRESS: MAC_1,
+                discovery.IP_ADDRESS: "192.168.1.2",
+            }
+        ]
+    )
+    states: dict[str, Neighbour] = {}
+    probed: list[list[str]] = []
+    net_data = _net_data(states, probed)
+    changes: list[PresenceChange] = []
+    changed = asyncio.Event()
+
+    def _callback(change: PresenceChange) -> None:
+        changes.append(change)
+        changed.set()
+
+    with patch.object(
+        discover_hosts, "_async_get_sys_network_data", return_value=net_data
+    ):
+        stop = discover_hosts.async_track_presence(
+            _callback, interval=0.01, consider_away=0
+        )
+        await asyncio.wait_for(changed.wait(), 1)
+        stop()
+        await asyncio.gather(*discover_hosts._presence_tasks, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    assert changes == [PresenceChange(MAC_1, "192.168.1.2", False)]
+    assert probed[0] == ["192.168.1.2"]
+    assert not discover_hosts._presence_tasks
+
+
+@pytest.mark.asyncio
+async def test_async_track_presence_retries_first_scan() -> None:
+    """Verify tracking starts once a failed first scan succeeds."""
+    discover_hosts = discovery.DiscoverHosts()
+    states: dict[str, Neighbour] = {}
+    probed: list[list[str]] = []
+    net_data = _net_data(states, probed)
+    changed = asyncio.Event()
+    scans = 0
+
+    async def _async_discover(timeout: float | None = None) -> DiscoveryResult:
+        nonlocal scans
+        scans += 1
+        if scans == 1:
+            raise OSError("Network is unreachable")
+        discover_hosts._last_result = DiscoveryResult(
+            [
+                {
+                    discovery.HOSTNAME: "one",
+                    discovery.MAC_ADDRESS: MAC_1,
+                    discovery.IP_ADDRESS: "192.168.1.2",
+                }
+            ]
+        )
+        return discover_hosts._last_result
+
+    with (
+        patch.object(discover_hosts, "async_discover", _async_discover),
+        patch.object(
+            discover_hosts, "_async_get_sys_network_data", return_value=net_data
+        ),
+    ):
+        stop = discover_hosts.async_track_presence(
+            lambda change: changed.set(), interval=0.01, consider_away=0
+        )
+        await asyncio.wait_for(changed.wait(), 1)
+        stop()
+        await asyncio.gather(*discover_hosts._presence_tasks, return_exceptions=True)
+
+    assert scans == 2
+    assert probed[0] == ["192.168.1.2"]
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+import asyncio
+import socket
+import struct
+import sys
+
+import pytest
+
+from aiodiscover.providers import (
+    DNS_HEADER,
+    HostnameProvider,
+    MDNSHostnameProvider,
+    NetBIOSHostnameProvider,
+    build_mdns_ptr_query,
+    build_netbios_nbstat_query,
+    parse_mdns_ptr_response,
+    parse_netbios_nbstat_response,
+)
+
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+
+def _mdns_response(query: bytes, hostname: bytes) -> bytes:
+    """Answer a PTR query, pointing the answer name at the question."""
+    question = query[DNS_HEADER.size :]
+    rdata = bytes([len(hostname)]) + hostname + b"\x05local\x00"
+    return (
+        DNS_HEADER.pack(0, 0x8400, 1, 1, 0, 0)
+        + question
+        + b"\xc0\x0c"
+        + struct.pack("!HHIH", 12, 1, 120, len(rdata))
+        + rdata
+    )
+
+
+def _nbstat_response(names: list[tuple[bytes, int, int]]) -> bytes:
+    query = build_netbios_nbstat_query("192.168.1.5")
+    entries = b"".join(
+        name.ljust(15) + bytes([suffix]) + struct.pack("!H", flags)
+        for name, suffix, flags in names
+    )
+    rdata = bytes([len(names)]) + entries
+    return (
+        DNS_HEADER.pack(0x4E42, 0x8400, 0, 1, 0, 0)
+        + query[DNS_HEADER.size : -4]
+        + struct.pack("!HHIH", 0x21, 1, 0, len(rdata))
+        + rdata
+    )
+
+
+def test_parse_mdns_ptr_response() -> None:
+    """Verify a compressed mDNS PTR answer is parsed to a short hostname."""
+    query = build_mdns_ptr_query("192.168.1.5")
+    assert b"\x015\x011\x03168\x03192\x07in-addr\x04arpa\x00" in query
+    assert parse_mdns_ptr_response(_mdns_response(query, b"printer")) == "printer"
+    # Queries and truncated packets are ignored
+    assert parse_mdns_ptr_response(query) is None
+    assert parse_mdns_ptr_response(_mdns_response(query, b"printer")[:-4]) is None
+
+
+def test_parse_mdns_ptr_response_pointer_loop() -> None:
+    """Verify a compression pointer loop does not hang."""
+    packet = DNS_HEADER.pack(0, 0x8400, 1, 0, 0, 0) + b"\xc0\x0c"
+    assert parse_mdns_ptr_response(packet) is None
+
+
+def test_parse_netbios_nbstat_response() -> None:
+    """Verify the unique workstation name is picked from the name table."""
+    response = _nbstat_response(
+        [
+            (b"WORKGROUP", 0x00, 0x8400),
+            (b"DESKTOP-1", 0x20, 0x0400),
+            (b"DESKTOP-1", 0x00, 0x0400),
+        ]
+    )
+    assert parse_netbios_nbstat_response(response) == "desktop-1"
+    assert parse_netbios_nbstat_response(response[:-10]) is None
+    assert (
+        parse_netbios_nbstat_response(_nbstat_response([(b"WORKGROUP", 0, 0x8000)]))
+        is None
+    )
+
+
+class _Responder(asyncio.DatagramProtocol):
+    def __init__(self, reply: bytes) -> None:
+        self.reply = reply
+        self.transport: asyncio.DatagramTransport | None = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport  # type: ignore[assignment]
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]) -> None:
+        assert self.transport is not None
+        self.transport.sendto(self.reply, addr)
+
+
+def test_hostname_provider_is_abstract() -> None:
+    """Verify providers must implement the lookup."""
+    with pytest.raises(TypeError):
+        HostnameProvider()  # type: ignore[abstract]
+
+    class _Provider(HostnameProvider):
+        pass
+
+    with pytest.raises(TypeError):
+        _Provider()  # type: ignore[abstract]
+
+
+@pytest.mark.asyncio
+async def test_udp_providers_query_and_timeout() -> None:
+    """Verify providers collect answers and give up on silent hosts."""
+    loop = asyncio.get_running_loop()
+    reply = _nbstat_response([(b"NAS", 0x00, 0x0400)])
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: _Responder(reply),
+        local_addr=("127.0.0.1", 0),
+        family=socket.AF_INET,
+    )
+    port = transport.get_extra_info("sockname")[1]
+    try:
+        provider = NetBIOSHostnameProvider(timeout=1, port=port)
+        assert await provider.async_get_hostnames(["127.0.0.1"]) == {"127.0.0.1": "nas"}
+        # The responder does not speak mDNS so the provider times out
+        mdns_provider = MDNSHostnameProvider(timeout=0.1, port=port)
+        assert await mdns_provider.async_get_hostnames(["127.0.0.1"]) == {}
+        assert await mdns_provider.async_get_hostnames([]) == {}
+    finally:
+        transport.close()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from ipaddress import IPv4Network
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from aiodiscover.ptr_scan import async_scan_ptr, shard_networks
+
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+
+@dataclass
+class MockReply:
+    name: str
+
+
+def test_shard_networks() -> None:
+    """Verify networks are split into host ranges."""
+    assert shard_networks(["10.0.0.0/24"], 100) == [
+        (0x0A000001, 0x0A000065),
+        (0x0A000065, 0x0A0000C9),
+        (0x0A0000C9, 0x0A0000FF),
+    ]
+    assert shard_networks([IPv4Network("10.0.1.0/31"), "10.0.2.1/32"]) == [
+        (0x0A000100, 0x0A000102),
+        (0x0A000201, 0x0A000202),
+    ]
+    with pytest.raises(ValueError):
+        shard_networks(["2001:db8::/120"])
+
+
+@pytest.mark.asyncio
+async def test_async_scan_ptr() -> None:
+    """Verify hosts from every shard are streamed back."""
+    queried_nameservers: set[str] = set()
+
+    def mock_init(self: Any, nameservers: list[str], **kwargs: Any) -> None:
+        self.nameserver = nameservers[0]
+
+    def mock_query(self: Any, name: str, *args: Any, **kwargs: Any) -> Any:
+        queried_nameservers.add(self.nameserver)
+        future = asyncio.get_running_loop().create_future()
+        last_octet = name.split(".")[0]
+        # The first nameserver is down, the second answers for .10 hosts
+        if self.nameserver == "10.0.0.2" and last_octet == "10":
+            future.set_result(MockReply(name=f"host{name.split('.')[1]}.corp"))
+        else:
+            future.set_exception(Exception("NXDOMAIN"))
+        return future
+
+    with (
+        patch("aiodiscover.discovery.DNSResolver.__init__", mock_init),
+        patch("aiodiscover.discovery.DNSResolver.query", mock_query),
+        patch("aiodiscover.discovery.DNSResolver.cancel"),
+        ThreadPoolExecutor(max_workers=2) as executor,
+    ):
+        hosts = [
+            host
+            async for host in async_scan_ptr(
+                ["192.168.1.0/24", "192.168.2.0/24"],
+                ["10.0.0.1", "10.0.0.2"],
+                shard_size=64,
+                executor=executor,
+            )
+        ]
+
+    assert sorted(hosts, key=lambda host: host["ip"]) == [
+        {"hostname": "host1", "ip": "192.168.1.10"},
+        {"hostname": "host2", "ip": "192.168.2.10"},
+    ]
+    assert queried_nameservers == {"10.0.0.1", "10.0.0.2"}
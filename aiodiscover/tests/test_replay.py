@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from aiodns.error import ARES_ENOTFOUND, DNSError
+
+from aiodiscover import __main__ as cli
+from aiodiscover import discovery
+from aiodiscover.network import NUD_REACHABLE, Neighbour, SystemNetworkData
+from aiodiscover.replay import (
+    PTRReply,
+    ScanRecorder,
+    ScanRecording,
+    ScanReplay,
+    VirtualClockEventLoop,
+    run_with_virtual_clock,
+)
+from aiodiscover.snapshot import DiscoveryResult
+from aiodiscover.stats import ScanStats
+
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+MAC_1 = "aa:bb:cc:dd:ee:01"
+MAC_2 = "aa:bb:cc:dd:ee:02"
+MAC_3 = "aa:bb:cc:dd:ee:03"
+
+
+def _recording() -> ScanRecording:
+    """Return a recording of a nameserver with a slow and a lost answer."""
+    return ScanRecording(
+        "192.168.0.0/29",
+        "192.168.0.1",
+        "192.168.0.5",
+        ["192.168.0.1"],
+        {
+            "192.168.0.1": {
+                "1.0.168.192.in-addr.arpa": [{"latency": 0.02, "name": "router.lan"}],
+                "2.0.168.192.in-addr.arpa": [{"latency": 0.5, "name": "slow.lan"}],
+                "3.0.168.192.in-addr.arpa": [
+                    {"timeout": True},
+                    {"latency": 0.1, "name": "late.lan"},
+                ],
+            }
+        },
+        [
+            {
+                "latency": 0.01,
+                "states": {
+                    "192.168.0.1": [MAC_1, NUD_REACHABLE, 1.0],
+                    "192.168.0.2": [MAC_2, NUD_REACHABLE, 1.0],
+                    "192.168.0.3": [MAC_3, NUD_REACHABLE, 1.0],
+                },
+            }
+        ],
+    )
+
+
+def test_virtual_clock_event_loop() -> None:
+    """Verify timers fire without waiting while the clock moves."""
+
+    async def _sleep() -> float:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await asyncio.gather(asyncio.sleep(60), asyncio.sleep(30))
+        return loop.time() - start
+
+    start = time.monotonic()
+    assert run_with_virtual_clock(_sleep()) == pytest.approx(60)
+    assert time.monotonic() - start < 5
+    loop = VirtualClockEventLoop()
+    try:
+        assert isinstance(loop.time(), float)
+    finally:
+        loop.close()
+
+
+def test_replay_scan() -> None:
+    """Verify a replayed scan reports the time the recorded network took."""
+
+    async def _scan() -> tuple[DiscoveryResult, ScanStats | None]:
+        discover_hosts = ScanReplay(_recording()).create_discover_hosts()
+        return await discover_hosts.async_discover(), discover_hosts.last_stats
+
+    start = time.monotonic()
+    hosts, stats = run_with_virtual_clock(_scan())
+    assert time.monotonic() - start < 5
+    assert sorted(hosts, key=lambda host: host[discovery.IP_ADDRESS]) == [
+        {"hostname": "router", "ip": "192.168.0.1", "macaddress": MAC_1},
+        {"hostname": "slow", "ip": "192.168.0.2", "macaddress": MAC_2},
+        {"hostname": "late", "ip": "192.168.0.3", "macaddress": MAC_3},
+    ]
+    assert stats is not None
+    # The lost query waits out the timeout before it is retried
+    assert (
+        discovery.DNS_RESPONSE_TIMEOUT
+        <= stats.phases["ptr"]
+        < discovery.DNS_RESPONSE_TIMEOUT + 0.5
+    )
+
+
+def test_replay_scan_command(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    """Verify the scan command replays a recording."""
+    path = str(tmp_path / "recording.json")
+    _recording().save(path)
+    assert cli.main(["scan", "--replay", path]) == 0
+    out, err = capsys.readouterr()
+    assert [json.loads(line)["hostname"] for line in out.splitlines()] == [
+        "router",
+        "slow",
+        "late",
+    ]
+    assert "1 scan(s)" in err
+
+
+def test_load_unknown_version(tmp_path: Path) -> None:
+    """Verify recordings of another version are rejected."""
+    path = tmp_path / "recording.json"
+    path.write_text(json.dumps({"version": 0}))
+    with pytest.raises(ValueError, match="Unknown recording version"):
+        ScanRecording.load(str(path))
+
+
+@pytest.mark.asyncio
+async def test_record_scan(tmp_path: Path, no_ip_route: None) -> None:
+    """Verify answers, errors, timeouts and neighbour tables are recorded."""
+    loop = asyncio.get_running_loop()
+
+    class _MockResolver:
+        def __init__(self, nameservers: list[str], timeout: float) -> None:
+            self.futures: list[asyncio.Future[Any]] = []
+
+        def query(self, host: str, qtype: str) -> asyncio.Future[Any]:
+            future = loop.create_future()
+            self.futures.append(future)
+            if host == "1.0.168.192.in-addr.arpa":
+                loop.call_soon(future.set_result, PTRReply("router.lan"))
+            elif host != "3.0.168.192.in-addr.arpa":
+                loop.call_soon(
+                    future.set_exception, DNSError(ARES_ENOTFOUND, "not found")
+                )
+            return future
+
+        def cancel(self) -> None:
+            for future in self.futures:
+                future.cancel()
+
+    recorder = ScanRecorder(_MockResolver)
+    with (
+        patch.object(
+            SystemNetworkData,
+            "async_get_neighbour_states",
+            return_value={"192.168.0.1": Neighbour(MAC_1, NUD_REACHABLE, 1.0)},
+        ),
+        patch.object(discovery, "DNS_RESPONSE_TIMEOUT", 0.05),
+    ):
+        discover_hosts = await recorder.async_create_discover_hosts(
+            local_ip="192.168.0.5",
+            network="192.168.0.0/29",
+            nameservers=["192.168.0.1"],
+        )
+        hosts = await discover_hosts.async_discover()
+    assert hosts == [{"hostname": "router", "ip": "192.168.0.1", "macaddress": MAC_1}]
+
+    path = str(tmp_path / "recording.json")
+    recorder.recording.save(path)
+    recording = ScanRecording.load(path)
+    assert recording.network == "192.168.0.0/29"
+    assert recording.router_ip == str(discover_hosts._sys_network_data.router_ip)  # type: ignore[union-attr]
+    assert recording.nameservers == ["192.168.0.1"]
+    answers = recording.ptr["192.168.0.1"]
+    assert answers["1.0.168.192.in-addr.arpa"][0]["name"] == "router.lan"
+    assert answers["2.0.168.192.in-addr.arpa"][0]["error"] == ARES_ENOTFOUND
+    # Timed out and retried
+    assert answers["3.0.168.192.in-addr.arpa"] == [{"timeout": True}] * 2
+    assert recording.neighbours[0]["states"] == {
+        "192.168.0.1": [MAC_1, NUD_REACHABLE, 1.0]
+    }
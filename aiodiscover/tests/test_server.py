@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+import asyncio
+import socket
+import sys
+from collections.abc import Callable
+from pathlib import Path
+
+import pytest
+
+from aiodiscover.discovery import HOSTNAME, IP_ADDRESS, MAC_ADDRESS
+from aiodiscover.server import (
+    FRAME_HEADER,
+    DiscoveryClient,
+    DiscoveryServer,
+    DiscoveryServerError,
+    diff_hosts,
+)
+from aiodiscover.snapshot import DiscoveryResult
+
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+HOST_1 = {HOSTNAME: "one", MAC_ADDRESS: "aa:bb:cc:dd:ee:01", IP_ADDRESS: "10.0.0.1"}
+HOST_2 = {HOSTNAME: "two", MAC_ADDRESS: "aa:bb:cc:dd:ee:02", IP_ADDRESS: "10.0.0.2"}
+
+
+class MockDiscoverHosts:
+    """Publish canned results like DiscoverHosts."""
+
+    def __init__(self) -> None:
+        self.last_result: DiscoveryResult | None = None
+        self.results = [DiscoveryResult([HOST_1], 1.0), DiscoveryResult([HOST_2], 2.0)]
+        self.listeners: list[Callable[[DiscoveryResult], None]] = []
+        self.discover_calls = 0
+
+    def async_add_listener(
+        self, callback: Callable[[DiscoveryResult], None]
+    ) -> Callable[[], None]:
+        self.listeners.append(callback)
+        return lambda: self.listeners.remove(callback)
+
+    async def async_discover(self, timeout: float | None = None) -> DiscoveryResult:
+        result = self.results[min(self.discover_calls, len(self.results) - 1)]
+        self.discover_calls += 1
+        self.last_result = result
+        for listener in self.listeners:
+            listener(result)
+        return result
+
+    async def async_resolve(
+        self, ips: list[str], timeout: float | None = None
+    ) -> list[dict[str, str]]:
+        return [host for host in (HOST_1, HOST_2) if host[IP_ADDRESS] in ips]
+
+
+def test_diff_hosts() -> None:
+    """Verify hosts are matched by MAC address."""
+    moved = {**HOST_1, IP_ADDRESS: "10.0.0.9"}
+    assert diff_hosts([HOST_1, HOST_2], [moved]) == {
+        "added": [],
+        "removed": [HOST_2],
+        "changed": [moved],
+    }
+    assert diff_hosts([], [HOST_1]) == {
+        "added": [HOST_1],
+        "removed": [],
+        "changed": [],
+    }
+
+
+@pytest.mark.asyncio
+async def test_server_and_client(tmp_path: Path) -> None:
+    """Verify discover, diff and resolve requests."""
+    path = str(tmp_path / "aiodiscover.sock")
+    discover_hosts = MockDiscoverHosts()
+    server = DiscoveryServer(discover_hosts, path, scan_interval=None)  # type: ignore[arg-type]
+    await server.async_start()
+    client = DiscoveryClient(path)
+    try:
+        with pytest.raises(DiscoveryServerError, match="No discovery result"):
+            await client.async_diff()
+
+        result = await client.async_discover()
+        assert result == {
+            "hosts": [HOST_1],
+            "timestamp": 1.0,
+            "stale": False,
+            "partial": False,
+        }
+        assert await client.async_diff() == {
+            "timestamp": 1.0,
+            "full": True,
+            "added": [HOST_1],
+            "removed": [],
+            "changed": [],
+        }
+
+        await client.async_discover()
+        assert await client.async_diff(1.0) == {
+            "timestamp": 2.0,
+            "full": False,
+            "added": [HOST_2],
+            "removed": [HOST_1],
+            "changed": [],
+        }
+
+        assert await client.async_resolve(["10.0.0.2", "10.0.0.3"]) == [HOST_2]
+
+        with pytest.raises(DiscoveryServerError, match="list of ips"):
+            await client._async_request("resolve", ips="10.0.0.2")
+        with pytest.raises(DiscoveryServerError, match="Unknown op"):
+            await client._async_request("nope")
+        # The connection is still usable after errors
+        assert (await client.async_discover())["timestamp"] == 2.0
+    finally:
+        await client.async_close()
+        await server.async_stop()
+    assert not Path(path).exists()
+    assert not discover_hosts.listeners
+
+
+@pytest.mark.asyncio
+async def test_server_closes_on_bad_frame(tmp_path: Path) -> None:
+    """Verify oversized frames close the connection."""
+    path = str(tmp_path / "aiodiscover.sock")
+    server = DiscoveryServer(MockDiscoverHosts(), path, scan_interval=None)  # type: ignore[arg-type]
+    await server.async_start()
+    try:
+        reader, writer = await asyncio.open_unix_connection(path)
+        writer.write(FRAME_HEADER.pack(0xFFFFFFFF))
+        await writer.drain()
+        assert await asyncio.wait_for(reader.read(), 1) == b""
+        writer.close()
+    finally:
+        await server.async_stop()
+
+
+@pytest.mark.asyncio
+async def test_server_scans_periodically(tmp_path: Path) -> None:
+    """Verify the server keeps the shared result fresh."""
+    path = str(tmp_path / "aiodiscover.sock")
+    # A socket left behind by a previous server is replaced
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(path)
+    discover_hosts = MockDiscoverHosts()
+    server = DiscoveryServer(discover_hosts, path, scan_interval=0.01)  # type: ignore[arg-type]
+    await server.async_start()
+    try:
+        while discover_hosts.discover_calls < 2:
+            await asyncio.sleep(0.01)
+    finally:
+        await server.async_stop()
+    assert server._history[-1].timestamp == 2.0
+
+
+@pytest.mark.asyncio
+async def test_server_answers_discover_from_background_scan(tmp_path: Path) -> None:
+    """Verify discover requests do not each start a scan."""
+    path = str(tmp_path / "aiodiscover.sock")
+    discover_hosts = MockDiscoverHosts()
+    server = DiscoveryServer(discover_hosts, path, scan_interval=60)  # type: ignore[arg-type]
+    await server.async_start()
+    client = DiscoveryClient(path)
+    try:
+        for _ in range(3):
+            assert (await client.async_discover())["hosts"] == [HOST_1]
+    finally:
+        await client.async_close()
+        await server.async_stop()
+    assert discover_hosts.discover_calls == 1
+
+
+@pytest.mark.asyncio
+async def test_server_stops_with_client_connected(tmp_path: Path) -> None:
+    """Verify stopping does not wait for idle clients to disconnect."""
+    path = str(tmp_path / "aiodiscover.sock")
+    server = DiscoveryServer(MockDiscoverHosts(), path, scan_interval=None)  # type: ignore[arg-type]
+    await server.async_start()
+    client = DiscoveryClient(path)
+    try:
+        await client.async_discover()
+        assert server._clients
+        await asyncio.wait_for(server.async_stop(), 1)
+        assert not server._clients
+        with pytest.raises((asyncio.IncompleteReadError, ConnectionError)):
+            await client.async_discover()
+    finally:
+        await client.async_close()
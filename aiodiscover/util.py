@@ -1,8 +1,36 @@
 from __future__ import annotations
 
+import asyncio
 import sys
+import time
 
 if sys.version_info[:2] < (3, 11):
     from async_timeout import timeout as asyncio_timeout
 else:
     from asyncio import timeout as asyncio_timeout  # noqa: F401
+
+# Longest stretch of synchronous work between yields to the event loop
+LOOP_BLOCK_BUDGET = 0.005
+
+
+class LoopBudget:
+    """
+    Track how long synchronous work has held the event loop.
+
+    Loops over large results check expired() as they go and await
+    async_yield() when it returns True so other tasks get to run.
+    """
+
+    def __init__(self, budget: float = LOOP_BLOCK_BUDGET) -> None:
+        """Start the first slice."""
+        self.budget = budget
+        self._slice_start = time.perf_counter()
+
+    def expired(self) -> bool:
+        """Return if the current slice has used up the budget."""
+        return time.perf_counter() - self._slice_start >= self.budget
+
+    async def async_yield(self) -> None:
+        """Yield to the event loop and start a new slice."""
+        await asyncio.sleep(0)
+        self._slice_start = time.perf_counter()
@@ -0,0 +1,127 @@
+"""Compare neighbour table parsing with the previous implementation."""
+
+import re
+import timeit
+
+from cached_ipaddress import cached_ip_addresses
+
+from aiodiscover import network
+from aiodiscover.network import parse_arp_output, parse_ip_route_neighbours
+
+ENTRIES = 4096
+NUMBER = 20
+
+# The implementation before neighbour ips and MACs were memoized
+LEGACY_VALID_MAC_ADDRESS = re.compile("^([0-9A-Fa-f]{1,2}[:-]){5}([0-9A-Fa-f]{1,2})$")
+
+
+def legacy_normalize_mac(mac):
+    if not LEGACY_VALID_MAC_ADDRESS.match(mac):
+        return None
+    mac = ":".join([i.zfill(2) for i in mac.split(":")])
+    if mac in network.IGNORE_MACS:
+        return None
+    return mac
+
+
+def legacy_valid_neighbour_ip(ip):
+    if not (ip_addr := cached_ip_addresses(ip)):
+        return False
+    return not (
+        ip_addr.is_loopback
+        or ip_addr.is_link_local
+        or ip_addr.is_multicast
+        or ip_addr.is_unspecified
+    )
+
+
+def legacy_parse_arp_output(out_data):
+    neighbours = {}
+    for line in out_data.decode().splitlines():
+        data = line.strip().split()
+        if len(data) < 4:
+            continue
+        ip = data[1].strip("()")
+        if legacy_valid_neighbour_ip(ip) and (
+            normalized_mac := legacy_normalize_mac(data[3])
+        ):
+            neighbours[ip] = normalized_mac
+    return neighbours
+
+
+def legacy_parse_ip_route_neighbours(messages):
+    neighbours = {}
+    for neighbour in messages:
+        ip = mac = age = None
+        for key, value in neighbour["attrs"]:
+            if key == "NDA_DST":
+                ip = value
+            elif key == "NDA_LLADDR":
+                mac = value
+            elif key == "NDA_CACHEINFO":
+                age = value.get("ndm_confirmed") / network.CLOCK_TICKS
+        if not ip or not legacy_valid_neighbour_ip(ip):
+            continue
+        normalized_mac = legacy_normalize_mac(mac) if mac else None
+        if mac and not normalized_mac:
+            continue
+        neighbours[ip] = network.Neighbour(normalized_mac, neighbour["state"], age)
+    return neighbours
+
+
+def _ip(idx):
+    return f"10.{idx >> 16 & 255}.{idx >> 8 & 255}.{idx & 255 or 1}"
+
+
+def _mac(idx):
+    # macOS arp drops leading zeros
+    return ":".join(f"{octet:x}" for octet in idx.to_bytes(6, "big"))
+
+
+arp_output = "".join(
+    f"? ({_ip(idx)}) at {_mac(idx)} on en0 ifscope [ethernet]\n"
+    for idx in range(1, ENTRIES + 1)
+).encode()
+messages = [
+    {
+        "state": network.NUD_REACHABLE,
+        "attrs": [
+            ("NDA_DST", _ip(idx)),
+            ("NDA_LLADDR", _mac(idx)),
+            ("NDA_CACHEINFO", {"ndm_confirmed": 100}),
+        ],
+    }
+    for idx in range(1, ENTRIES + 1)
+]
+
+assert parse_arp_output(arp_output) == legacy_parse_arp_output(arp_output)
+assert parse_ip_route_neighbours(messages) == legacy_parse_ip_route_neighbours(messages)
+
+
+def _time(func, *args):
+    return min(timeit.repeat(lambda: func(*args), number=NUMBER, repeat=5)) / NUMBER
+
+
+def _report(name, legacy, current):
+    print(
+        f"{name}: {legacy * 1000:.2f}ms -> {current * 1000:.2f}ms "
+        f"({legacy / current:.1f}x) for {ENTRIES} entries"
+    )
+
+
+_report(
+    "arp -a -n",
+    _time(legacy_parse_arp_output, arp_output),
+    _time(parse_arp_output, arp_output),
+)
+macs = [_mac(idx) for idx in range(1, ENTRIES + 1)]
+_report(
+    "normalize mac",
+    _time(lambda: [legacy_normalize_mac(mac) for mac in macs]),
+    _time(lambda: [network._normalize_mac(mac) for mac in macs]),
+)
+_report(
+    "ip route",
+    _time(legacy_parse_ip_route_neighbours, messages),
+    _time(parse_ip_route_neighbours, messages),
+)